@@ -0,0 +1,104 @@
+# Measures CLAIM latency between two clients while one of them streams cursor and stroke
+# traffic over a lossy, jittery link, with and without the datagram channel
+#
+# Both clients connect through the impairment proxy in impair.py. A "lost" TCP write stalls
+# the whole stream for a retransmission timeout, which is the head-of-line blocking a real
+# loss causes; a lost datagram is simply dropped
+#
+# Usage: python benchmarks/claim_latency_loss.py [--loss 0.05] [--jitter 0.01] [--claims 40]
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from claim_verification import scribble
+from claims import pack_points
+from impair import Profile, Proxy, RTO
+from network import NetworkManager
+
+# Stroke samples per second for the claimed square, paced to stay inside the host's rate limit
+SAMPLE_RATE = 500
+
+def run_match(port, use_udp, profile, claims):
+    host = NetworkManager("host", port, is_host=True, use_udp=use_udp)
+    proxy = Proxy(port + 1, ("127.0.0.1", port), profile, seed=1).start()
+    # Kept off the shared-memory transport, which would carry their game traffic past the proxy
+    drawer = NetworkManager("drawer", port + 1, server_ip="127.0.0.1", use_udp=use_udp, local=False)
+    watcher = NetworkManager("watcher", port + 1, server_ip="127.0.0.1", use_udp=use_udp, local=False)
+    time.sleep(1.0)
+
+    # The host answers a claim with CLAIM, or RESET if it rejected it; both end the wait
+    claim_seen = {}
+    rejected = set()
+    def on_watcher_message(message):
+        for part in message.split("GAME:"):
+            if part.startswith("CLAIM:") or part.startswith("RESET:"):
+                coord = part.split(":")[1]
+                if part.startswith("RESET:"):
+                    rejected.add(coord)
+                claim_seen.setdefault(coord, time.perf_counter())
+    watcher.set_message_handler(on_watcher_message)
+    host.set_message_handler(lambda message: None)
+
+    streaming = True
+    def stream():
+        i = 0
+        while streaming:
+            drawer.send_game_command(f"CURSOR:red:{i % 640},{i % 480}")
+            drawer.send_game_command(f"DRAW:7,7:{i % 80},{i % 80}:red")
+            i += 1
+            time.sleep(1 / 240)
+    threading.Thread(target=stream, daemon=True).start()
+
+    latencies = []
+    for n in range(claims):
+        coord = f"{n // 8},{n % 8}"
+        # The host verifies claims against the stroke it received, so draw one first
+        drawer.send_game_command(f"LOCK:{coord}:red")
+        for x, y in scribble():
+            drawer.send_game_command(f"DRAW:{coord}:{x},{y}:red")
+            time.sleep(1 / SAMPLE_RATE)
+        sent = time.perf_counter()
+        drawer.send_game_command(f"CLAIM:{coord}:red:{pack_points(scribble())}")
+        deadline = sent + 5
+        while coord not in claim_seen and time.perf_counter() < deadline:
+            time.sleep(0.001)
+        if coord in claim_seen:
+            latencies.append((claim_seen[coord] - sent) * 1000)
+        time.sleep(0.05)
+
+    streaming = False
+    for manager in (drawer, watcher, host):
+        manager.quit()
+    proxy.close()
+    if rejected:
+        print(f"  {len(rejected)} claims rejected by the host")
+    return latencies
+
+def summarize(label, latencies, claims):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else float("nan")
+    median = statistics.median(latencies) if latencies else float("nan")
+    print(f"{label:<14} delivered {len(latencies)}/{claims}  median {median:7.1f} ms  "
+          f"p99 {p99:7.1f} ms  max {max(latencies, default=float('nan')):7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loss", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--claims", type=int, default=40)
+    parser.add_argument("--port", type=int, default=27100)
+    args = parser.parse_args()
+
+    profile = Profile(loss=args.loss, jitter=args.jitter)
+    print(f"loss {args.loss:.0%}, jitter up to {args.jitter * 1000:.0f} ms, RTO {RTO * 1000:.0f} ms")
+    summarize("TCP only", run_match(args.port, False, profile, args.claims), args.claims)
+    summarize("TCP + UDP", run_match(args.port + 10, True, profile, args.claims), args.claims)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# Traces every claim in a short match through a real host and prints the merged timeline
+# of each one: when the drawer sent LOCK, DRAW and CLAIM, when the host handled them, and
+# when each watcher received and applied them, all on the host's clock
+#
+# A drawer claims --squares squares through impair.py's proxy while --watchers players
+# watch, everyone tracing at rate 1. Each node writes its span file as the game would, then
+# the files are merged with tracing.merge. The last part times the cost of the trace hooks
+# on the host's command path, sampled and not
+#
+# Usage: python benchmarks/claim_trace.py [--profile wifi] [--squares 3] [--watchers 2]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from claim_verification import scribble
+from claims import pack_points
+from impair import PROFILES, Proxy
+from network import NetworkManager
+from tracing import format_timeline, merge, split_trace, traced
+
+SIM_RATE = 60
+POINTS_PER_BATCH = 8
+# Pause after LOCK and before CLAIM, as a real mouse press and release would leave
+SETTLE = 0.05
+
+# A watcher's handler: record receipt of every traced command, as GameBoard does
+def watch(manager):
+    def on_message(message):
+        for part in message.split("GAME:")[1:]:
+            part, trace = split_trace("GAME:" + part)
+            if trace:
+                manager.tracer.span(trace, "recv_" + part.split(":")[1].lower())
+    return on_message
+
+def draw_square(manager, coord, color):
+    tracer = manager.tracer
+    trace = tracer.start()
+    tracer.span(trace, "mouse_down", f"square {coord} {color}")
+    manager.send_game_command(traced(f"LOCK:{coord}:{color}", trace))
+    time.sleep(SETTLE)
+    points = scribble()
+    for i in range(0, len(points), POINTS_PER_BATCH):
+        batch = points[i:i + POINTS_PER_BATCH]
+        tracer.span(trace, "draw_sent")
+        manager.send_game_command(traced(f"DRAW:{coord}:{';'.join(f'{x},{y}' for x, y in batch)}:{color}", trace))
+        time.sleep(1 / SIM_RATE)
+    time.sleep(SETTLE)
+    tracer.span(trace, "claim_sent")
+    manager.send_game_command(traced(f"CLAIM:{coord}:{color}:{pack_points(points)}", trace))
+
+# Microseconds per command through the host's parse, trace and relay path with no clients
+def hook_cost(port, rate):
+    host = NetworkManager("host", port, is_host=True, use_udp=False)
+    host.set_message_handler(lambda message: None)
+    host.tracer.rate = rate
+    trace = host.tracer.start()
+    command = traced("GAME:DRAW:0,0:40,40;41,41;42,42;43,43:red", trace)
+    n = 20000
+    seconds = timeit.timeit(lambda: host.handle_game_command(command, None), number=n)
+    host.quit()
+    return seconds / n * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default="wifi", choices=sorted(PROFILES))
+    parser.add_argument("--squares", type=int, default=3)
+    parser.add_argument("--watchers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=30400)
+    args = parser.parse_args()
+
+    host = NetworkManager("host", args.port, is_host=True)
+    host.set_message_handler(lambda message: None)
+    proxy = Proxy(args.port + 1, ("127.0.0.1", args.port), PROFILES[args.profile], seed=1).start()
+    # Kept off the shared-memory transport, which would carry their game traffic past the proxy
+    drawer = NetworkManager("drawer", args.port + 1, server_ip="127.0.0.1", local=False)
+    watchers = [NetworkManager(f"watcher{i}", args.port + 1, server_ip="127.0.0.1", local=False)
+                for i in range(args.watchers)]
+    for manager in [host, drawer] + watchers:
+        manager.tracer.rate = 1.0
+    drawer.set_message_handler(watch(drawer))
+    for watcher in watchers:
+        watcher.set_message_handler(watch(watcher))
+    # Long enough for a few migration pings to estimate each clock offset
+    time.sleep(2.0)
+
+    for n in range(args.squares):
+        draw_square(drawer, f"{n},0", "red")
+        time.sleep(0.2)
+    time.sleep(1.5)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for manager in [host, drawer] + watchers:
+            print(f"{manager.username:<10} clock offset to host {manager.tracer.host_offset * 1000:+6.2f} ms "
+                  f"from {manager.tracer.offset_samples} pings")
+            path = manager.tracer.dump(os.path.join(directory, manager.username))
+            if path:
+                paths.append(path)
+        traces = merge(paths)
+        for trace, spans in sorted(traces.items(), key=lambda item: item[1][0][0]):
+            print(format_timeline(trace, spans))
+
+    for manager in [drawer] + watchers:
+        manager.quit()
+    host.quit()
+    proxy.close()
+
+    print("host command path per DRAW:")
+    for label, rate in (("untraced", 0.0), ("traced", 1.0)):
+        print(f"  {label:<9} {hook_cost(args.port + 10, rate):6.2f} us")
+
+if __name__ == "__main__":
+    main()
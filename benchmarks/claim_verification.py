@@ -0,0 +1,67 @@
+# Benchmarks host-side claim verification with every square on the board being drawn at once
+#
+# Each square gets a zig-zag stroke that covers a little over half of it, then the host
+# records every sample and verifies every claim, as it would at full-board contention
+#
+# Usage: python benchmarks/claim_verification.py [--repeat 20]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from board import GRID_SIZE
+from claims import ClaimVerifier, SQUARE_SIZE, CLAIM_THRESHOLD
+
+# Sample positions of a zig-zag scribble covering rows 0..rows of a square
+def scribble(rows=44, step=3):
+    points = []
+    for i, y in enumerate(range(0, rows, 8)):
+        xs = range(0, SQUARE_SIZE, step) if i % 2 == 0 else range(SQUARE_SIZE - 1, -1, -step)
+        points.extend((x, y) for x in xs)
+    return points
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    points = scribble()
+    squares = [(r, c, f"player{(r + c) % 4}") for r in range(GRID_SIZE) for c in range(GRID_SIZE)]
+    verifier = ClaimVerifier()
+    record_time = verify_time = board_time = 0.0
+    accepted = 0
+
+    for _ in range(args.repeat):
+        for row, col, color in squares:
+            verifier.lock(row, col, color)
+
+        start = time.perf_counter()
+        for x, y in points:
+            for row, col, color in squares:
+                verifier.record(row, col, x, y, color)
+        record_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        coverage = verifier.coverage_all()
+        board_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        accepted = sum(verifier.verify(row, col, color) for row, col, color in squares)
+        verify_time += time.perf_counter() - start
+
+        for row, col, _ in squares:
+            verifier.reset(row, col)
+
+    samples = len(points) * len(squares) * args.repeat
+    claims = len(squares) * args.repeat
+    print(f"stroke: {len(points)} samples per square, {coverage.mean():.1f}% coverage "
+          f"(threshold {CLAIM_THRESHOLD}%), {accepted}/{len(squares)} claims accepted")
+    print(f"record sample        {record_time / samples * 1e6:8.2f} us")
+    print(f"verify one claim     {verify_time / claims * 1e6:8.2f} us")
+    print(f"coverage, all 64     {board_time / args.repeat * 1e6:8.2f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Measures stream compression on match traffic: compression ratio with and without the
+# preset dictionary, per-message versus per-batch flushing, and the CPU time it adds
+#
+# By default two bot players play part of a match through a real host on loopback, with
+# compression forced on, and a third client records everything it receives. The recording
+# can be saved with --record and measured again later with --replay
+#
+# Usage: python benchmarks/compression.py [--squares 12] [--record FILE] [--replay FILE]
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from claim_verification import scribble
+from claims import pack_points
+from compression import StreamCompressor, StreamDecompressor
+from network import NetworkManager
+
+SIM_RATE = 60
+POINTS_PER_BATCH = 8
+# Messages that arrive this close together are treated as one writer batch
+BATCH_WINDOW = 1 / SIM_RATE
+LINK_KBITS = 1000
+
+# One bot: claims `squares` squares the way a player does, at the game's step rate
+def play(manager, color, squares, offset):
+    points = scribble()
+    for n in range(squares):
+        index = offset + n * 2
+        coord = f"{index // 8},{index % 8}"
+        manager.send_game_command(f"LOCK:{coord}:{color}")
+        for i in range(0, len(points), POINTS_PER_BATCH):
+            batch = points[i:i + POINTS_PER_BATCH]
+            x, y = batch[-1]
+            manager.send_game_command(f"CURSOR:{color}:{180 + (index % 8) * 80 + x},{(index // 8) * 80 + y}")
+            manager.send_game_command(f"DRAW:{coord}:{';'.join(f'{x},{y}' for x, y in batch)}:{color}")
+            time.sleep(1 / SIM_RATE)
+        manager.send_game_command(f"CLAIM:{coord}:{color}:{pack_points(points)}")
+        time.sleep(0.1)
+
+def record_match(port, squares):
+    host = NetworkManager("host", port, is_host=True, compress=True)
+    host.set_message_handler(lambda message: None)
+    bots = [NetworkManager(name, port, server_ip="127.0.0.1", compress=True) for name in ("p1", "p2")]
+    watcher = NetworkManager("watcher", port, server_ip="127.0.0.1", compress=True)
+    recording = []
+    start = time.perf_counter()
+    watcher.set_message_handler(lambda message: recording.append((time.perf_counter() - start, message)))
+    time.sleep(1.0)
+
+    threads = [threading.Thread(target=play, args=(bot, color, squares, offset))
+               for bot, color, offset in zip(bots, ("blue", "green"), (0, 1))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    time.sleep(0.5)
+    stats = host.get_link_stats().get("watcher", {})
+    for manager in bots + [watcher, host]:
+        manager.quit()
+    return recording, stats
+
+# Group recorded messages into the batches the host's writer would have sent
+def batches_of(recording):
+    batches = []
+    last = None
+    for t, message in recording:
+        if last is None or t - last > BATCH_WINDOW:
+            batches.append([])
+        batches[-1].append(message.encode())
+        last = t
+    return batches
+
+def measure(batches, zdict):
+    compressor = StreamCompressor(zdict=zdict) if zdict else StreamCompressor(zdict=b"")
+    decompressor = StreamDecompressor(zdict=zdict) if zdict else StreamDecompressor(zdict=b"")
+    compress_time = decompress_time = 0.0
+    for batch in batches:
+        start = time.perf_counter()
+        out = compressor.compress(batch)
+        compress_time += time.perf_counter() - start
+        start = time.perf_counter()
+        decompressor.feed(out)
+        decompress_time += time.perf_counter() - start
+    n = len(batches)
+    return compressor.plain_bytes, compressor.compressed_bytes, compress_time / n * 1e6, decompress_time / n * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--squares", type=int, default=12)
+    parser.add_argument("--port", type=int, default=28000)
+    parser.add_argument("--record", help="save the recorded traffic to this file")
+    parser.add_argument("--replay", help="measure a saved recording instead of playing a match")
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay) as f:
+            recording = [tuple(entry) for entry in json.load(f)]
+    else:
+        recording, stats = record_match(args.port, args.squares)
+        print(f"live: watcher stream compressed {stats.get('compression')}x, "
+              f"{stats.get('compress_us')} us per batch on the host")
+        if args.record:
+            with open(args.record, "w") as f:
+                json.dump(recording, f)
+
+    from compression import ZDICT
+    batched = batches_of(recording)
+    single = [[message.encode()] for _, message in recording]
+    print(f"{len(recording)} messages in {len(batched)} batches over {recording[-1][0] - recording[0][0]:.1f} s")
+    for label, batches, zdict in (("per message, no dict", single, None),
+                                  ("per message, dict", single, ZDICT),
+                                  ("per batch, no dict", batched, None),
+                                  ("per batch, dict", batched, ZDICT)):
+        plain, compressed, c_us, d_us = measure(batches, zdict)
+        per_batch = (plain - compressed) / len(batches)
+        saved_us = per_batch * 8 / LINK_KBITS * 1000
+        print(f"{label:<22} ratio {plain / compressed:5.2f}  "
+              f"compress {c_us:5.1f} us + decompress {d_us:5.1f} us per flush, "
+              f"saves {saved_us:6.0f} us per flush on a {LINK_KBITS // 1000} Mbit/s link")
+
+if __name__ == "__main__":
+    main()
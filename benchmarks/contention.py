@@ -0,0 +1,153 @@
+# Plays bots against each other through a real host until the board is full, then prints
+# the host's contention analytics: lock collisions, wasted strokes, hold times and
+# lock-to-claim latency, with heatmaps of where on the board it happened
+#
+# Each bot only sees the board through the messages the host relays, like a player. It
+# picks one of the first --choice free squares in reading order, so fewer choices means
+# more bots going for the same square; some strokes stop short and end in a RESET. Bots
+# can play through impair.py's proxy to see how latency changes the picture
+#
+# Usage: python benchmarks/contention.py [--bots 3] [--choice 4] [--short 0.2]
+#                                        [--profile lan] [--seconds 60]
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from analytics import format_grid
+from board import GRID_SIZE
+from claim_verification import scribble
+from claims import pack_points
+from impair import PROFILES, Proxy
+from network import NetworkManager
+
+SIM_RATE = 60
+POINTS_PER_BATCH = 8
+COLORS = ("blue", "green", "pink")
+# Pause after LOCK and before CLAIM, as a real mouse press and release would leave
+SETTLE = 0.05
+
+# One bot's view of the board, kept from the messages the host relays
+class BoardView:
+    def __init__(self):
+        self.claimed = set()
+        self.locked = {}
+        self.lock = threading.Lock()
+
+    def on_message(self, message):
+        for part in message.split("GAME:")[1:]:
+            fields = part.split(":")
+            if len(fields) < 2:
+                continue
+            with self.lock:
+                if fields[0] == "CLAIM":
+                    self.claimed.add(fields[1])
+                    self.locked.pop(fields[1], None)
+                elif fields[0] == "LOCK" and len(fields) > 2:
+                    self.locked[fields[1]] = fields[2]
+                elif fields[0] in ("UNLOCK", "RESET"):
+                    self.locked.pop(fields[1], None)
+
+    def free(self):
+        with self.lock:
+            return [f"{r},{c}" for r in range(GRID_SIZE) for c in range(GRID_SIZE)
+                    if f"{r},{c}" not in self.claimed and f"{r},{c}" not in self.locked]
+
+def play(manager, view, color, rng, choice, short, stop):
+    points = scribble()
+    while not stop.is_set():
+        free = view.free()
+        if not free:
+            time.sleep(0.05)
+            continue
+        coord = rng.choice(free[:choice])
+        manager.send_game_command(f"LOCK:{coord}:{color}")
+        time.sleep(SETTLE)
+        stroke = points[:len(points) // 2] if rng.random() < short else points
+        for i in range(0, len(stroke), POINTS_PER_BATCH):
+            batch = stroke[i:i + POINTS_PER_BATCH]
+            manager.send_game_command(f"DRAW:{coord}:{';'.join(f'{x},{y}' for x, y in batch)}:{color}")
+            time.sleep(1 / SIM_RATE)
+        time.sleep(SETTLE)
+        if stroke is points:
+            manager.send_game_command(f"CLAIM:{coord}:{color}:{pack_points(points)}")
+        else:
+            manager.send_game_command(f"RESET:{coord}")
+            manager.send_game_command(f"UNLOCK:{coord}")
+        time.sleep(rng.uniform(0.05, 0.2))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=3, choices=range(2, len(COLORS) + 1))
+    parser.add_argument("--choice", type=int, default=4, help="bots pick among this many free squares")
+    parser.add_argument("--short", type=float, default=0.2, help="fraction of strokes abandoned halfway")
+    parser.add_argument("--profile", choices=sorted(PROFILES), help="play through the impairment proxy")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--port", type=int, default=30300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    host = NetworkManager("host", args.port, is_host=True)
+    host.set_message_handler(lambda message: None)
+    port = args.port
+    proxy = None
+    if args.profile:
+        port = args.port + 1
+        proxy = Proxy(port, ("127.0.0.1", args.port), PROFILES[args.profile], seed=args.seed).start()
+    bots = []
+    for i in range(args.bots):
+        view = BoardView()
+        # Kept off the shared-memory transport, which would carry their game traffic past
+        # the proxy, and without one would measure a path no LAN player takes
+        manager = NetworkManager(f"bot{i}", port, server_ip="127.0.0.1", local=False)
+        manager.set_message_handler(view.on_message)
+        bots.append((manager, view, COLORS[i]))
+    time.sleep(1.0)
+    host.reset_match()
+
+    stop = threading.Event()
+    rng = random.Random(args.seed)
+    threads = [threading.Thread(target=play, args=(manager, view, color, random.Random(rng.getrandbits(32)),
+                                                   args.choice, args.short, stop), daemon=True)
+               for manager, view, color in bots]
+    for t in threads:
+        t.start()
+    end = time.monotonic() + args.seconds
+    while time.monotonic() < end and not host.board.is_full():
+        time.sleep(1.0)
+        stats = host.get_contention_stats()
+        print(f"t={stats['seconds']:5.1f}s  locks {stats['locks']:3d}  collisions {stats['collisions']:3d}  "
+              f"claims {stats['claims']:3d}  rejected {stats['rejected']:3d}  resets {stats['resets']:3d}")
+    stop.set()
+    for t in threads:
+        t.join()
+
+    stats = host.get_contention_stats()
+    latency, hold = stats["claim_latency"], stats["hold"]
+    print(f"{stats['wasted_strokes']:.1%} of strokes wasted; lock to claim mean {latency.get('mean_ms')} ms, "
+          f"p90 <= {latency.get('p90_ms')} ms; hold mean {hold.get('mean_ms')} ms")
+    for color, player in sorted(stats["players"].items()):
+        print(f"  {color:<6} locks {player['locks']:3d}  collisions {player['collisions']:3d}  "
+              f"claims {player['claims']:3d}  rejected {player['rejected']:3d}  resets {player['resets']:3d}  "
+              f"lock time wasted {player['wasted_s']} s")
+    grids = host.analytics.heatmaps()
+    for name in ("locks", "collisions", "claim_ms"):
+        print(f"{name}:\n{format_grid(grids[name])}")
+    # A full board already wrote the export from the host's claim handler
+    if not host.board.is_full():
+        host.export_analytics()
+    time.sleep(0.5)
+
+    for manager, _, _ in bots:
+        manager.quit()
+    host.quit()
+    if proxy:
+        proxy.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Measures how a flooding client affects CLAIM latency for well-behaved players, with the
+# host's per-client rate limits on and effectively off
+#
+# The flooder is a raw socket in its own process that joins the lobby and then writes stroke
+# and chat messages as fast as the host will read them; the drawer and watcher are normal
+# NetworkManager clients in this process
+#
+# Usage: python benchmarks/flood_claim_latency.py [--claims 30]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from claim_verification import scribble
+from claims import pack_points
+from network import NetworkManager
+from ratelimit import DEFAULT_LIMITS
+
+FLOODER_SCRIPT = """
+import socket, threading
+sock = socket.create_connection(("127.0.0.1", {port}))
+sock.sendall(b"JOIN:flooder\\n")
+def drain():
+    try:
+        while sock.recv(65536):
+            pass
+    except OSError:
+        pass
+threading.Thread(target=drain, daemon=True).start()
+burst = b"GAME:DRAW:7,7:1,1:flood\\n" * 40
+sent = 0
+try:
+    while True:
+        sock.sendall(burst)
+        sent += 1
+        if sent % 50 == 0:
+            sock.sendall(b"MSG:flood\\n")
+except OSError:
+    pass
+print(f"flooder disconnected after {{sent * 40}} stroke messages", flush=True)
+"""
+
+# Stroke samples per second from the drawer, about what a fast mouse produces
+SAMPLE_RATE = 500
+UNLIMITED = {name: (1e9, 1e9) for name in DEFAULT_LIMITS}
+
+def run_match(port, claims, flood, rate_limits):
+    host = NetworkManager("host", port, is_host=True, rate_limits=rate_limits)
+    host.set_message_handler(lambda message: None)
+    # Kept off the shared-memory transport, so their traffic shares the host's sockets with
+    # the flooder's
+    drawer = NetworkManager("drawer", port, server_ip="127.0.0.1", local=False)
+    watcher = NetworkManager("watcher", port, server_ip="127.0.0.1", local=False)
+    time.sleep(1.0)
+
+    flooder = None
+    if flood:
+        flooder = subprocess.Popen([sys.executable, "-c", FLOODER_SCRIPT.format(port=port)],
+                                   stdout=subprocess.PIPE, text=True)
+        time.sleep(0.5)
+
+    # The host answers a claim with CLAIM, or RESET if it rejected it
+    decided = {}
+    rejected = set()
+    def on_watcher_message(message):
+        for part in message.split("GAME:"):
+            if part.startswith("CLAIM:") or part.startswith("RESET:"):
+                coord = part.split(":")[1]
+                if part.startswith("RESET:"):
+                    rejected.add(coord)
+                decided.setdefault(coord, time.perf_counter())
+    watcher.set_message_handler(on_watcher_message)
+
+    latencies = []
+    for n in range(claims):
+        coord = f"{n // 8},{n % 8}"
+        drawer.send_game_command(f"LOCK:{coord}:red")
+        for x, y in scribble():
+            drawer.send_game_command(f"DRAW:{coord}:{x},{y}:red")
+            time.sleep(1 / SAMPLE_RATE)
+        sent = time.perf_counter()
+        drawer.send_game_command(f"CLAIM:{coord}:red:{pack_points(scribble())}")
+        deadline = sent + 5
+        while coord not in decided and time.perf_counter() < deadline:
+            time.sleep(0.001)
+        if coord in decided:
+            latencies.append((decided[coord] - sent) * 1000)
+        time.sleep(0.05)
+
+    stats = host.flood_guard.get_stats()
+    for manager in (drawer, watcher, host):
+        manager.quit()
+    if flooder:
+        flooder.terminate()
+        flooder.wait()
+    return latencies, len(rejected), stats
+
+def summarize(label, latencies, rejected, claims, stats):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else float("nan")
+    median = statistics.median(latencies) if latencies else float("nan")
+    print(f"{label:<22} decided {len(latencies)}/{claims} (rejected {rejected})  median {median:7.1f} ms  p99 {p99:7.1f} ms")
+    dropped = {name: count for name, count in stats.items() if name not in ("disconnects", "oversized") and count}
+    print(f"{'':<22} over limit {dropped or 'none'}, disconnects {stats['disconnects']}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--claims", type=int, default=30)
+    parser.add_argument("--port", type=int, default=27300)
+    args = parser.parse_args()
+
+    cases = [("no flooder", False, None),
+             ("flooder, no limits", True, UNLIMITED),
+             ("flooder, rate limited", True, None)]
+    for n, (label, flood, rate_limits) in enumerate(cases):
+        latencies, rejected, stats = run_match(args.port + n * 10, args.claims, flood, rate_limits)
+        summarize(label, latencies, rejected, args.claims, stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# Checks that the host's memory-mapped checkpoint costs the claim path nothing, and that a
+# host killed mid-match comes back with the match intact
+#
+# First the host's LOCK, DRAW and CLAIM handling is timed with and without a checkpoint,
+# alternating runs so both see the same machine. Then a host in its own process is killed
+# outright after two players have claimed a few squares, and started again with the same
+# name and port; the players, with no standby to fail over to, wait for it and rejoin.
+# Last, a claim noted in the journal but never written to the board is replayed
+#
+# Usage: python benchmarks/host_checkpoint.py [--port 29500] [--boards 20]
+
+import argparse
+import contextlib
+import io
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from claim_verification import scribble
+from claims import pack_points
+from board import NO_COLOR
+from checkpoint import Checkpoint
+from network import NetworkManager
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+SIM_RATE = 60
+POINTS_PER_BATCH = 8
+
+HOST_SCRIPT = """
+import sys, time
+sys.path.insert(0, {client_dir!r})
+from network import NetworkManager
+start = time.perf_counter()
+host = NetworkManager("host", {port}, is_host=True, checkpoint=True)
+host.set_message_handler(lambda message: None)
+print(f"ready {{int(host.recovered)}} {{(time.perf_counter() - start) * 1000:.1f}}", flush=True)
+for line in sys.stdin:
+    if line.strip() == "board":
+        print("board", sum(host.board.claim_counts().values()), ",".join(host.players), flush=True)
+"""
+
+# Journal a claim, then die before it reaches the board
+JOURNAL_SCRIPT = """
+import os, sys
+sys.path.insert(0, {client_dir!r})
+from checkpoint import Checkpoint
+checkpoint = Checkpoint({path!r})
+checkpoint.set_players(["host", "p1"])
+checkpoint.journal("CLAIM:2,5:blue")
+os._exit(1)
+"""
+
+def batches(coord, color):
+    points = scribble()
+    return [f"GAME:DRAW:{coord}:{';'.join(f'{x},{y}' for x, y in points[i:i + POINTS_PER_BATCH])}:{color}"
+            for i in range(0, len(points), POINTS_PER_BATCH)]
+
+# Microseconds spent in each LOCK and CLAIM the host handles over `boards` full boards
+def claim_path(host, boards):
+    timings = {"LOCK": [], "CLAIM": []}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(boards):
+            host.reset_match()
+            for n in range(64):
+                coord = f"{n // 8},{n % 8}"
+                for kind, command in (("LOCK", f"GAME:LOCK:{coord}:red"), (None, batches(coord, "red")),
+                                      ("CLAIM", f"GAME:CLAIM:{coord}:red")):
+                    if kind is None:
+                        for draw in command:
+                            host.handle_game_command(draw, None)
+                        continue
+                    start = time.perf_counter()
+                    host.handle_game_command(command, None)
+                    timings[kind].append((time.perf_counter() - start) * 1e6)
+    return timings
+
+def compare(port, boards):
+    plain = NetworkManager("plain", port, is_host=True, checkpoint=False, use_udp=False)
+    mapped = NetworkManager("mapped", port + 1, is_host=True, checkpoint=True, use_udp=False)
+    for host in (plain, mapped):
+        host.set_message_handler(lambda message: None)
+    results = {"plain": {"LOCK": [], "CLAIM": []}, "mapped": {"LOCK": [], "CLAIM": []}}
+    for _ in range(boards):
+        for name, host in (("plain", plain), ("mapped", mapped)):
+            for kind, values in claim_path(host, 1).items():
+                results[name][kind] += values
+    print(f"host command path over {boards} boards of 64 claims:")
+    for kind in ("LOCK", "CLAIM"):
+        for name in ("plain", "mapped"):
+            values = sorted(results[name][kind])
+            print(f"  {kind:<5} {name:<6} median {statistics.median(values):6.1f} us  "
+                  f"p99 {values[int(len(values) * 0.99)]:6.1f} us")
+    claimed = mapped.board.claimed.copy()
+    plain.quit()
+    mapped.quit()
+    return claimed
+
+def start_host(port):
+    host = subprocess.Popen([sys.executable, "-c", HOST_SCRIPT.format(client_dir=CLIENT_DIR, port=port)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    line = host.stdout.readline()
+    while not line.startswith("ready "):
+        line = host.stdout.readline()
+    _, recovered, ms = line.split()
+    return host, recovered == "1", float(ms)
+
+def ask_board(host):
+    host.stdin.write("board\n")
+    host.stdin.flush()
+    # Skip the host's own log lines
+    line = host.stdout.readline()
+    while not line.startswith("board "):
+        line = host.stdout.readline()
+    _, count, players = line.split()
+    return int(count), players
+
+def claim(manager, coord, color):
+    manager.send_game_command(f"LOCK:{coord}:{color}")
+    time.sleep(0.05)
+    for draw in batches(coord, color):
+        manager.send_game_command(draw[5:])
+        time.sleep(1 / SIM_RATE)
+    time.sleep(0.05)
+    manager.send_game_command(f"CLAIM:{coord}:{color}:{pack_points(scribble())}")
+
+def wait_for(condition, timeout):
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return condition()
+
+def crash_and_restart(port):
+    host, _, _ = start_host(port)
+    claims = {}
+    rejoined = {}
+    players = []
+    # No datagram channel means no standby, so the players wait for this host to return
+    for name, color in (("p1", "blue"), ("p2", "green")):
+        manager = NetworkManager(name, port, server_ip="127.0.0.1", use_udp=False)
+        seen = claims.setdefault(name, set())
+        manager.set_message_handler(
+            lambda message, seen=seen: seen.update(part.split(":")[0] for part in message.split("GAME:CLAIM:")[1:]))
+        manager.set_player_update_handler(lambda _, name=name: rejoined.__setitem__(name, time.perf_counter()))
+        players.append((manager, color))
+    time.sleep(0.5)
+    for i in range(3):
+        for n, (manager, color) in enumerate(players):
+            claim(manager, f"{i},{n}", color)
+    wait_for(lambda: all(len(seen) == 6 for seen in claims.values()), 3.0)
+    before, _ = ask_board(host)
+
+    host.send_signal(signal.SIGKILL)
+    host.wait()
+    killed = time.perf_counter()
+    rejoined.clear()
+    host, recovered, ms = start_host(port)
+    started = time.perf_counter()
+    back = wait_for(lambda: len(rejoined) == len(players), 5.0)
+    after, roster = ask_board(host)
+    print(f"crash: {before} squares claimed before the kill, {after} after the restart "
+          f"({'recovered' if recovered else 'NOT recovered'}, host up in {ms:.1f} ms, "
+          f"process restart {(started - killed) * 1000:.0f} ms)")
+    if back:
+        print(f"  players back {max(rejoined.values()) - started:.3f} s after the host was up; roster {roster}")
+    else:
+        print(f"  only {sorted(rejoined)} rejoined")
+    manager, color = players[0]
+    claim(manager, "4,4", color)
+    accepted = wait_for(lambda: "4,4" in claims["p2"], 2.0)
+    print(f"  new claim after the restart {'accepted' if accepted else 'NOT accepted'}")
+    for manager, _ in players:
+        manager.quit()
+    host.kill()
+    host.wait()
+
+# A claim the host journaled and then crashed before applying is put back on recovery
+def journal_replay():
+    path = os.path.join("match_stats", "checkpoints", "replay.state")
+    subprocess.run([sys.executable, "-c", JOURNAL_SCRIPT.format(client_dir=CLIENT_DIR, path=path)])
+    checkpoint = Checkpoint(path)
+    players = checkpoint.recover()
+    print(f"journal replay: claim {'restored' if checkpoint.board.claimed[2, 5] != NO_COLOR else 'LOST'}, "
+          f"players {players}")
+    checkpoint.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=29500)
+    parser.add_argument("--boards", type=int, default=20)
+    args = parser.parse_args()
+    # Checkpoints go to match_stats/ under the working directory, kept out of the repo here
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        compare(args.port, args.boards)
+        crash_and_restart(args.port + 10)
+        journal_replay()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Measures how long players are out of the match when the host goes away, and checks the
+# standby picks up the board where the old host left it
+#
+# The host runs in its own process so it can really die. Three players join it, claim a
+# few squares and wait for a standby to be chosen; then the host is killed outright, frozen
+# so its connections stay open but silent, or asked to quit. Each player reports the time
+# from its last word from the host to being back in a match, split into noticing the host
+# was gone and taking over or rejoining; the new host must still have the old claims and
+# accept a new one
+#
+# Usage: python benchmarks/host_migration.py [--port 29000] [--case crash|silent|quit]
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from claim_verification import scribble
+from claims import pack_points
+from board import NO_COLOR
+from network import NetworkManager
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+SIM_RATE = 60
+POINTS_PER_BATCH = 8
+# Time for the RTT reports to come in and the standby's state link to open
+SETTLE = 2.5
+
+HOST_SCRIPT = """
+import sys
+sys.path.insert(0, {client_dir!r})
+from network import NetworkManager
+# The standby takes over here; a checkpoint would let the next run's host resume this match
+host = NetworkManager("host", {port}, is_host=True, checkpoint=False)
+host.set_message_handler(lambda message: None)
+print("ready", flush=True)
+for line in sys.stdin:
+    if line.strip() == "quit":
+        host.quit()
+        print("quit", flush=True)
+        break
+"""
+
+# Lock, stroke and claim one square the way a player does, at the game's step rate
+def claim(manager, color, index):
+    coord = f"{index // 8},{index % 8}"
+    manager.send_game_command(f"LOCK:{coord}:{color}")
+    points = scribble()
+    for i in range(0, len(points), POINTS_PER_BATCH):
+        batch = points[i:i + POINTS_PER_BATCH]
+        manager.send_game_command(f"DRAW:{coord}:{';'.join(f'{x},{y}' for x, y in batch)}:{color}")
+        time.sleep(1 / SIM_RATE)
+    manager.send_game_command(f"CLAIM:{coord}:{color}:{pack_points(points)}")
+
+def wait_for(condition, timeout):
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return condition()
+
+def run(case, port):
+    host = subprocess.Popen([sys.executable, "-c", HOST_SCRIPT.format(client_dir=CLIENT_DIR, port=port)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    host.stdout.readline()
+    players = {}
+    claims = {}
+    for name, color in (("p1", "blue"), ("p2", "green"), ("p3", "pink")):
+        manager = NetworkManager(name, port, server_ip="127.0.0.1")
+        seen = claims.setdefault(name, set())
+        manager.set_message_handler(
+            lambda message, seen=seen: seen.add(message.split(":")[2]) if message.startswith("GAME:CLAIM:") else None)
+        players[name] = (manager, color)
+
+    for index, (manager, color) in enumerate(players.values()):
+        claim(manager, color, index * 3)
+    time.sleep(SETTLE)
+    standby = {m.migration.successor[0] if m.migration.successor else None for m, _ in players.values()}
+    claimed = set.intersection(*claims.values())
+    print(f"{case}: standby {', '.join(str(s) for s in standby)}, {len(claimed)} squares claimed")
+
+    gone = time.perf_counter()
+    if case == "crash":
+        host.send_signal(signal.SIGKILL)
+    elif case == "silent":
+        host.send_signal(signal.SIGSTOP)
+    else:
+        host.stdin.write("quit\n")
+        host.stdin.flush()
+    wait_for(lambda: all(m.migration.last_handoff is not None for m, _ in players.values()), 5.0)
+    total = time.perf_counter() - gone
+    back = {name: (m.migration.last_handoff, m.migration.last_detection, m.migration.last_takeover)
+            for name, (m, _) in players.items()}
+    if case == "silent":
+        host.send_signal(signal.SIGKILL)
+    elif case == "quit":
+        host.wait(timeout=5)
+
+    new_hosts = [m for m, _ in players.values() if m.is_host]
+    ok = len(new_hosts) == 1
+    if ok:
+        new_host = new_hosts[0]
+        kept = all(new_host.board.claimed[tuple(map(int, coord.split(",")))] != NO_COLOR for coord in claimed)
+        manager, color = next((m, c) for m, c in players.values() if m is not new_host)
+        claim(manager, color, 40)
+        accepted = wait_for(lambda: "5,0" in claims[manager.username], 2.0)
+        print(f"  new host {new_host.username}: old claims {'kept' if kept else 'LOST'}, "
+              f"new claim {'accepted' if accepted else 'NOT accepted'}")
+    else:
+        print(f"  {len(new_hosts)} players are hosting")
+    for name, (handoff, detection, takeover) in back.items():
+        if handoff is None:
+            print(f"  {name}: did not get back in")
+            continue
+        print(f"  {name}: back in {handoff * 1000:.0f} ms after last hearing from the host: "
+              f"{detection * 1000:.0f} ms to notice, {takeover * 1000:.0f} ms to take over")
+    print(f"  all players back within {total * 1000:.0f} ms of the host going away")
+
+    for manager, _ in players.values():
+        manager.quit()
+    if host.poll() is None:
+        host.kill()
+    host.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=29000)
+    parser.add_argument("--case", choices=("crash", "silent", "quit"), action="append")
+    args = parser.parse_args()
+    for i, case in enumerate(args.case or ("crash", "silent", "quit")):
+        run(case, args.port + i * 10)
+
+if __name__ == "__main__":
+    main()
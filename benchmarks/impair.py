@@ -0,0 +1,429 @@
+# Network impairment proxy: sits between clients and the host and gives each connection
+# the delay, jitter, loss, bandwidth cap and read pattern of a real network, so problems
+# that never show on loopback can be reproduced on one machine
+#
+# Clients connect to the proxy instead of the host. Each connection's TCP stream is
+# forwarded in order: every write is held for the one-way delay plus jitter, waits its turn
+# behind a bandwidth cap, stalls for a retransmission timeout when it is "lost", and can be
+# split into small segments or merged with the writes that follow it. The proxy also puts
+# itself on the datagram channel by swapping the UDP port in the client's JOIN for one of
+# its own; datagrams are delayed independently, so they reorder, and lost ones are dropped
+#
+# Other benchmarks start a Proxy with one of the PROFILES or their own Profile; run alone,
+# this script proxies until interrupted and prints traffic totals every few seconds. Clients
+# on this machine must be started with local=False, or they move their game traffic onto
+# the shared-memory transport and skip the proxy
+#
+# Usage: python benchmarks/impair.py --target 127.0.0.1:25565 [--listen 25566]
+#                                    [--profile lan-party] [--delay MS] [--jitter MS]
+#                                    [--loss P] [--rate KBIT] [--segment BYTES] [--coalesce MS]
+
+import argparse
+import heapq
+import itertools
+import random
+import socket
+import threading
+import time
+
+# Extra wait for a TCP write that was "lost", as a retransmission after a timeout would see
+RTO = 0.2
+# Pause between the pieces of a write that is split into segments
+SEGMENT_GAP = 0.001
+
+# How one direction of a link behaves; times in seconds, rate in kbit/s, None for no cap
+class Profile:
+    def __init__(self, delay=0.0, jitter=0.0, loss=0.0, rate=None, segment=None, coalesce=0.0):
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.rate = rate
+        # TCP only: split writes into pieces of at most `segment` bytes, and merge writes
+        # that arrive within `coalesce` seconds of each other into one
+        self.segment = segment
+        self.coalesce = coalesce
+
+    # Copy with some settings changed
+    def but(self, **changes):
+        settings = dict(vars(self))
+        settings.update(changes)
+        return Profile(**settings)
+
+    def describe(self):
+        parts = [f"delay {self.delay * 1000:g} ms", f"jitter {self.jitter * 1000:g} ms", f"loss {self.loss:.1%}"]
+        if self.rate:
+            parts.append(f"{self.rate:g} kbit/s")
+        if self.segment:
+            parts.append(f"segments <= {self.segment} B")
+        if self.coalesce:
+            parts.append(f"coalesce {self.coalesce * 1000:g} ms")
+        return ", ".join(parts)
+
+PROFILES = {
+    "loopback": Profile(),
+    "lan": Profile(delay=0.0003, jitter=0.0002),
+    "wifi": Profile(delay=0.002, jitter=0.004, loss=0.005, rate=20000),
+    # A crowded room on one access point: slow, bursty, and reads never line up with writes
+    "lan-party": Profile(delay=0.006, jitter=0.015, loss=0.02, rate=4000, segment=200, coalesce=0.004),
+    "dsl": Profile(delay=0.02, jitter=0.004, loss=0.002, rate=1000),
+    "lossy": Profile(delay=0.005, jitter=0.01, loss=0.05),
+    # Read-pattern stress only: every message arrives in pieces, or several arrive together
+    "fragment": Profile(segment=7),
+    "coalesce": Profile(coalesce=0.02),
+}
+
+# Runs callbacks at given monotonic times on one thread, in time order
+class Scheduler:
+    def __init__(self):
+        self.queue = []
+        self.order = itertools.count()
+        self.wake = threading.Condition()
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def at(self, when, fn, *args):
+        with self.wake:
+            heapq.heappush(self.queue, (when, next(self.order), fn, args))
+            self.wake.notify()
+
+    def run(self):
+        while True:
+            with self.wake:
+                while self.running and (not self.queue or self.queue[0][0] > time.monotonic()):
+                    self.wake.wait(self.queue[0][0] - time.monotonic() if self.queue else None)
+                if not self.running:
+                    return
+                _, _, fn, args = heapq.heappop(self.queue)
+            fn(*args)
+
+    def stop(self):
+        with self.wake:
+            self.running = False
+            self.wake.notify()
+
+# One direction of one client's link: a bottleneck shared by its TCP and UDP traffic
+class Direction:
+    def __init__(self, profile, rng):
+        self.profile = profile
+        self.rng = rng
+        self.scheduler = Scheduler()
+        # When the bottleneck finishes sending what is already queued, and when the last
+        # in-order write is delivered
+        self.free_at = 0.0
+        self.last_delivery = 0.0
+        self.lock = threading.Lock()
+        self.sent_bytes = 0
+        self.writes = 0
+        self.stalls = 0
+        self.dropped = 0
+
+    # Delivery time for `size` bytes sent now; ordered traffic never overtakes earlier
+    # ordered traffic, at least `gap` behind it, and lost ordered traffic is retransmitted
+    # after RTO
+    def due(self, size, ordered, gap=0.0):
+        p = self.profile
+        with self.lock:
+            start = max(time.monotonic(), self.free_at)
+            self.free_at = start + (size * 8 / (p.rate * 1000) if p.rate else 0.0)
+            when = self.free_at + p.delay + (self.rng.uniform(0, p.jitter) if p.jitter else 0.0)
+            if ordered:
+                if p.loss and self.rng.random() < p.loss:
+                    when += RTO
+                    self.stalls += 1
+                when = max(when, self.last_delivery + gap)
+                self.last_delivery = when
+            self.sent_bytes += size
+            return when
+
+    # Queue a TCP write, split into segments if the profile asks for it
+    def send_stream(self, sock, data):
+        p = self.profile
+        self.writes += 1
+        if not p.segment:
+            self.scheduler.at(self.due(len(data), True), send_all, sock, data)
+            return
+        i = 0
+        while i < len(data):
+            n = self.rng.randint(1, p.segment)
+            piece = data[i:i + n]
+            self.scheduler.at(self.due(len(piece), True, SEGMENT_GAP), send_all, sock, piece)
+            i += n
+
+    # Queue a datagram, or drop it
+    def send_datagram(self, sock, data, addr):
+        if self.profile.loss and self.rng.random() < self.profile.loss:
+            self.dropped += 1
+            return
+        self.scheduler.at(self.due(len(data), False), send_to, sock, data, addr)
+
+    def close(self):
+        self.scheduler.stop()
+
+def send_all(sock, data):
+    try:
+        sock.sendall(data)
+    except OSError:
+        pass
+
+def send_to(sock, data, addr):
+    try:
+        sock.sendto(data, addr)
+    except OSError:
+        pass
+
+# Forwards one client's datagrams like a small NAT: the host and other players send to
+# `host_side`, whose port the client's JOIN advertises in place of its own, and each of
+# them appears to the client as its own socket, so replies find their way back. The host
+# appears on the proxy's own port, as players only take datagrams from where they connected
+class DatagramRelay:
+    def __init__(self, proxy, client_addr, up, down):
+        self.proxy = proxy
+        self.client_addr = client_addr
+        self.up = up
+        self.down = down
+        self.sides = {}
+        self.lock = threading.Lock()
+        self.host_side = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.host_side.bind(("0.0.0.0", 0))
+        self.host_port = self.host_side.getsockname()[1]
+        threading.Thread(target=self.forward_down, daemon=True).start()
+
+    # Client-facing socket standing in for `remote`
+    def side_for(self, remote):
+        if remote == self.proxy.host_addr:
+            return self.proxy.host_face
+        with self.lock:
+            side = self.sides.get(remote)
+            if side is None:
+                side = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                side.bind(("0.0.0.0", 0))
+                self.sides[remote] = side
+                threading.Thread(target=self.forward_up, args=(side, remote), daemon=True).start()
+            return side
+
+    def forward_down(self):
+        while True:
+            try:
+                data, remote = self.host_side.recvfrom(65536)
+            except OSError:
+                return
+            self.down.send_datagram(self.side_for(remote), data, self.client_addr)
+
+    def forward_up(self, side, remote):
+        while True:
+            try:
+                data, _ = side.recvfrom(65536)
+            except OSError:
+                return
+            self.up.send_datagram(self.host_side, data, remote)
+
+    def close(self):
+        self.proxy.relays.pop(self.client_addr, None)
+        with self.lock:
+            socks = [self.host_side] + list(self.sides.values())
+        for sock in socks:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+# One proxied client: both directions of its TCP stream and, once it joins, its datagrams
+class Connection:
+    def __init__(self, proxy, downstream, upstream):
+        self.proxy = proxy
+        self.downstream = downstream
+        self.upstream = upstream
+        self.up = Direction(proxy.up_profile, random.Random(proxy.rng.getrandbits(32)))
+        self.down = Direction(proxy.down_profile, random.Random(proxy.rng.getrandbits(32)))
+        self.relay = None
+        self.open_halves = 2
+        self.lock = threading.Lock()
+        for sock in (downstream, upstream):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=self.pump, args=(downstream, upstream, self.up, True), daemon=True).start()
+        threading.Thread(target=self.pump, args=(upstream, downstream, self.down, False), daemon=True).start()
+
+    # Read from src and queue for dst; with coalescing, reads keep merging until the
+    # stream has been quiet for the coalesce window
+    def pump(self, src, dst, direction, upstream):
+        window = direction.profile.coalesce
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                if window:
+                    src.settimeout(window)
+                    try:
+                        while True:
+                            more = src.recv(65536)
+                            if not more:
+                                break
+                            data += more
+                    except socket.timeout:
+                        pass
+                    src.settimeout(None)
+                if upstream and self.relay is None and data.startswith(b"JOIN:"):
+                    data = self.route_datagrams(data)
+                direction.send_stream(dst, data)
+        except OSError:
+            pass
+        # Let queued data drain before passing the close on
+        direction.scheduler.at(direction.due(0, True), self.close_half, dst)
+
+    # Put the proxy on the datagram channel advertised in JOIN:<name>:<udp port>:...
+    def route_datagrams(self, data):
+        text = data.decode(errors="replace")
+        head, sep, rest = text.partition("JOIN:")
+        line, newline, after = rest.partition("\n")
+        fields = line.split(":")
+        if len(fields) < 2 or not fields[1].isdigit():
+            return data
+        client_addr = (self.downstream.getpeername()[0], int(fields[1]))
+        self.relay = DatagramRelay(self.proxy, client_addr, self.up, self.down)
+        self.proxy.relays[client_addr] = self.relay
+        if "local" in fields[2:]:
+            print("Proxy: a client on this machine offered shared memory; its game traffic will "
+                  "skip the proxy (pass local=False)")
+        fields[1] = str(self.relay.host_port)
+        return (head + sep + ":".join(fields) + newline + after).encode()
+
+    # Pass a close on to the other side; the connection goes once both sides have closed
+    def close_half(self, sock):
+        try:
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        with self.lock:
+            self.open_halves -= 1
+            done = self.open_halves == 0
+        if done:
+            self.close()
+
+    def close(self):
+        for sock in (self.downstream, self.upstream):
+            try:
+                sock.close()
+            except OSError:
+                pass
+        if self.relay:
+            self.relay.close()
+        self.up.close()
+        self.down.close()
+
+# Accepts clients on listen_port and forwards them to target (ip, port) through the
+# impairment in `profile`, or separate profiles per direction
+class Proxy:
+    def __init__(self, listen_port, target, profile=None, down_profile=None, seed=None):
+        self.listen_port = listen_port
+        self.target = target
+        self.up_profile = profile or Profile()
+        self.down_profile = down_profile or self.up_profile
+        self.rng = random.Random(seed)
+        self.connections = []
+        self.server_socket = None
+        # The host's datagrams come from its game port; clients see them come from the
+        # proxy's port, through `host_face`, and send theirs back there
+        self.host_addr = (socket.gethostbyname(target[0]), target[1])
+        self.host_face = None
+        self.relays = {}
+
+    def start(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(("0.0.0.0", self.listen_port))
+        self.server_socket.listen(16)
+        self.host_face = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.host_face.bind(("0.0.0.0", self.listen_port))
+        threading.Thread(target=self.accept, daemon=True).start()
+        threading.Thread(target=self.forward_to_host, daemon=True).start()
+        return self
+
+    def accept(self):
+        while True:
+            try:
+                downstream, _ = self.server_socket.accept()
+            except OSError:
+                return
+            try:
+                upstream = socket.create_connection(self.target)
+            except OSError as e:
+                print(f"Could not reach {self.target[0]}:{self.target[1]}: {e}")
+                downstream.close()
+                continue
+            self.connections.append(Connection(self, downstream, upstream))
+
+    # Datagrams clients send to the host, passed on through their own relay
+    def forward_to_host(self):
+        while True:
+            try:
+                data, client_addr = self.host_face.recvfrom(65536)
+            except OSError:
+                return
+            relay = self.relays.get(client_addr)
+            if relay:
+                relay.up.send_datagram(relay.host_side, data, self.host_addr)
+
+    # Totals over every connection so far, for each direction
+    def stats(self):
+        totals = {}
+        for label, side in (("up", "up"), ("down", "down")):
+            directions = [getattr(c, side) for c in self.connections]
+            totals[label] = {key: sum(getattr(d, key) for d in directions)
+                             for key in ("sent_bytes", "writes", "stalls", "dropped")}
+        return totals
+
+    def close(self):
+        for sock in (self.server_socket, self.host_face):
+            try:
+                sock.close()
+            except (OSError, AttributeError):
+                pass
+        for connection in self.connections:
+            connection.close()
+
+# Profile from --profile, with any of the individual options overriding it
+def profile_from_args(args):
+    profile = PROFILES[args.profile]
+    changes = {}
+    for name, scale in (("delay", 0.001), ("jitter", 0.001), ("loss", 1), ("rate", 1),
+                        ("segment", 1), ("coalesce", 0.001)):
+        value = getattr(args, name)
+        if value is not None:
+            changes[name] = value * scale
+    return profile.but(**changes)
+
+def add_profile_arguments(parser, default="lan-party"):
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=default)
+    parser.add_argument("--delay", type=float, help="one-way delay in ms")
+    parser.add_argument("--jitter", type=float, help="extra random delay, up to this many ms")
+    parser.add_argument("--loss", type=float, help="fraction of writes and datagrams lost")
+    parser.add_argument("--rate", type=float, help="bandwidth cap in kbit/s")
+    parser.add_argument("--segment", type=int, help="split TCP writes into pieces of at most this many bytes")
+    parser.add_argument("--coalesce", type=float, help="merge TCP writes less than this many ms apart")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", required=True, help="host address as ip:port")
+    parser.add_argument("--listen", type=int, default=25566)
+    parser.add_argument("--seed", type=int)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    ip, _, port = args.target.rpartition(":")
+    profile = profile_from_args(args)
+    proxy = Proxy(args.listen, (ip, int(port)), profile, seed=args.seed).start()
+    print(f"Proxying port {args.listen} to {args.target}: {profile.describe()}")
+    try:
+        while True:
+            time.sleep(5)
+            totals = proxy.stats()
+            print("  ".join(f"{label}: {t['sent_bytes'] / 1024:.0f} KB in {t['writes']} writes, "
+                            f"{t['stalls']} stalls, {t['dropped']} datagrams dropped"
+                            for label, t in totals.items()))
+    except KeyboardInterrupt:
+        pass
+    proxy.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Plays a few squares through the impairment proxy under each network profile and checks
+# what the watching client ends up with: the player list, every LOCK and CLAIM, and how
+# long each claim took to come back
+#
+# A drawer and a watcher join the host through impair.py's Proxy. The drawer claims
+# --squares squares; the watcher records everything the host relays. Anything it receives
+# that isn't a well-formed game message is counted as garbled
+#
+# Usage: python benchmarks/impaired_match.py [--profiles loopback lan fragment ...] [--squares 4]
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from claim_verification import scribble
+from claims import pack_points
+from impair import PROFILES, Proxy
+from network import NetworkManager
+
+SIM_RATE = 60
+POINTS_PER_BATCH = 8
+# LOCK and CLAIM go over TCP and strokes over datagrams; a short pause either side keeps
+# the two channels from overtaking each other, as a real mouse press and release would
+SETTLE = 0.05
+WELL_FORMED = ("GAME:LOCK:", "GAME:UNLOCK:", "GAME:RESET:", "GAME:CLAIM:", "GAME:DRAW:", "GAME:CURSOR:")
+
+def run(port, name, squares):
+    host = NetworkManager("host", port, is_host=True)
+    host.set_message_handler(lambda message: None)
+    proxy = Proxy(port + 1, ("127.0.0.1", port), PROFILES[name], seed=1).start()
+    # Kept off the shared-memory transport, which would carry their game traffic past the proxy
+    drawer = NetworkManager("drawer", port + 1, server_ip="127.0.0.1", local=False)
+    watcher = NetworkManager("watcher", port + 1, server_ip="127.0.0.1", local=False)
+    received = []
+    watcher.set_message_handler(lambda message: received.append((time.perf_counter(), message)))
+    time.sleep(1.0)
+
+    sent = {}
+    for n in range(squares):
+        coord = f"{n},0"
+        drawer.send_game_command(f"LOCK:{coord}:red")
+        time.sleep(SETTLE)
+        points = scribble()
+        for i in range(0, len(points), POINTS_PER_BATCH):
+            batch = points[i:i + POINTS_PER_BATCH]
+            drawer.send_game_command(f"DRAW:{coord}:{';'.join(f'{x},{y}' for x, y in batch)}:red")
+            time.sleep(1 / SIM_RATE)
+        time.sleep(SETTLE)
+        sent[coord] = time.perf_counter()
+        drawer.send_game_command(f"CLAIM:{coord}:red:{pack_points(points)}")
+    time.sleep(1.5)
+
+    locks = sum(message.startswith("GAME:LOCK:") for _, message in received)
+    claimed = {}
+    for t, message in received:
+        if message.startswith("GAME:CLAIM:"):
+            claimed.setdefault(message.split(":")[2], t)
+    latencies = [(claimed[coord] - t) * 1000 for coord, t in sent.items() if coord in claimed]
+    garbled = sum(not message.startswith(WELL_FORMED) for _, message in received)
+    players = sorted(watcher.players) == ["drawer", "host", "watcher"]
+    median = f"{statistics.median(latencies):6.1f} ms" if latencies else "     - ms"
+    print(f"{name:<10} players {'ok' if players else 'WRONG':<5} locks {locks}/{squares}  "
+          f"claims {len(latencies)}/{squares}  median claim {median}  garbled {garbled}")
+    if not players:
+        print(f"           watcher sees {watcher.players}")
+
+    for manager in (drawer, watcher, host):
+        manager.quit()
+    proxy.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=list(PROFILES))
+    parser.add_argument("--squares", type=int, default=4)
+    parser.add_argument("--port", type=int, default=30100)
+    args = parser.parse_args()
+
+    for i, name in enumerate(args.profiles):
+        print(f"{name}: {PROFILES[name].describe()}")
+        run(args.port + i * 10, name, args.squares)
+
+if __name__ == "__main__":
+    main()
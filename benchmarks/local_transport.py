@@ -0,0 +1,189 @@
+# Compares the shared-memory transport with loopback TCP for clients on the host's machine
+#
+# The host runs in its own process, the clients in this one. Throughput: the host
+# broadcasts --messages game messages back to back and every client counts what arrives,
+# for 1 and --clients clients. Latency: one client sends a game message, the host relays it
+# to everyone and the sender times the round trip, --pings times a few milliseconds apart.
+# Both runs use the same host; the clients only differ in whether they ask for the local
+# transport, and neither uses the datagram channel. Last, the bare cost per message of each
+# transport without the game around it: a ring publish and read, and a loopback socket
+# send and receive
+#
+# Usage: python benchmarks/local_transport.py [--messages 20000] [--clients 4] [--pings 300]
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+sys.path.insert(0, CLIENT_DIR)
+
+from network import NetworkManager
+from sharedmem import RING_SLOTS, SharedClient, SharedHost
+
+HOST_SCRIPT = """
+import sys, time
+sys.path.insert(0, {client_dir!r})
+from network import NetworkManager
+host = NetworkManager("host", {port}, is_host=True, use_udp=False, checkpoint=False)
+host.set_message_handler(lambda message: None)
+print("ready", flush=True)
+for line in sys.stdin:
+    parts = line.split()
+    if parts and parts[0] == "blast":
+        start = time.perf_counter()
+        for i in range(int(parts[1])):
+            host.send_game_command(f"BENCH:{{i}}")
+        print(f"sent {{time.perf_counter() - start:.4f}}", flush=True)
+host.quit()
+"""
+
+# A client that counts BENCH messages and answers echo round trips
+class Counter:
+    def __init__(self, name, port, local):
+        self.manager = NetworkManager(name, port, server_ip="127.0.0.1", use_udp=False, local=local)
+        self.count = 0
+        self.last = None
+        self.echo = None
+        self.echoed = threading.Event()
+        self.manager.set_message_handler(self.on_message)
+
+    def on_message(self, message):
+        for part in message.split("GAME:BENCH:")[1:]:
+            if part.startswith("echo"):
+                if part == self.echo:
+                    self.echoed.set()
+            else:
+                self.count += 1
+                self.last = time.perf_counter()
+
+def read_until(host, prefix):
+    while True:
+        line = host.stdout.readline()
+        if not line:
+            raise RuntimeError("host exited")
+        if line.startswith(prefix):
+            return line
+
+# Messages per second delivered to every one of `clients`
+def throughput(host, clients, messages):
+    for client in clients:
+        client.count = 0
+    start = time.perf_counter()
+    host.stdin.write(f"blast {messages}\n")
+    host.stdin.flush()
+    sent = float(read_until(host, "sent ").split()[1])
+    deadline = time.time() + 30
+    while any(c.count < messages for c in clients) and time.time() < deadline:
+        time.sleep(0.005)
+    delivered = min(c.count for c in clients)
+    elapsed = max(c.last for c in clients) - start
+    return delivered, delivered / elapsed, messages / sent
+
+# Round trip of one game message through the host, in microseconds
+def round_trips(client, pings):
+    samples = []
+    for n in range(pings):
+        client.echo = f"echo{n}"
+        client.echoed.clear()
+        start = time.perf_counter()
+        client.manager.send_game_command(f"BENCH:{client.echo}")
+        if client.echoed.wait(1.0):
+            samples.append((time.perf_counter() - start) * 1e6)
+        time.sleep(0.003)
+    return samples
+
+def describe(samples):
+    samples = sorted(samples)
+    if not samples:
+        return "no replies"
+    return (f"median {statistics.median(samples):7.0f} us  p99 {samples[int(len(samples) * 0.99)]:7.0f} us  "
+            f"({len(samples)} replies)")
+
+# Nanoseconds per message to write and to read `messages` messages, in batches that fit
+# the ring, through a shared segment and through a loopback TCP connection
+def bare_cost(port, messages):
+    message = "GAME:DRAW:3,4:10,10;13,10;16,10;19,10;22,12;25,14;28,16;31,18:blue"
+    batch = RING_SLOTS // 2
+    rounds = max(1, messages // batch)
+    shared = SharedHost(port)
+    reader = SharedClient(shared.name, -1, 0)
+    write = read = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(batch):
+            shared.publish(message)
+        write += time.perf_counter() - start
+        start = time.perf_counter()
+        got = len(reader.receive(batch))
+        read += time.perf_counter() - start
+        assert got == batch
+    reader.close()
+    shared.unlink()
+    shared.close()
+    results = [("shared", write, read)]
+
+    server = socket.create_server(("127.0.0.1", 0))
+    sender = socket.create_connection(server.getsockname())
+    receiver, _ = server.accept()
+    data = message.encode()
+    write = read = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(batch):
+            sender.sendall(data)
+        write += time.perf_counter() - start
+        start = time.perf_counter()
+        want = len(data) * batch
+        while want:
+            want -= len(receiver.recv(min(want, 65536)))
+        read += time.perf_counter() - start
+    for sock in (sender, receiver, server):
+        sock.close()
+    results.append(("tcp", write, read))
+    n = rounds * batch
+    return [(label, write / n * 1e9, read / n * 1e9) for label, write, read in results]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--pings", type=int, default=300)
+    parser.add_argument("--port", type=int, default=30800)
+    args = parser.parse_args()
+
+    host = subprocess.Popen([sys.executable, "-c", HOST_SCRIPT.format(client_dir=CLIENT_DIR, port=args.port)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        read_until(host, "ready")
+        for label, local in (("tcp", False), ("shared", True)):
+            clients = [Counter(f"{label}{i}", args.port, local) for i in range(args.clients)]
+            time.sleep(0.5)
+            attached = sum(c.manager.local_link is not None for c in clients)
+            print(f"{label}: {attached} of {len(clients)} clients on shared memory")
+            for n in sorted({1, args.clients}):
+                delivered, rate, send_rate = throughput(host, clients[:n], args.messages)
+                print(f"  {n} client{'s' if n > 1 else ' '}  {rate:9.0f} msg/s delivered  "
+                      f"(host sent {send_rate:9.0f} msg/s, {delivered}/{args.messages} arrived)")
+            print(f"  round trip  {describe(round_trips(clients[0], args.pings))}")
+            lapped = sum(c.manager.local_link.lapped for c in clients if c.manager.local_link)
+            if lapped:
+                print(f"  {lapped} ring laps, caught up from the shared board")
+            for client in clients:
+                client.manager.quit()
+            time.sleep(0.5)
+    finally:
+        host.stdin.close()
+        host.wait(timeout=10)
+
+    print("bare transport, per message:")
+    for label, write, read in bare_cost(args.port + 1, args.messages * 5):
+        print(f"  {label:<7} write {write:6.0f} ns  read {read:6.0f} ns")
+
+if __name__ == "__main__":
+    main()
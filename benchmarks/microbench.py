@@ -0,0 +1,258 @@
+# Micro-benchmarks for the game's hot paths, compared against stored baselines
+#
+# Render paths run headless on SDL's dummy video driver, broadcast fan-out runs over real
+# loopback sockets. Each benchmark reports the best per-call time over several repeats;
+# a run fails (exit status 1) if any benchmark is slower than its baseline by more than
+# the threshold
+#
+# A change that knowingly makes a benchmarked path slower or faster re-records that path's
+# baseline in the same commit (--update --only NAME), and says why in the commit message
+#
+# Usage: python benchmarks/microbench.py [--threshold 0.25] [--only NAME] [--update]
+#   --update   record this machine's timings as the new baselines
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client"))
+
+import numpy as np
+import pygame
+from board import GRID_SIZE
+from gameboard import GameBoard, Square, WIDTH, HEIGHT
+from network import NetworkManager
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+BROADCAST_CLIENTS = 8
+REPEAT = 15
+# A benchmark over the threshold is measured again this many times before it counts
+RETRIES = 2
+
+BENCHMARKS = {}
+
+# Register a benchmark: `build(context)` returns (call, setup or None, calls per repeat)
+def benchmark(name):
+    def register(build):
+        BENCHMARKS[name] = build
+        return build
+    return register
+
+# Best per-call time in nanoseconds; when there is a setup step each call is timed alone
+# The collector is paused while timing so a collection doesn't land in one benchmark
+def measure(call, setup, number, repeat=REPEAT):
+    gc.collect()
+    gc.disable()
+    try:
+        best = min(time_calls(call, setup, number) for _ in range(repeat))
+    finally:
+        gc.enable()
+    return best * 1e9
+
+# Mean seconds per call over one batch of `number` calls
+def time_calls(call, setup, number):
+    if setup is None:
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        return (time.perf_counter() - start) / number
+    elapsed = 0.0
+    for _ in range(number):
+        setup()
+        start = time.perf_counter()
+        call()
+        elapsed += time.perf_counter() - start
+    return elapsed / number
+
+# A zig-zag stroke over a bit more than half a square, in local pixels
+def stroke_points():
+    points = [(x, y) for y in range(0, 48, 8) for x in range(0, 80, 3)]
+    return np.array([x for x, _ in points]), np.array([y for _, y in points])
+
+@benchmark("square.update_drawing")
+def bench_update_drawing(context):
+    square = Square(0, 0)
+    square.start_drawing("red")
+    pos = (square.rect.x + 40, square.rect.y + 40)
+    return lambda: square.update_drawing(pos), None, 20000
+
+@benchmark("square.stop_drawing")
+def bench_stop_drawing(context):
+    square = Square(0, 0)
+    xs, ys = stroke_points()
+
+    def setup():
+        square.claimed_by = None
+        square.start_drawing("red")
+        square.stamp_points(xs, ys)
+    return square.stop_drawing, setup, 2000
+
+@benchmark("square.draw.stroke")
+def bench_draw_stroke(context):
+    square = Square(0, 0)
+    square.start_drawing("red")
+    square.stamp_points(*stroke_points())
+    return lambda: square.draw(context["screen"]), None, 5000
+
+@benchmark("square.draw.claimed")
+def bench_draw_claimed(context):
+    square = Square(0, 0)
+    square.claimed_by = "blue"
+    return lambda: square.draw(context["screen"]), None, 5000
+
+# handle_game_message only queues a read; this times applying it at the next step
+@benchmark("gameboard.handle_game_message")
+def bench_handle_game_message(context):
+    board = context["board"]
+    message = ("GAME:CURSOR:blue:300,200GAME:LOCK:2,3:blue"
+               "GAME:DRAW:2,3:10,10;13,10;16,10;19,10:blueGAME:CURSOR:green:310,220"
+               "GAME:UNLOCK:5,5GAME:RESET:6,6")
+    return lambda: board.apply_game_message(message), None, 5000
+
+@benchmark("gameboard.calculate_ownership")
+def bench_calculate_ownership(context):
+    board = context["board"]
+    colors = ["red", "blue", "green", "pink"]
+
+    def setup():
+        board.ownership_dirty = True
+    for r in range(GRID_SIZE):
+        for c in range(GRID_SIZE):
+            board.squares[r][c].claimed_by = colors[(r + c) % len(colors)]
+    return board.calculate_ownership, setup, 5000
+
+@benchmark("gameboard.is_board_full")
+def bench_is_board_full(context):
+    board = context["board"]
+    for r in range(GRID_SIZE):
+        for c in range(GRID_SIZE):
+            board.squares[r][c].claimed_by = "red"
+    # Worst case: only the last square is still open
+    board.squares[-1][-1].claimed_by = None
+    return board.is_board_full, None, 20000
+
+@benchmark("network.broadcast")
+def bench_broadcast(context):
+    host = context["host"]
+    message = "GAME:LOCK:3,4:red"
+    return lambda: host.broadcast(message), None, 5000
+
+# Plain loopback clients that join and then read and discard whatever the host sends
+def connect_drains(port, count, stop):
+    socks = []
+    for index in range(count):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(f"JOIN:drain{index}\n".encode())
+        sock.settimeout(0.2)
+        socks.append(sock)
+
+        def drain(sock=sock):
+            while not stop.is_set():
+                try:
+                    if not sock.recv(65536):
+                        return
+                except socket.timeout:
+                    continue
+                except OSError:
+                    return
+        threading.Thread(target=drain, daemon=True).start()
+    return socks
+
+# Time every benchmark; `limit(name)` gives the slowest acceptable time, if there is one
+# The host neither checkpoints, announces itself nor records match statistics, and its
+# logging is silenced, so a run leaves nothing behind and prints only the results
+def run(names, port, limit):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return measure_all(names, port, limit)
+
+def measure_all(names, port, limit):
+    pygame.init()
+    stop = threading.Event()
+    host = NetworkManager("red", port, is_host=True, checkpoint=False, announce=False)
+    socks = connect_drains(port, BROADCAST_CLIENTS, stop)
+    while len(host.players) < BROADCAST_CLIENTS + 1:
+        time.sleep(0.01)
+    with host.lock:
+        host.players = ["red", "blue", "green", "pink"]
+    context = {"screen": pygame.display.set_mode((WIDTH, HEIGHT)), "host": host}
+    context["board"] = GameBoard(host, record_stats=False)
+
+    results = {}
+    try:
+        for name in names:
+            call, setup, number = BENCHMARKS[name](context)
+            call()
+            ns = measure(call, setup, number)
+            for _ in range(RETRIES):
+                if limit(name) is None or ns <= limit(name):
+                    break
+                ns = min(ns, measure(call, setup, number))
+            results[name] = ns
+            context["board"].reset_board()
+    finally:
+        stop.set()
+        context["board"].teardown()
+        host.quit()
+        for sock in socks:
+            sock.close()
+        pygame.quit()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown over the baseline, as a fraction")
+    parser.add_argument("--only", action="append", help="run only this benchmark (repeatable)")
+    parser.add_argument("--update", action="store_true", help="store these timings as the baselines")
+    parser.add_argument("--port", type=int, default=27600)
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+
+    def limit(name):
+        if args.update or name not in baselines:
+            return None
+        return baselines[name] * (1 + args.threshold)
+
+    results = run(names, args.port, limit)
+    regressions = []
+    for name in names:
+        ns = results[name]
+        base = baselines.get(name)
+        if base is None:
+            print(f"{name:<32} {ns:10.0f} ns   (no baseline)")
+            continue
+        change = ns / base - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<32} {ns:10.0f} ns   baseline {base:10.0f} ns  {change:+7.1%}{flag}")
+
+    if args.update:
+        baselines.update({name: round(ns, 1) for name, ns in results.items()})
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baselines written to {BASELINE_FILE}")
+    elif regressions:
+        print(f"{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Compares handling every MOUSEMOTION event on its own with one batched stamp and DRAW per
+# frame, for a fast mouse that queues many motion events between frames
+#
+# Drives a real GameBoard on the dummy SDL video driver with a host NetworkManager on
+# loopback; each frame's motion events are posted to the pygame queue before handle_events
+#
+# The drag zig-zags across one square in --stroke-frames frames and then starts over, so
+# the coverage column shows how much of a quick stroke each approach actually records
+#
+# Usage: python benchmarks/motion_batching.py [--events 16] [--frames 600] [--stroke-frames 20]
+
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+sys.path.insert(0, CLIENT_DIR)
+os.chdir(CLIENT_DIR)
+
+import pygame
+from gameboard import GameBoard
+from network import NetworkManager
+
+# Host that counts the game commands the board sends
+class CountingNetwork(NetworkManager):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commands = 0
+        self.bytes = 0
+
+    def send_game_command(self, command):
+        self.commands += 1
+        self.bytes += len(command)
+        super().send_game_command(command)
+
+# A zig-zag drag across square (0, 0), `events` samples per frame
+def stroke(board, events, frames):
+    rect = board.squares[0][0].rect
+    total = events * frames
+    for i in range(total):
+        t = i / total
+        x = rect.x + 2 + int((rect.w - 4) * abs((t * 12) % 2 - 1))
+        y = rect.y + 2 + int((rect.h - 4) * t)
+        yield x, y
+
+# The previous handler: one stamp and one DRAW per event, at the current mouse position
+def per_event(board, positions):
+    square = board.current_square
+    for _ in positions:
+        pos = positions[-1]
+        square.update_drawing(pos)
+        board.network.send_game_command(
+            f"DRAW:{square.row},{square.col}:{pos[0] - square.rect.x},{pos[1] - square.rect.y}:{board.my_color}")
+
+def run(network, events, frames, stroke_frames, batched):
+    board = GameBoard(network)
+    samples = list(stroke(board, events, stroke_frames))
+    board.mouse_down = True
+    board.handle_mouse_down(samples[0])
+    network.commands = network.bytes = 0
+
+    coverages = []
+    start = time.perf_counter()
+    for f in range(frames):
+        n = f % stroke_frames
+        positions = samples[n * events:(n + 1) * events]
+        if batched:
+            for pos in positions:
+                pygame.event.post(pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(1, 0, 0)))
+            board.handle_events()
+        else:
+            per_event(board, positions)
+        if n == stroke_frames - 1:
+            coverages.append(board.current_square.coverage())
+            board.current_square.pixel_grid.fill(0)
+    elapsed = time.perf_counter() - start
+
+    coverage = sum(coverages) / len(coverages)
+    board.squares[0][0].reset_drawing()
+    board.current_square = None
+    board.teardown()
+    return elapsed / frames * 1e6, network.commands / frames, network.bytes / frames, coverage
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=16)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--stroke-frames", type=int, default=20)
+    parser.add_argument("--port", type=int, default=27400)
+    args = parser.parse_args()
+
+    pygame.init()
+    network = CountingNetwork("host", args.port, is_host=True)
+    print(f"{args.events} motion events per frame, {args.frames} frames")
+    for label, batched in (("per event", False), ("batched", True)):
+        us, commands, size, coverage = run(network, args.events, args.frames, args.stroke_frames, batched)
+        print(f"{label:<10} {us:7.1f} us/frame  {commands:5.1f} DRAW/frame  {size:6.0f} B/frame  "
+              f"stroke coverage {coverage:5.1f}%")
+    network.quit()
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
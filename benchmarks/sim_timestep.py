@@ -0,0 +1,70 @@
+# Checks that the game's simulation rate doesn't depend on how fast frames are drawn
+#
+# Runs a real GameBoard on the dummy SDL video driver for a few seconds per case, with a
+# host NetworkManager on loopback and a remote player's cursor arriving at 120 Hz, and
+# counts simulation steps and drawn frames per second
+#
+# Usage: python benchmarks/sim_timestep.py [--seconds 3]
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+sys.path.insert(0, CLIENT_DIR)
+
+import pygame
+from gameboard import GameBoard
+from network import NetworkManager
+
+def run(network, seconds, max_fps, render_cost):
+    board = GameBoard(network, max_fps=max_fps)
+    if render_cost:
+        render = board.render
+
+        def slow_render(alpha):
+            render(alpha)
+            time.sleep(render_cost)
+        board.render = slow_render
+
+    stop = threading.Event()
+    def remote_cursor():
+        i = 0
+        while not stop.is_set():
+            board.handle_game_message(f"GAME:CURSOR:blue:{200 + i % 400},{i % 400}")
+            i += 1
+            time.sleep(1 / 120)
+    threading.Thread(target=remote_cursor, daemon=True).start()
+    threading.Timer(seconds, lambda: setattr(board, "running", False)).start()
+
+    start = time.perf_counter()
+    board.run()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    ticks, frames = board.tick, board.frames
+    board.teardown()
+    return ticks / elapsed, frames / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--port", type=int, default=27900)
+    args = parser.parse_args()
+
+    pygame.init()
+    network = NetworkManager("red", args.port, is_host=True)
+    with network.lock:
+        network.players = ["red", "blue"]
+    cases = [("60 FPS cap", 60, 0), ("240 FPS cap", 240, 0), ("uncapped", None, 0),
+             ("slow frames, 30 ms", 60, 0.03), ("slow frames, 100 ms", 60, 0.1)]
+    for label, max_fps, render_cost in cases:
+        steps, frames = run(network, args.seconds, max_fps, render_cost)
+        print(f"{label:<20} {steps:6.1f} steps/s  {frames:7.1f} frames/s")
+    network.quit()
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Shows per-client quality adapting to a slow link: one client reads slowly for a while and
+# then catches up, while two others read at full speed
+#
+# The host streams cursor and stroke traffic like a drawing player, plus a LOCK every
+# 100 ms. The script prints the slow client's link telemetry once a second, how long the
+# host's sends took, and whether every LOCK reached every client
+#
+# Usage: python benchmarks/slow_link.py [--slow-seconds 6] [--seconds 12]
+
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from network import NetworkManager
+
+# Raw client that joins and counts LOCKs; reads `chunk` bytes every `pause` seconds until
+# `slow_until`, then as fast as it can
+def client(port, name, stop, slow_until, counts, chunk=256, pause=0.1):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.connect(("127.0.0.1", port))
+    sock.sendall(f"JOIN:{name}\n".encode())
+    sock.settimeout(0.2)
+    tail = ""
+    while not stop.is_set():
+        slow = time.monotonic() < slow_until
+        try:
+            data = sock.recv(chunk if slow else 65536)
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+        if not data:
+            break
+        text = tail + data.decode(errors="replace")
+        counts[name] = counts.get(name, 0) + text.count("GAME:LOCK:")
+        # Keep a short tail so a LOCK split across reads is still counted once
+        cut = text.rfind("GAME:")
+        tail = text[cut:] if cut >= 0 and "GAME:LOCK:" not in text[cut:] else ""
+        if slow:
+            time.sleep(pause)
+    sock.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=12)
+    parser.add_argument("--slow-seconds", type=float, default=6)
+    parser.add_argument("--port", type=int, default=27800)
+    args = parser.parse_args()
+
+    host = NetworkManager("host", args.port, is_host=True, use_udp=False)
+    host.set_message_handler(lambda message: None)
+    stop = threading.Event()
+    counts = {}
+    start = time.monotonic()
+    for name, slow_for in (("fast1", 0), ("fast2", 0), ("slow", args.slow_seconds)):
+        threading.Thread(target=client, args=(args.port, name, stop, start + 1 + slow_for, counts),
+                         daemon=True).start()
+    time.sleep(1.0)
+
+    send_times = []
+    locks = 0
+    i = 0
+    next_report = time.monotonic() + 1
+    end = time.monotonic() + args.seconds
+    while time.monotonic() < end:
+        t0 = time.perf_counter()
+        host.send_game_command(f"CURSOR:red:{i % 640},{i % 480}")
+        points = ";".join(f"{(i + k) % 80},{(i * 3 + k) % 80}" for k in range(16))
+        host.send_game_command(f"DRAW:{i // 60 % 8},{i % 8}:{points}:red")
+        if i % 24 == 0:
+            host.send_game_command(f"LOCK:{locks % 8},{locks // 8 % 8}:red")
+            locks += 1
+        send_times.append((time.perf_counter() - t0) * 1e6)
+        i += 1
+        if time.monotonic() >= next_report:
+            stats = host.get_link_stats().get("slow", {})
+            elapsed = time.monotonic() - start
+            print(f"t={elapsed:4.1f}s  slow: quality {stats.get('quality')!s:<8} backlog {stats.get('backlog', 0):7d} B  "
+                  f"{stats.get('throughput', 0) / 1024:6.1f} KB/s  skipped {stats.get('skipped', 0)}")
+            next_report += 1
+        time.sleep(1 / 240)
+
+    time.sleep(2.0)
+    stop.set()
+    send_times.sort()
+    print(f"host send time per tick: median {statistics.median(send_times):.0f} us, "
+          f"p99 {send_times[int(len(send_times) * 0.99)]:.0f} us, max {send_times[-1]:.0f} us")
+    print(f"LOCKs sent {locks}, received " + ", ".join(f"{name} {n}" for name, n in sorted(counts.items())))
+    host.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Measures host CPU while spectators watch a busy match, directly and through a relay
+#
+# The host runs in its own process and streams cursor and stroke traffic as a drawing
+# player would; spectators are plain sockets that read and discard the feed
+#
+# Usage: python benchmarks/spectator_fanout.py [--seconds 5]
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+
+HOST_SCRIPT = """
+import os, sys, time
+sys.path.insert(0, {client_dir!r})
+from network import NetworkManager
+host = NetworkManager("host", {port}, is_host=True)
+host.set_message_handler(lambda message: None)
+print("ready", flush=True)
+time.sleep(1.0)
+start_cpu = sum(os.times()[:2])
+end = time.monotonic() + {seconds}
+i = 0
+while time.monotonic() < end:
+    host.send_game_command(f"CURSOR:red:{{i % 640}},{{i % 480}}")
+    host.send_game_command(f"DRAW:{{i // 80 % 8}},{{i % 8}}:{{i % 80}},{{i % 80}}:red")
+    if i % 240 == 0:
+        host.send_game_command(f"LOCK:{{i // 240 % 8}},0:red")
+    i += 1
+    time.sleep(1 / 240)
+print(f"cpu {{sum(os.times()[:2]) - start_cpu:.3f}}", flush=True)
+host.quit()
+"""
+
+# Open a spectator connection and discard everything it receives
+def spectate(port, stop):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.send(b"SPECTATE:bench\n")
+    sock.settimeout(0.5)
+    received = 0
+    while not stop.is_set():
+        try:
+            data = sock.recv(65536)
+            if not data:
+                break
+            received += len(data)
+        except socket.timeout:
+            continue
+    sock.close()
+    return received
+
+def run(port, seconds, spectators, via_relay):
+    host = subprocess.Popen(
+        [sys.executable, "-c", HOST_SCRIPT.format(client_dir=CLIENT_DIR, port=port, seconds=seconds)],
+        stdout=subprocess.PIPE, text=True)
+    host.stdout.readline()
+    relay = None
+    target = port
+    if via_relay:
+        relay = subprocess.Popen([sys.executable, os.path.join(CLIENT_DIR, "relay.py"),
+                                  "--host", "127.0.0.1", "--port", str(port), "--listen", str(port + 1)],
+                                 stdout=subprocess.DEVNULL)
+        time.sleep(0.5)
+        target = port + 1
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=spectate, args=(target, stop), daemon=True) for _ in range(spectators)]
+    for t in threads:
+        t.start()
+
+    cpu = None
+    for line in host.stdout:
+        if line.startswith("cpu"):
+            cpu = float(line.split()[1])
+            break
+    stop.set()
+    host.wait()
+    if relay:
+        relay.terminate()
+        relay.wait()
+    return cpu
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--port", type=int, default=27200)
+    args = parser.parse_args()
+
+    cases = [(0, False), (1, False), (4, False), (1, True), (16, True), (64, True)]
+    for n, (spectators, via_relay) in enumerate(cases):
+        cpu = run(args.port + n * 10, args.seconds, spectators, via_relay)
+        route = "relay " if via_relay else "direct"
+        print(f"{spectators:3d} spectators {route}  host CPU {cpu / args.seconds * 100:5.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Measures the match statistics store under many matches finishing at once: how long
+# recording a result holds up the game thread, how fast the writer commits, and how long
+# the leaderboard queries take once the database is large
+#
+# Several threads stand in for concurrent matches and record results as fast as they can,
+# once through the write-behind StatsStore and once committing each result themselves
+#
+# Usage: python benchmarks/stats_store.py [--matches 20000] [--threads 8] [--players 200]
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from stats import StatsStore, connect
+
+COLORS = ("red", "blue", "green", "pink")
+
+def make_result(rng, names):
+    players = rng.sample(names, 4)
+    squares = [rng.randint(0, 24) for _ in players]
+    best = max(squares)
+    return {"finished_at": time.time(), "recorded_by": players[0], "role": "host",
+            "winner": players[squares.index(best)], "duration_s": rng.uniform(60, 300),
+            "locks": rng.randint(64, 120), "collisions": rng.randint(0, 10),
+            "wasted_strokes": rng.random() / 3, "claim_ms": rng.uniform(300, 900),
+            "players": [{"player": name, "color": color, "squares": n, "percent": n * 100 // 64,
+                         "won": n == best, "claims": n, "rejected": rng.randint(0, 3),
+                         "resets": rng.randint(0, 5), "claim_ms": rng.uniform(300, 900)}
+                        for name, color, n in zip(players, COLORS, squares)]}
+
+# Record `count` results from `threads` threads with record(result); returns per-call
+# latencies in microseconds and the wall time
+def hammer(record, count, threads, names, seed):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n, seed):
+        rng = random.Random(seed)
+        results = [make_result(rng, names) for _ in range(n)]
+        mine = []
+        for result in results:
+            start = time.perf_counter()
+            record(result)
+            mine.append((time.perf_counter() - start) * 1e6)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(count // threads, seed + i)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return latencies, time.perf_counter() - start
+
+def describe(latencies):
+    latencies.sort()
+    return (f"median {statistics.median(latencies):7.1f} us  p99 {latencies[int(len(latencies) * 0.99)]:8.1f} us  "
+            f"max {latencies[-1] / 1000:7.1f} ms")
+
+def timed_query(label, fn, repeat=50):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows = fn()
+    print(f"  {label:<26} {(time.perf_counter() - start) / repeat * 1000:6.2f} ms  ({len(rows)} rows)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--players", type=int, default=200)
+    args = parser.parse_args()
+    names = [f"player{i}" for i in range(args.players)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = StatsStore(os.path.join(directory, "behind.db"))
+        start = time.perf_counter()
+        latencies, _ = hammer(store.record_match, args.matches, args.threads, names, 1)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        print(f"write-behind: {describe(latencies)}")
+        print(f"  {store.written} results committed in {store.batches} transactions in {elapsed:.2f} s, "
+              f"{store.written / elapsed:.0f} results/s")
+
+        # The same work committed on the recording thread, one transaction per result
+        direct = StatsStore(os.path.join(directory, "direct.db"))
+        local = threading.local()
+
+        def record_now(result):
+            conn = getattr(local, "conn", None)
+            if conn is None:
+                conn = local.conn = connect(direct.path)
+            with conn:
+                direct.insert(conn, result)
+        count = min(args.matches, 4000)
+        latencies, elapsed = hammer(record_now, count, args.threads, names, 2)
+        print(f"commit on caller: {describe(latencies)}")
+        print(f"  {len(latencies)} results in {elapsed:.2f} s, {len(latencies) / elapsed:.0f} results/s")
+        direct.close()
+
+        print(f"queries over {store.written} matches:")
+        timed_query("leaderboard(10)", lambda: store.leaderboard(10))
+        timed_query("player_history(20)", lambda: store.player_history("player7", 20))
+        timed_query("best_matches(10)", lambda: store.best_matches(10))
+        timed_query("recent_matches(20)", lambda: store.recent_matches(20))
+        conn = sqlite3.connect(store.path)
+        for label, sql in (("leaderboard", "SELECT * FROM players ORDER BY wins DESC, squares DESC LIMIT 10"),
+                           ("player_history", "SELECT * FROM results WHERE player = 'x' ORDER BY match_id DESC LIMIT 20")):
+            plan = "; ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+            print(f"  plan {label}: {plan}")
+        conn.close()
+        store.close()
+
+if __name__ == "__main__":
+    main()
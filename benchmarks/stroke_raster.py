@@ -0,0 +1,102 @@
+# Measures how fast a client takes in other players' strokes when 1 to 16 squares are
+# being drawn at once, with stroke batches stamped one sample at a time on the game thread
+# and with each read's squares rasterized together on the worker pool
+#
+# Every read carries one DRAW batch per square being drawn, as a busy match delivers them.
+# Reads are applied through a real GameBoard with the finished strokes committed after each
+# one, as the next frame would; "game thread" is the time the game thread itself spends.
+# Both ways must leave exactly the same pixels on the board
+#
+# Usage: python benchmarks/stroke_raster.py [--samples 32] [--reads 300] [--squares 1,2,4,8,16]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client"))
+
+import pygame
+from board import GRID_SIZE
+from claims import SQUARE_SIZE
+from gameboard import GameBoard
+from network import NetworkManager
+from raster import RASTER_MIN_SAMPLES, RASTER_WORKERS
+
+COLORS = ("blue", "green", "pink")
+
+# `reads` reads of one DRAW batch of `samples` samples for each of `squares` squares, each
+# stroke a random walk inside its square
+def make_reads(squares, samples, reads, seed):
+    rng = np.random.default_rng(seed)
+    cells = [(n // GRID_SIZE, n % GRID_SIZE) for n in range(squares)]
+    positions = rng.integers(0, SQUARE_SIZE, size=(squares, 2))
+    out = []
+    for _ in range(reads):
+        parts = []
+        for n, (row, col) in enumerate(cells):
+            steps = rng.integers(-3, 4, size=(samples, 2))
+            walk = np.clip(positions[n] + np.cumsum(steps, axis=0), 0, SQUARE_SIZE - 1)
+            positions[n] = walk[-1]
+            points = ";".join(f"{x},{y}" for x, y in walk.tolist())
+            parts.append(f"GAME:DRAW:{row},{col}:{points}:{COLORS[n % len(COLORS)]}")
+        out.append("".join(parts))
+    return cells, out
+
+# Apply every read to a fresh board; returns wall seconds, game thread seconds and the pixels
+def play(board, cells, reads, pooled):
+    board.reset_board()
+    for n, (row, col) in enumerate(cells):
+        board.squares[row][col].locked_by = COLORS[n % len(COLORS)]
+    board.rasterizer.min_samples = RASTER_MIN_SAMPLES if pooled else float("inf")
+    busy = 0.0
+    start = time.perf_counter()
+    for read in reads:
+        t = time.perf_counter()
+        board.apply_game_message(read)
+        busy += time.perf_counter() - t
+        board.rasterizer.commit(wait=True)
+    wall = time.perf_counter() - start
+    return wall, busy, board.board.pixels.copy()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=32, help="samples per DRAW batch")
+    parser.add_argument("--reads", type=int, default=300)
+    parser.add_argument("--squares", default="1,2,4,8,16")
+    parser.add_argument("--port", type=int, default=30600)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    host = NetworkManager("red", args.port, is_host=True, use_udp=False, checkpoint=False)
+    with host.lock:
+        host.players = ["red", "blue", "green", "pink"]
+    board = GameBoard(host, max_fps=0)
+
+    print(f"{args.samples} samples per batch, {args.reads} reads, {RASTER_WORKERS} raster workers, "
+          f"{os.cpu_count()} cpus")
+    print(f"{'squares':>7}  {'serial':>13}  {'pooled':>13}  {'game thread':>19}  speedup")
+    try:
+        for squares in map(int, args.squares.split(",")):
+            cells, reads = make_reads(squares, args.samples, args.reads, squares)
+            serial_wall, serial_busy, serial_pixels = play(board, cells, reads, False)
+            pooled_wall, pooled_busy, pooled_pixels = play(board, cells, reads, True)
+            if not np.array_equal(serial_pixels, pooled_pixels):
+                print(f"  {squares} squares: pooled strokes differ from serial ones")
+            samples = squares * args.samples * args.reads
+            print(f"{squares:>7}  {samples / serial_wall / 1e6:6.2f} Msamp/s  {samples / pooled_wall / 1e6:6.2f} Msamp/s  "
+                  f"{serial_busy / args.reads * 1e6:7.0f} -> {pooled_busy / args.reads * 1e6:5.0f} us  "
+                  f"{serial_wall / pooled_wall:6.2f}x")
+    finally:
+        board.teardown()
+        host.quit()
+        pygame.quit()
+
+if __name__ == "__main__":
+    main()
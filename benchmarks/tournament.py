@@ -0,0 +1,106 @@
+# Plays many simulated matches between seeded random bots across a process pool, to try
+# rule changes such as the capture threshold or brush size without real players
+#
+# Matches run in the headless engine in client/simulate.py: no display, no sockets, no
+# frame pacing. Each match is seeded from --seed and its index, so a run can be repeated
+# exactly, with any number of workers
+#
+# Usage: python benchmarks/tournament.py [--matches 200] [--workers N] [--players 4]
+#                                        [--threshold 50] [--brush -4 6] [--seed 0] [--db FILE]
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+sys.path.insert(0, CLIENT_DIR)
+
+import simulate
+from stats import StatsStore
+from claims import CLAIM_THRESHOLD, BRUSH_MIN, BRUSH_MAX
+
+# Pool initializer: brush size is a module constant, so each worker sets it once
+def start_worker(brush):
+    sys.path.insert(0, CLIENT_DIR)
+    simulate.set_brush(*brush)
+
+def play(job):
+    seed, players, threshold = job
+    return simulate.play_match(seed, players=players, threshold=threshold)
+
+# Store simulated results like real ones, with each seat as a player named after its colour
+def record(path, results):
+    store = StatsStore(path)
+    start = time.perf_counter()
+    for r in results:
+        store.record_match({
+            "recorded_by": "tournament", "role": "simulation", "winner": r["winner"] and f"bot-{r['winner']}",
+            "duration_s": r["ticks"] / simulate.SIM_RATE,
+            "players": [{"player": f"bot-{color}", "color": color, "squares": n,
+                         "percent": n * 100 // simulate.GRID_SIZE ** 2, "won": color == r["winner"]}
+                        for color, n in r["squares"].items()]})
+    store.close()
+    print(f"  recorded {store.written} matches in {store.batches} transactions, "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--players", type=int, default=4, choices=range(2, 5))
+    parser.add_argument("--threshold", type=float, default=CLAIM_THRESHOLD,
+                        help="percentage of a square that must be covered to capture it")
+    parser.add_argument("--brush", type=int, nargs=2, default=(BRUSH_MIN, BRUSH_MAX), metavar=("MIN", "MAX"),
+                        help="brush footprint as local offsets MIN..MAX-1 around each sample")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="also record every match in this statistics database, seats as players")
+    args = parser.parse_args()
+
+    jobs = [(args.seed * 1000003 + i, args.players, args.threshold) for i in range(args.matches)]
+    start = time.perf_counter()
+    if args.workers > 1:
+        pool = multiprocessing.Pool(args.workers, initializer=start_worker, initargs=(args.brush,))
+        results = pool.map(play, jobs, chunksize=max(1, len(jobs) // (args.workers * 8)))
+        # Let the workers exit on their own: pygame's SDL catches the SIGTERM that
+        # Pool.terminate() would send, and the workers would never go away
+        pool.close()
+        pool.join()
+    else:
+        start_worker(args.brush)
+        results = [play(job) for job in jobs]
+    elapsed = time.perf_counter() - start
+
+    finished = [r for r in results if r["finished"]]
+    wins = {}
+    for r in finished:
+        wins[r["winner"]] = wins.get(r["winner"], 0) + 1
+    print(f"{len(results)} matches, {args.players} players, threshold {args.threshold:g}%, "
+          f"brush {args.brush[0]}..{args.brush[1] - 1}: {len(finished)} finished")
+    for color in simulate.PLAYER_COLORS[:args.players]:
+        squares = statistics.mean(r["squares"][color] for r in results)
+        print(f"  seat {color:<6} wins {wins.get(color, 0) / max(len(finished), 1):6.1%}  "
+              f"mean squares {squares:5.1f}")
+    strokes = sum(r["strokes"] for r in results)
+    print(f"  {sum(r['claims'] for r in results) / strokes:.1%} of strokes captured, "
+          f"{sum(r['short'] for r in results) / strokes:.1%} short of the threshold, "
+          f"{sum(r['rejected'] for r in results) / strokes:.1%} refused by the host")
+    if finished:
+        minutes = sorted(r["minutes"] for r in finished)
+        print(f"  match length: median {statistics.median(minutes) * 60:.0f} s, "
+              f"p90 {minutes[int(len(minutes) * 0.9)] * 60:.0f} s of game time")
+
+    if args.db:
+        record(args.db, results)
+
+    cpu = sum(r["cpu"] for r in results)
+    game_seconds = sum(r["ticks"] for r in results) / simulate.SIM_RATE
+    cores = min(args.workers, os.cpu_count())
+    print(f"{elapsed:.2f} s on {args.workers} worker(s), {cores} core(s): {len(results) / elapsed:.1f} matches/s, "
+          f"{len(results) / elapsed / cores:.1f} matches/s per core, "
+          f"{cpu / len(results) * 1000:.0f} ms CPU per match, {game_seconds / cpu:.0f}x real time")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# Host-side contention analytics: where on the board strokes collide, how long squares stay
+# locked and how long a claim takes, per square and per player
+# The host feeds it every LOCK, CLAIM, RESET and UNLOCK it handles. A stroke starts when a
+# LOCK takes a free square and ends with an accepted CLAIM, a refused one, or a RESET/UNLOCK;
+# a LOCK for a square someone else holds is a collision. Counters per square are arrays
+# over the grid, so a match's totals export directly as heatmaps
+
+import json
+import os
+import threading
+import time
+import numpy as np
+from board import GRID_SIZE
+
+# Upper bounds of the latency histogram buckets, in seconds; one more bucket catches the rest
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+# Per-square counters, in the order they are reported and drawn
+SQUARE_COUNTERS = ("locks", "collisions", "claims", "rejected", "resets")
+
+# Bucketed latency histogram; percentiles are reported as their bucket's upper bound
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, seconds):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += seconds
+        self.count += 1
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        target = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean_ms": round(self.total / self.count * 1000, 1),
+                "p50_ms": self.percentile(50) * 1000, "p90_ms": self.percentile(90) * 1000,
+                "buckets": self.counts}
+
+# Counters and histograms for one player, keyed by colour on the host
+class PlayerStats:
+    def __init__(self):
+        self.counts = dict.fromkeys(SQUARE_COUNTERS, 0)
+        self.claim_latency = Histogram()
+        self.hold = Histogram()
+        # Lock time spent on strokes that did not end in a claim
+        self.wasted = 0.0
+
+    def summary(self):
+        return dict(self.counts, claim_latency=self.claim_latency.summary(), hold=self.hold.summary(),
+                    wasted_s=round(self.wasted, 2))
+
+# One match's analytics; `clock` returns seconds and is injectable for replays
+class MatchAnalytics:
+    def __init__(self, rows=GRID_SIZE, cols=GRID_SIZE, clock=time.monotonic):
+        self.rows = rows
+        self.cols = cols
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.clear()
+
+    # Start counting a new match
+    def clear(self):
+        with self.lock:
+            self.started = self.clock()
+            self.grids = {name: np.zeros((self.rows, self.cols), dtype=np.int64) for name in SQUARE_COUNTERS}
+            self.hold_total = np.zeros((self.rows, self.cols))
+            self.claim_total = np.zeros((self.rows, self.cols))
+            self.players = {}
+            self.claim_latency = Histogram()
+            self.hold = Histogram()
+            # Open strokes: (row, col) -> (colour, time the lock was taken)
+            self.held = {}
+
+    def player(self, color):
+        stats = self.players.get(color)
+        if stats is None:
+            stats = self.players[color] = PlayerStats()
+        return stats
+
+    def count(self, name, row, col, color):
+        self.grids[name][row, col] += 1
+        self.player(color).counts[name] += 1
+
+    # A LOCK from `color`; `taken` is whether the square was free or already its own
+    def on_lock(self, row, col, color, taken):
+        with self.lock:
+            if not taken:
+                self.count("collisions", row, col, color)
+                return
+            if (row, col) in self.held:
+                return
+            self.count("locks", row, col, color)
+            self.held[row, col] = (color, self.clock())
+
+    # The stroke on a square is over: "claims", "rejected" or "resets"
+    def on_end(self, row, col, outcome, color=None):
+        with self.lock:
+            holder, start = self.held.pop((row, col), (color, None))
+            if holder is None:
+                return
+            self.count(outcome, row, col, holder)
+            if start is None:
+                return
+            held = self.clock() - start
+            player = self.player(holder)
+            self.hold_total[row, col] += held
+            self.hold.add(held)
+            player.hold.add(held)
+            if outcome == "claims":
+                self.claim_total[row, col] += held
+                self.claim_latency.add(held)
+                player.claim_latency.add(held)
+            else:
+                player.wasted += held
+
+    # Live totals: counters, latency summaries and per-player breakdown
+    def summary(self):
+        with self.lock:
+            totals = {name: int(grid.sum()) for name, grid in self.grids.items()}
+            strokes = totals["locks"]
+            return dict(totals,
+                        seconds=round(self.clock() - self.started, 1),
+                        wasted_strokes=round(1 - totals["claims"] / strokes, 3) if strokes else 0.0,
+                        claim_latency=self.claim_latency.summary(), hold=self.hold.summary(),
+                        players={color: stats.summary() for color, stats in self.players.items()})
+
+    # Per-square grids: every counter, mean hold time and mean lock-to-claim time in ms
+    def heatmaps(self):
+        with self.lock:
+            grids = {name: grid.copy() for name, grid in self.grids.items()}
+            ended = grids["claims"] + grids["rejected"] + grids["resets"]
+            grids["hold_ms"] = np.divide(self.hold_total * 1000, ended, out=np.zeros(ended.shape), where=ended > 0)
+            grids["claim_ms"] = np.divide(self.claim_total * 1000, grids["claims"],
+                                          out=np.zeros(ended.shape), where=grids["claims"] > 0)
+        return grids
+
+    # Write <name>.json with the summary and grids, and <name>.png with the heatmaps
+    def export(self, directory, name):
+        os.makedirs(directory, exist_ok=True)
+        grids = self.heatmaps()
+        path = os.path.join(directory, name)
+        with open(path + ".json", "w") as f:
+            json.dump({"summary": self.summary(),
+                       "grids": {key: np.round(grid, 1).tolist() for key, grid in grids.items()}}, f, indent=1)
+        try:
+            save_heatmaps(grids, path + ".png")
+        except Exception as e:
+            print(f"Could not draw heatmap: {e}")
+        return path
+
+# Text rendering of one grid, for consoles and logs
+def format_grid(grid):
+    width = max(len(f"{value:g}") for value in grid.ravel())
+    return "\n".join(" ".join(f"{value:>{width}g}" for value in row) for row in np.round(grid, 1))
+
+# Draw every grid as a panel of shaded cells with its values, side by side in one image
+# pygame is only needed here, so a headless host without a display still imports this module
+def save_heatmaps(grids, path, cell=36, margin=24):
+    import pygame
+    pygame.font.init()
+    font = pygame.font.SysFont("Arial", 12)
+    title_font = pygame.font.SysFont("Arial", 14)
+    names = list(grids)
+    rows, cols = next(iter(grids.values())).shape
+    panel_w, panel_h = cols * cell, rows * cell
+    surface = pygame.Surface((len(names) * (panel_w + margin) + margin, panel_h + margin * 2))
+    surface.fill((255, 255, 255))
+    for i, name in enumerate(names):
+        grid = grids[name]
+        peak = grid.max()
+        x0, y0 = margin + i * (panel_w + margin), margin * 3 // 2
+        surface.blit(title_font.render(name, True, (0, 0, 0)), (x0, 4))
+        for r in range(rows):
+            for c in range(cols):
+                value = grid[r, c]
+                heat = value / peak if peak else 0.0
+                color = (255, int(255 * (1 - heat)), int(255 * (1 - heat)))
+                rect = pygame.Rect(x0 + c * cell, y0 + r * cell, cell, cell)
+                surface.fill(color, rect)
+                pygame.draw.rect(surface, (200, 200, 200), rect, 1)
+                if value:
+                    label = font.render(f"{value:.0f}", True, (0, 0, 0))
+                    surface.blit(label, label.get_rect(center=rect.center))
+    pygame.image.save(surface, path)
@@ -0,0 +1,106 @@
+# Array-backed board model shared by the client's GameBoard and the host's NetworkManager
+# All per-square state lives in a few numpy arrays that are views into one contiguous
+# buffer: colour codes for claims, locks and strokes, the tick of each square's last lock
+# activity, and every square's pixel grid as one (rows, cols, h, w) block. Board-wide
+# queries are single numpy calls and a snapshot is one copy of the buffer
+
+import threading
+import numpy as np
+
+GRID_SIZE = 8
+SQUARE_SIZE = 80
+
+# Colour codes: 0 means nobody, player colours come first, any other colour name gets the
+# next free code the first time it is seen
+NO_COLOR = 0
+COLORS = [None, "red", "blue", "green", "pink"]
+_CODES = {name: code for code, name in enumerate(COLORS) if name}
+_CODES_LOCK = threading.Lock()
+
+def color_code(name):
+    if not name:
+        return NO_COLOR
+    code = _CODES.get(name)
+    if code is None:
+        with _CODES_LOCK:
+            code = _CODES.get(name)
+            if code is None:
+                if len(COLORS) > 255:
+                    raise ValueError(f"too many colours for the board model: {name}")
+                code = len(COLORS)
+                COLORS.append(name)
+                _CODES[name] = code
+    return code
+
+def color_name(code):
+    return COLORS[code]
+
+# Bytes one board's buffer takes
+def buffer_size(rows=GRID_SIZE, cols=GRID_SIZE, size=SQUARE_SIZE):
+    return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, dtype, shape in board_layout(rows, cols, size))
+
+# Fields in the order they sit in the buffer; the 8-byte ticks go first so every view is aligned
+def board_layout(rows, cols, size):
+    return (
+        ("lock_tick", np.int64, (rows, cols)),
+        ("claimed", np.uint8, (rows, cols)),
+        ("locked", np.uint8, (rows, cols)),
+        ("stroke", np.uint8, (rows, cols)),
+        ("drawing", np.bool_, (rows, cols)),
+        ("pixels", np.uint8, (rows, cols, size, size)),
+    )
+
+# Every square's state for one board, as arrays indexed [row, col]
+# `buffer` is an existing uint8 array of buffer_size() bytes to keep the state in, such as
+# a memory-mapped checkpoint; by default the board allocates its own
+class BoardModel:
+    def __init__(self, rows=GRID_SIZE, cols=GRID_SIZE, size=SQUARE_SIZE, buffer=None):
+        self.rows = rows
+        self.cols = cols
+        layout = board_layout(rows, cols, size)
+        sizes = [int(np.prod(shape)) * np.dtype(dtype).itemsize for _, dtype, shape in layout]
+        if buffer is None:
+            buffer = np.zeros(sum(sizes), dtype=np.uint8)
+        elif buffer.size != sum(sizes):
+            raise ValueError(f"board buffer is {buffer.size} bytes, expected {sum(sizes)}")
+        self.buffer = buffer
+        offset = 0
+        for (name, dtype, shape), n in zip(layout, sizes):
+            setattr(self, name, self.buffer[offset:offset + n].view(dtype).reshape(shape))
+            offset += n
+        # Memoryviews over the per-square arrays for code that touches one square at a time:
+        # indexing one with (row, col) reads and writes plain Python ints and bools, several
+        # times cheaper than going through a numpy scalar
+        for name, _, shape in layout:
+            if len(shape) == 2:
+                setattr(self, name + "_cells", memoryview(getattr(self, name)))
+
+    # Forget every claim, lock and stroke for a new match
+    def clear(self):
+        self.buffer.fill(0)
+
+    # Copy of the whole board state, and putting one back
+    def snapshot(self):
+        return self.buffer.copy()
+
+    def restore(self, snapshot):
+        self.buffer[:] = snapshot
+
+    def is_full(self):
+        return bool(np.count_nonzero(self.claimed) == self.claimed.size)
+
+    # Squares claimed by each colour, as {colour name: count}
+    def claim_counts(self):
+        counts = np.bincount(self.claimed.ravel(), minlength=len(COLORS))
+        return {COLORS[code]: int(n) for code, n in enumerate(counts) if code and n}
+
+    # (row, col) of unclaimed squares locked with no lock activity since tick `before`
+    def stale_locks(self, before):
+        if not np.count_nonzero(self.locked):
+            return []
+        stale = (self.locked != NO_COLOR) & (self.claimed == NO_COLOR) & (self.lock_tick < before)
+        return [tuple(cell) for cell in np.argwhere(stale).tolist()]
+
+    # {"r,c": colour name} for every non-empty square of a colour-code matrix
+    def named(self, codes):
+        return {f"{r},{c}": COLORS[codes[r, c]] for r, c in np.argwhere(codes).tolist()}
@@ -0,0 +1,114 @@
+# Bounded chat history and host-side chat batching for the lobby
+# Keeps lobby memory flat no matter how long the lobby runs or how noisy the chat is
+
+import threading
+import time
+from ratelimit import TokenBucket
+
+CHAT_HISTORY_SIZE = 200
+CHAT_FLUSH_INTERVAL = 0.1
+CHAT_RATE = 2.0
+CHAT_BURST = 5
+
+# Fixed-capacity ring buffer of chat and status lines, oldest lines are overwritten
+class ChatHistory:
+    def __init__(self, capacity=CHAT_HISTORY_SIZE):
+        self.capacity = capacity
+        self.lines = [None] * capacity
+        self.start = 0
+        self.count = 0
+        self.version = 0
+
+    def __len__(self):
+        return self.count
+
+    # Add a line, overwriting the oldest one once the buffer is full
+    def append(self, line):
+        end = (self.start + self.count) % self.capacity
+        self.lines[end] = line
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+        self.version += 1
+
+    # Return up to `count` lines, oldest first, ending `offset` lines before the newest
+    def page(self, count, offset=0):
+        offset = max(0, min(offset, self.count - count))
+        first = max(0, self.count - offset - count)
+        last = self.count - offset
+        return [self.lines[(self.start + i) % self.capacity] for i in range(first, last)]
+
+    # Largest scroll-back offset that still shows a full page
+    def max_offset(self, count):
+        return max(0, self.count - count)
+
+    def clear(self):
+        self.lines = [None] * self.capacity
+        self.start = 0
+        self.count = 0
+        self.version += 1
+
+# Collects chat lines on the host and sends each client one frame per flush interval,
+# dropping lines from senders that exceed their per-second allowance
+class ChatBatcher:
+    def __init__(self, network, interval=CHAT_FLUSH_INTERVAL, rate=CHAT_RATE, burst=CHAT_BURST):
+        self.network = network
+        self.interval = interval
+        self.rate = rate
+        self.burst = burst
+        self.pending = []
+        self.allowance = {}
+        self.throttled = set()
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    # Queue a chat line from `sender` (a client socket, or None for the host itself)
+    # Returns False if the sender is over its rate limit and the line was dropped
+    def submit(self, line, sender=None):
+        with self.lock:
+            if sender is not None and not self.take_token(sender):
+                newly_throttled = sender not in self.throttled
+                self.throttled.add(sender)
+                if newly_throttled:
+                    self.network.send_to(sender, "MSG:You are sending messages too fast")
+                return False
+            self.throttled.discard(sender)
+            self.pending.append((sender, line))
+        return True
+
+    # Token bucket per sender: refills at `rate` per second up to `burst`
+    def take_token(self, sender):
+        bucket = self.allowance.get(sender)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self.allowance[sender] = bucket
+        return bucket.take()
+
+    # Forget rate-limit state for a disconnected client
+    def forget(self, sender):
+        with self.lock:
+            self.allowance.pop(sender, None)
+            self.throttled.discard(sender)
+
+    # Send every queued line to each client in a single frame, one MSG per line, skipping its
+    # own lines
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            pending = self.pending
+            self.pending = []
+        with self.network.lock:
+            clients = [client for client in self.network.clients if self.network.has_joined(client)]
+        for client in clients:
+            lines = [line for sender, line in pending if sender is not client]
+            if lines:
+                self.network.send_to(client, "\n".join("MSG:" + line for line in lines))
+
+    def run(self):
+        while self.network.running:
+            time.sleep(self.interval)
+            self.flush()
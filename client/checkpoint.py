@@ -0,0 +1,180 @@
+# Crash-safe host state: the authoritative board lives in a memory-mapped file, so every
+# claim, lock and brush sample the host records is already in the file as it happens
+# The file has a fixed layout: a header with the match's players and whether the host is
+# still running, a small journal of the last accepted claims, and the board buffer itself.
+# A host that crashed leaves the file marked live, and the next host started with the same
+# name and port picks the match up from it. Writes only touch mapped memory and nothing on
+# the claim path syncs: the pages belong to the kernel, which keeps them when the host
+# process dies and writes them out on its own schedule. Only a clean stop syncs the file
+
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from board import BoardModel, GRID_SIZE, SQUARE_SIZE, buffer_size, color_code
+
+CHECKPOINT_DIR = os.path.join("match_stats", "checkpoints")
+MAGIC = b"DNCKPT01"
+HEADER_SIZE = 4096
+PLAYERS_SIZE = 2048
+# Journal slots, each a sequence number and the command text
+JOURNAL_SLOTS = 1024
+JOURNAL_TEXT = 56
+# How often the host stamps the header to show it is still alive
+ALIVE_INTERVAL = 1.0
+# A crashed host's match is only picked up again if it was running this recently
+RECOVERY_WINDOW = 120.0
+
+# Header fields at fixed offsets: magic, int32 rows, cols, square size, live flag, the
+# length of the comma-separated player list that follows, and when the host was last alive
+_DIMS = slice(8, 20)
+_LIVE = 20
+_PLAYERS_LEN = slice(24, 28)
+_PLAYERS = slice(28, 28 + PLAYERS_SIZE)
+_ALIVE_AT = slice(2080, 2088)
+
+def checkpoint_path(username, port, directory=CHECKPOINT_DIR):
+    return os.path.join(directory, f"{username}-{port}.state")
+
+# One host's checkpoint file, opened for writing
+class Checkpoint:
+    def __init__(self, path, rows=GRID_SIZE, cols=GRID_SIZE, size=SQUARE_SIZE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        journal_at = HEADER_SIZE
+        board_at = journal_at + JOURNAL_SLOTS * (8 + JOURNAL_TEXT)
+        total = board_at + buffer_size(rows, cols, size)
+        dims = np.array([rows, cols, size], dtype=np.int32)
+        # The file stays open, and locked, until this process exits however it exits, so a
+        # second host can't take over the file of one that is still running
+        self.file = open(path, "a+b")
+        if fcntl:
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.file.close()
+                raise OSError(f"{path} is in use by another host")
+        reuse = os.path.getsize(path) == total
+        if not reuse:
+            self.file.truncate(0)
+            self.file.truncate(total)
+        self.mmap = mmap.mmap(self.file.fileno(), total)
+        # A plain array over the mapping: numpy's memmap subclass would slow down every
+        # slice the host takes of the board
+        self.map = np.frombuffer(self.mmap, dtype=np.uint8)
+        self.header = self.map[:HEADER_SIZE]
+        if reuse and (bytes(self.header[:8]) != MAGIC or not np.array_equal(self.header[_DIMS].view(np.int32), dims)):
+            self.map[:] = 0
+            reuse = False
+        # Players of the match a crashed host left behind, None if there is nothing to recover
+        self.left_behind = None
+        if reuse and self.header[_LIVE] and time.time() - self.alive_at() < RECOVERY_WINDOW:
+            self.left_behind = self.read_players()
+        self.header[:8] = np.frombuffer(MAGIC, dtype=np.uint8)
+        self.header[_DIMS] = dims.view(np.uint8)
+        self.journal_at = journal_at
+        self.journal_seq = self.map[journal_at:journal_at + JOURNAL_SLOTS * 8].view(np.int64)
+        self.journal_text = self.map[journal_at + JOURNAL_SLOTS * 8:board_at].reshape(JOURNAL_SLOTS, JOURNAL_TEXT)
+        self.seq = int(self.journal_seq.max())
+        self.board = BoardModel(rows, cols, size, buffer=self.map[board_at:])
+        if self.left_behind is None:
+            self.board.clear()
+            self.journal_seq[:] = 0
+            self.seq = 0
+        self.header[_LIVE] = 1
+        self.mark_alive()
+        self.open = True
+        threading.Thread(target=self.keep_alive, daemon=True).start()
+
+    def alive_at(self):
+        return float(self.header[_ALIVE_AT].view(np.float64)[0])
+
+    def mark_alive(self):
+        self.header[_ALIVE_AT] = np.array([time.time()], dtype=np.float64).view(np.uint8)
+
+    def read_players(self):
+        n = int(self.header[_PLAYERS_LEN].view(np.int32)[0])
+        try:
+            text = bytes(self.header[_PLAYERS][:n]).decode()
+        except UnicodeDecodeError:
+            return []
+        return [p for p in text.split(",") if p]
+
+    def set_players(self, players):
+        data = ",".join(players).encode()[:PLAYERS_SIZE]
+        self.header[_PLAYERS][:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self.header[_PLAYERS_LEN] = np.array([len(data)], dtype=np.int32).view(np.uint8)
+
+    # Note a command before the host applies it to the board; a slot only counts once its
+    # sequence number is written, after the text. This is on the claim path, so it writes
+    # to the mapping directly rather than through numpy
+    def journal(self, command):
+        self.seq += 1
+        slot = self.seq % JOURNAL_SLOTS
+        seq_at = self.journal_at + slot * 8
+        text_at = self.journal_at + JOURNAL_SLOTS * 8 + slot * JOURNAL_TEXT
+        struct.pack_into("<q", self.mmap, seq_at, 0)
+        self.mmap[text_at:text_at + JOURNAL_TEXT] = command.encode()[:JOURNAL_TEXT].ljust(JOURNAL_TEXT, b"\0")
+        struct.pack_into("<q", self.mmap, seq_at, self.seq)
+
+    # Journal entries still in the file, oldest first
+    def entries(self):
+        order = np.argsort(self.journal_seq)
+        return [bytes(self.journal_text[slot]).rstrip(b"\0").decode(errors="replace")
+                for slot in order if self.journal_seq[slot]]
+
+    # Bring the board up to date with the journal: a claim the host noted but crashed before
+    # writing to the board still counts. Returns the players to wait for
+    def recover(self):
+        claimed = self.board.claimed
+        for entry in self.entries():
+            parts = entry.split(":")
+            if parts[0] == "CLAIM" and len(parts) == 3:
+                try:
+                    row, col = map(int, parts[1].split(","))
+                    if not claimed[row, col]:
+                        claimed[row, col] = color_code(parts[2])
+                        self.board.locked[row, col] = 0
+                except (ValueError, IndexError):
+                    continue
+        return self.left_behind
+
+    # Start a new match in the same file
+    def new_match(self):
+        self.journal_seq[:] = 0
+        self.seq = 0
+
+    def keep_alive(self):
+        while self.open:
+            time.sleep(ALIVE_INTERVAL)
+            if self.open:
+                self.mark_alive()
+
+    # The host is stopping on purpose: there is nothing to recover next time
+    def close(self):
+        if not self.open:
+            return
+        self.open = False
+        self.header[_LIVE] = 0
+        self.mmap.flush()
+        # The mapping holds its own copy of the descriptor, so closing the file alone would
+        # keep the lock
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+# Open the checkpoint for this host, or carry on without one if the file can't be created
+def open_checkpoint(username, port, directory=CHECKPOINT_DIR):
+    try:
+        return Checkpoint(checkpoint_path(username, port, directory))
+    except (OSError, ValueError) as e:
+        print(f"Host checkpoint unavailable, a crash will lose the match: {e}")
+        return None
@@ -0,0 +1,145 @@
+# Host-side claim verification from the stroke samples players send while drawing
+# The host keeps its own record of every brush position per square and only accepts a
+# CLAIM when the coverage it computes itself reaches the capture threshold. Stroke samples
+# travel over the droppable datagram channel, so a CLAIM also carries every brush position
+# of the claimant's stroke as a packed bitmap; the host adds those to the samples it got,
+# and computes the same coverage the player's own board showed
+
+import base64
+import zlib
+import numpy as np
+from board import BoardModel, SQUARE_SIZE, NO_COLOR, color_code
+# The brush covers local offsets BRUSH_MIN..BRUSH_MAX-1 around each sample in both axes
+BRUSH_MIN = -4
+BRUSH_MAX = 6
+CLAIM_THRESHOLD = 50
+# Most stroke samples carried by one DRAW command, so a batch always fits in one datagram
+# (datagram.DATAGRAM_SIZE)
+MAX_STROKE_BATCH = 32
+
+# DRAW commands carry one or more local samples as "x,y;x,y;..."
+def format_points(points):
+    return ";".join(f"{x},{y}" for x, y in points)
+
+def parse_points(text):
+    xs, ys = [], []
+    for point in text.split(";"):
+        x, y = point.split(",")
+        xs.append(int(x))
+        ys.append(int(y))
+    return np.array(xs, dtype=np.intp), np.array(ys, dtype=np.intp)
+
+# A stroke's brush centres, a (SQUARE_SIZE, SQUARE_SIZE) boolean grid, as CLAIM carries
+# them: one bit per pixel, deflated and base64-encoded; a scribble packs to a few hundred bytes
+def pack_centers(centers):
+    return base64.b64encode(zlib.compress(np.packbits(centers).tobytes(), 1)).decode()
+
+# Raises ValueError or zlib.error for anything pack_centers didn't produce
+def unpack_centers(text):
+    size = SQUARE_SIZE * SQUARE_SIZE
+    packed = zlib.decompressobj().decompress(base64.b64decode(text, validate=True), size // 8)
+    if len(packed) != size // 8:
+        raise ValueError("stroke bitmap is the wrong size")
+    return np.unpackbits(np.frombuffer(packed, dtype=np.uint8)).view(bool).reshape(SQUARE_SIZE, SQUARE_SIZE)
+
+# pack_centers for a stroke given as local (x, y) points, as bots and benchmarks keep them
+def pack_points(points):
+    centers = np.zeros((SQUARE_SIZE, SQUARE_SIZE), dtype=bool)
+    for x, y in points:
+        if 0 <= x < SQUARE_SIZE and 0 <= y < SQUARE_SIZE:
+            centers[y, x] = True
+    return pack_centers(centers)
+
+# Boolean mask of brush-covered pixels for samples at local (xs, ys), with the offset of its
+# top-left corner; only the samples' bounding box plus the brush margin is dilated
+def stamp_mask(xs, ys):
+    inside = (xs >= 0) & (xs < SQUARE_SIZE) & (ys >= 0) & (ys < SQUARE_SIZE)
+    xs, ys = xs[inside], ys[inside]
+    if not len(xs):
+        return None, 0, 0
+    x0 = max(int(xs.min()) + BRUSH_MIN, 0)
+    y0 = max(int(ys.min()) + BRUSH_MIN, 0)
+    x1 = min(int(xs.max()) + BRUSH_MAX, SQUARE_SIZE)
+    y1 = min(int(ys.max()) + BRUSH_MAX, SQUARE_SIZE)
+    centers = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+    centers[ys - y0, xs - x0] = True
+    return brush_coverage(centers), x0, y0
+
+# Expand brush centre marks into covered pixels for any number of squares at once
+# centers has shape (..., SQUARE_SIZE, SQUARE_SIZE); the square brush is separable, so
+# dilating rows and then columns with one shifted OR per brush offset gives its footprint
+def brush_coverage(centers):
+    rows = _dilate(centers, axis=-2)
+    return _dilate(rows, axis=-1)
+
+# OR together copies of `mask` shifted by every brush offset along one axis
+def _dilate(mask, axis):
+    out = np.zeros(mask.shape, dtype=bool)
+    n = mask.shape[axis]
+    for d in range(BRUSH_MIN, BRUSH_MAX):
+        dst = [slice(None)] * mask.ndim
+        src = [slice(None)] * mask.ndim
+        if d >= 0:
+            dst[axis], src[axis] = slice(d, n), slice(0, n - d)
+        else:
+            dst[axis], src[axis] = slice(0, n + d), slice(-d, n)
+        out[tuple(dst)] |= mask[tuple(src)]
+    return out
+
+# Percentage of each square covered, for centers of shape (..., SQUARE_SIZE, SQUARE_SIZE)
+def coverage_percent(centers):
+    return brush_coverage(centers).mean(axis=(-2, -1)) * 100
+
+# Tracks, per square, which colour holds the lock and where its brush has been
+# Lock holders are the board model's lock matrix and brush centres are marked in its pixel
+# grids, so the host's verifier and its authoritative board are one block of memory
+class ClaimVerifier:
+    def __init__(self, board=None, threshold=CLAIM_THRESHOLD):
+        self.board = board if board is not None else BoardModel()
+        self.threshold = threshold
+        self.owners = self.board.locked
+        self.centers = self.board.pixels.view(bool)
+
+    # Start a new stroke for `color`; a square already locked by someone else is left alone
+    def lock(self, row, col, color):
+        code = color_code(color)
+        if self.owners[row, col] not in (NO_COLOR, code):
+            return False
+        self.owners[row, col] = code
+        self.centers[row, col] = False
+        return True
+
+    # Record one brush sample at local pixel (x, y) if `color` holds the square's lock
+    def record(self, row, col, x, y, color):
+        if self.owners[row, col] == color_code(color) and 0 <= x < SQUARE_SIZE and 0 <= y < SQUARE_SIZE:
+            self.centers[row, col, y, x] = True
+
+    # Record a batch of samples at local (xs, ys), the arrays parse_points returns
+    def record_points(self, row, col, xs, ys, color):
+        if self.owners[row, col] != color_code(color):
+            return
+        inside = (xs >= 0) & (xs < SQUARE_SIZE) & (ys >= 0) & (ys < SQUARE_SIZE)
+        self.centers[row, col, ys[inside], xs[inside]] = True
+
+    # Add the brush centres a CLAIM carries to those recorded from DRAW commands
+    def record_centers(self, row, col, centers, color):
+        if self.owners[row, col] == color_code(color):
+            self.centers[row, col] |= centers
+
+    # Forget the stroke and lock on a square after RESET, UNLOCK or CLAIM
+    def reset(self, row, col):
+        self.owners[row, col] = NO_COLOR
+        self.centers[row, col] = False
+
+    def coverage(self, row, col):
+        return float(coverage_percent(self.centers[row, col]))
+
+    # Coverage of every square on the board in one pass, shape (rows, cols)
+    def coverage_all(self):
+        return coverage_percent(self.centers)
+
+    # True if `color` holds the lock and its recorded stroke covers enough of the square
+    def verify(self, row, col, color):
+        if self.owners[row, col] != color_code(color):
+            return False
+        return self.coverage(row, col) >= self.threshold
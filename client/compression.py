@@ -0,0 +1,83 @@
+# Optional zlib compression of the host-to-client stream, negotiated at JOIN
+# The client offers it by adding "zlib" to its JOIN; the host answers with a plain
+# "COMPRESS:zlib\n" line and everything it sends after that is one deflate stream,
+# preset with a dictionary of the protocol's vocabulary and sync-flushed once per batch.
+# Inside the stream every message ends with a NUL byte, so messages never run together.
+# If compressing costs too much CPU the host ends the deflate stream after a final
+# "COMPRESS:off" message and carries on in plain text
+
+import zlib
+
+COMPRESS_ON = b"COMPRESS:zlib\n"
+COMPRESS_OFF = b"COMPRESS:off"
+SEPARATOR = b"\0"
+COMPRESSION_LEVEL = 6
+# Fraction of one core the host may spend compressing for one client, measured over
+# BUDGET_WINDOW seconds, before it turns compression off for that client
+CPU_BUDGET = 0.05
+BUDGET_WINDOW = 2.0
+
+# Preset dictionary: the strings most game messages are made of. zlib looks back from the
+# end of the dictionary first, so the most common fragments go last
+_COLORS = ("red", "blue", "green", "pink")
+ZDICT = (
+    b"SERVER_SHUTDOWN\0ERROR:PLAYERS:MSG:GAME:START\0"
+    + b"".join(f"GAME:UNLOCK:GAME:RESET:GAME:CLAIM:0,0:{c}\0GAME:LOCK:0,0:{c}\0".encode() for c in _COLORS)
+    + b"0,1,2,3,4,5,6,7,8,9,10;20;30;40;50;60;70;79"
+    + b"".join(f"\0GAME:DRAW:0,0:40,40;41,41;42,42:{c}\0GAME:CURSOR:{c}:400,300".encode() for c in _COLORS)
+)
+
+# True if the peer of a connected socket is this machine, where compression only costs CPU
+def is_local_peer(sock):
+    try:
+        peer = sock.getpeername()[0]
+        return peer.startswith("127.") or peer == "::1" or peer == sock.getsockname()[0]
+    except OSError:
+        return False
+
+# Host side: one deflate stream per client
+class StreamCompressor:
+    def __init__(self, level=COMPRESSION_LEVEL, zdict=ZDICT):
+        if zdict:
+            self.z = zlib.compressobj(level, zdict=zdict)
+        else:
+            self.z = zlib.compressobj(level)
+        self.plain_bytes = 0
+        self.compressed_bytes = 0
+
+    # Compress a batch of encoded messages and sync-flush, so the client can decode it all now
+    def compress(self, messages):
+        data = SEPARATOR.join(messages) + SEPARATOR
+        out = self.z.compress(data) + self.z.flush(zlib.Z_SYNC_FLUSH)
+        self.plain_bytes += len(data)
+        self.compressed_bytes += len(out)
+        return out
+
+    # Final bytes of the stream, announcing the switch back to plain text
+    def finish(self):
+        return self.z.compress(COMPRESS_OFF + SEPARATOR) + self.z.flush(zlib.Z_FINISH)
+
+    def ratio(self):
+        return self.plain_bytes / self.compressed_bytes if self.compressed_bytes else None
+
+# Client side: turns received bytes back into whole messages
+class StreamDecompressor:
+    def __init__(self, zdict=ZDICT):
+        if zdict:
+            self.z = zlib.decompressobj(zdict=zdict)
+        else:
+            self.z = zlib.decompressobj()
+        self.buffer = b""
+
+    # Feed received bytes; returns the complete messages they finish, decoded
+    def feed(self, data):
+        self.buffer += self.z.decompress(data)
+        *messages, self.buffer = self.buffer.split(SEPARATOR)
+        return [message.decode() for message in messages if message and message != COMPRESS_OFF]
+
+    # After the host ends the stream, any bytes past its end are plain text
+    def finished(self):
+        return self.z.eof
+
+    def unused_data(self):
+        return self.z.unused_data
@@ -0,0 +1,75 @@
+# Unreliable UDP side channel for high-rate, droppable game traffic
+# Cursor positions and in-progress stroke samples travel here so a lost packet never
+# delays the LOCK/UNLOCK/CLAIM/RESET commands that stay on the reliable TCP stream
+
+import itertools
+import socket
+
+# Commands that may be dropped or reordered without affecting game state
+UNRELIABLE_COMMANDS = ("CURSOR:", "DRAW:")
+HELLO = "HELLO"
+DATAGRAM_SIZE = 1024
+
+# Return True if a GAME command (without the GAME: prefix) can go over the datagram channel
+def is_unreliable(command):
+    return command.startswith(UNRELIABLE_COMMANDS)
+
+# Key used to detect out-of-date updates; only cursor positions are superseded,
+# stroke samples are additive so every one that arrives is still worth applying
+def staleness_key(addr, message):
+    if message.startswith("GAME:CURSOR:"):
+        return addr, message.rsplit(":", 1)[0]
+    return None
+
+# Sequence-numbered datagram socket, each datagram is "<seq>|<message>"
+class DatagramChannel:
+    def __init__(self, bind_addr=("0.0.0.0", 0)):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(bind_addr)
+        self.seq = itertools.count(1)
+        self.last_seq = {}
+        self.sent = 0
+        self.received = 0
+        self.stale = 0
+
+    # Local UDP port, advertised to the host in the JOIN message
+    def get_port(self):
+        return self.sock.getsockname()[1]
+
+    # Send one message, failures are ignored because delivery is best effort
+    def send(self, message, addr):
+        try:
+            self.sock.sendto(f"{next(self.seq)}|{message}".encode(), addr)
+            self.sent += 1
+        except OSError:
+            pass
+
+    # Block for the next datagram and return (message, addr)
+    # Returns (None, addr) for malformed or superseded datagrams
+    def receive(self):
+        data, addr = self.sock.recvfrom(DATAGRAM_SIZE)
+        try:
+            seq_str, message = data.decode().split("|", 1)
+            seq = int(seq_str)
+        except ValueError:
+            return None, addr
+        self.received += 1
+
+        key = staleness_key(addr, message)
+        if key is not None:
+            if seq <= self.last_seq.get(key, 0):
+                self.stale += 1
+                return None, addr
+            self.last_seq[key] = seq
+        return message, addr
+
+    # Drop sequence state for a peer that has disconnected
+    def forget(self, addr):
+        for key in [k for k in self.last_seq if k[0] == addr]:
+            del self.last_seq[key]
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
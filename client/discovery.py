@@ -0,0 +1,275 @@
+# LAN lobby discovery: hosts announce themselves by UDP broadcast, and the join screen lists
+# every lobby it hears with its player count and round-trip time
+# Hosts broadcast a beacon every ANNOUNCE_INTERVAL and answer probes at once; browsers listen
+# for beacons and probe every PROBE_INTERVAL to time the reply. All hosts and browsers on a
+# machine share DISCOVERY_PORT, so beacons and probes reach every one of them; replies go to
+# the probing browser's own port. A pre-warmer opens the TCP connection to a highlighted
+# lobby in the background, so joining skips the connect
+
+import select
+import socket
+import threading
+import time
+
+DISCOVERY_PORT = 25564
+ANNOUNCE_INTERVAL = 2.0
+PROBE_INTERVAL = 1.0
+# Lobbies not heard from for this long drop off the list
+LOBBY_TIMEOUT = 5.0
+# A pre-warmed connection that hasn't been used by then is closed and opened again
+PREWARM_TTL = 20.0
+BEACON = "DENY"
+PROBE = "DENY?"
+PROTOCOL_VERSION = "2"
+
+# Broadcast to the LAN, or only to this machine when there is no network to broadcast on
+def broadcast(sock, message):
+    for target in ("<broadcast>", "127.255.255.255"):
+        try:
+            sock.sendto(message.encode(), (target, DISCOVERY_PORT))
+            return
+        except OSError:
+            continue
+
+# A UDP socket on DISCOVERY_PORT that shares the port with every other game on this machine
+def open_shared_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.bind(("", DISCOVERY_PORT))
+    return sock
+
+# Host side: announce this lobby until stopped
+class Announcer:
+    def __init__(self, network):
+        self.network = network
+        self.sock = None
+        self.running = False
+
+    def start(self):
+        try:
+            self.sock = open_shared_socket()
+        except OSError as e:
+            print(f"LAN discovery unavailable, players must enter this host's address: {e}")
+            return self
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    # "DENY:<version>:<game port>:<players>:<probe stamp>:<host name>", the stamp empty in a
+    # beacon; the name goes last so whatever it contains can't shift the other fields
+    def describe(self, stamp=""):
+        network = self.network
+        with network.lock:
+            players = len(network.players)
+        return f"{BEACON}:{PROTOCOL_VERSION}:{network.port}:{players}:{stamp}:{network.username}"
+
+    def run(self):
+        last_beacon = 0.0
+        while self.running:
+            now = time.monotonic()
+            if now - last_beacon >= ANNOUNCE_INTERVAL:
+                last_beacon = now
+                broadcast(self.sock, self.describe())
+            try:
+                ready, _, _ = select.select([self.sock], [], [], max(0.0, last_beacon + ANNOUNCE_INTERVAL - now))
+                if not ready:
+                    continue
+                data, addr = self.sock.recvfrom(512)
+            except (OSError, ValueError):
+                break
+            message = data.decode(errors="replace")
+            # Echo the probe's stamp so the browser can time the round trip
+            if message.startswith(PROBE + ":"):
+                try:
+                    self.sock.sendto(self.describe(message[len(PROBE) + 1:]).encode(), addr)
+                except OSError:
+                    pass
+
+    def stop(self):
+        self.running = False
+        if self.sock:
+            self.sock.close()
+
+# One discovered lobby
+class Lobby:
+    def __init__(self, ip, port, host, players):
+        self.ip = ip
+        self.port = port
+        self.host = host
+        self.players = players
+        self.rtt = None
+        self.last_seen = time.monotonic()
+
+    def label(self):
+        if self.rtt is None:
+            rtt = "-"
+        else:
+            rtt = f"{self.rtt * 1000:.0f} ms" if self.rtt >= 0.001 else "<1 ms"
+        return f"{self.host}  {self.players} player{'s' if self.players != 1 else ''}  {rtt}"
+
+# Browser side: keeps the list of lobbies on the LAN fresh while running; `on_change` is
+# called from the browser thread whenever the list changes
+class LobbyBrowser:
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.lobbies = {}
+        self.lock = threading.Lock()
+        self.listener = None
+        self.prober = None
+        self.running = False
+
+    def start(self):
+        try:
+            self.listener = open_shared_socket()
+        except OSError as e:
+            print(f"LAN discovery unavailable: {e}")
+            self.listener = None
+        self.prober = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.prober.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.prober.bind(("", 0))
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        sockets = [s for s in (self.listener, self.prober) if s]
+        last_probe = 0.0
+        while self.running:
+            now = time.monotonic()
+            if now - last_probe >= PROBE_INTERVAL:
+                last_probe = now
+                broadcast(self.prober, f"{PROBE}:{time.perf_counter()}")
+                self.expire(now)
+            try:
+                ready, _, _ = select.select(sockets, [], [], max(0.0, last_probe + PROBE_INTERVAL - now))
+                for sock in ready:
+                    data, addr = sock.recvfrom(512)
+                    self.on_datagram(data.decode(errors="replace"), addr[0])
+            except (OSError, ValueError):
+                break
+
+    # A beacon, or a probe reply carrying the echoed stamp
+    def on_datagram(self, message, ip):
+        parts = message.split(":", 5)
+        if parts[0] != BEACON or len(parts) < 6 or parts[1] != PROTOCOL_VERSION:
+            return
+        host = parts[5]
+        try:
+            port, players = int(parts[2]), int(parts[3])
+            rtt = time.perf_counter() - float(parts[4]) if parts[4] else None
+        except ValueError:
+            return
+        with self.lock:
+            lobby = self.lobbies.get((ip, port))
+            changed = lobby is None or lobby.players != players or lobby.host != host
+            if lobby is None:
+                lobby = self.lobbies[ip, port] = Lobby(ip, port, host, players)
+            lobby.host = host
+            lobby.players = players
+            lobby.last_seen = time.monotonic()
+            if rtt is not None:
+                changed = changed or lobby.rtt is None or abs(rtt - lobby.rtt) > 0.001
+                lobby.rtt = rtt
+        if changed and self.on_change:
+            self.on_change()
+
+    def expire(self, now):
+        with self.lock:
+            gone = [key for key, lobby in self.lobbies.items() if now - lobby.last_seen > LOBBY_TIMEOUT]
+            for key in gone:
+                del self.lobbies[key]
+        if gone and self.on_change:
+            self.on_change()
+
+    # Lobbies heard from recently, closest first
+    def list(self):
+        with self.lock:
+            lobbies = list(self.lobbies.values())
+        return sorted(lobbies, key=lambda lobby: (lobby.rtt is None, lobby.rtt or 0, lobby.host))
+
+    def stop(self):
+        self.running = False
+        for sock in (self.listener, self.prober):
+            if sock:
+                sock.close()
+
+# Opens the TCP connection to the lobby the player is looking at before they press Join
+class Prewarmer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.target = None
+        self.sock = None
+        self.opened = 0.0
+
+    # Start connecting to (ip, port) unless that connection is already open or opening
+    def warm(self, ip, port):
+        with self.lock:
+            if self.target == (ip, port) and time.monotonic() - self.opened < PREWARM_TTL:
+                return
+            self.discard_locked()
+            self.target = (ip, port)
+            self.opened = time.monotonic()
+        threading.Thread(target=self.connect, args=((ip, port),), daemon=True).start()
+
+    def connect(self, target):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            return
+        with self.lock:
+            if self.target == target and self.sock is None:
+                self.sock = sock
+                return
+        sock.close()
+
+    # The open connection to (ip, port), or None if there isn't a fresh one; the caller owns it
+    def take(self, ip, port):
+        with self.lock:
+            if self.target != (ip, port) or self.sock is None or time.monotonic() - self.opened >= PREWARM_TTL:
+                return None
+            sock, self.sock, self.target = self.sock, None, None
+        # The host sends nothing before JOIN, so anything readable here is either the host
+        # closing the connection or stray bytes that are dropped
+        sock.setblocking(False)
+        try:
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    sock.close()
+                    return None
+        except BlockingIOError:
+            pass
+        except OSError:
+            sock.close()
+            return None
+        sock.setblocking(True)
+        return sock
+
+    def discard_locked(self):
+        if self.sock:
+            self.sock.close()
+        self.sock = None
+        self.target = None
+
+    def discard(self):
+        with self.lock:
+            self.discard_locked()
+
+# One browser and pre-warmer for the menus, started on first use so the list is already
+# filled in by the time the join screen opens
+_browser = None
+_prewarmer = Prewarmer()
+
+def get_browser(on_change=None):
+    global _browser
+    if _browser is None:
+        _browser = LobbyBrowser(on_change).start()
+    return _browser
+
+def get_prewarmer():
+    return _prewarmer
@@ -1,18 +1,24 @@
 # Implements the main game board and drawing logic for a multiplayer grid-based game
 # Handles network communication, user input, and game state updates
 
+import gc
 import os
+from collections import deque
 import pygame
 import numpy as np
 from network import NetworkManager
 from utils import Button
+from claims import SQUARE_SIZE, BRUSH_MIN, BRUSH_MAX, CLAIM_THRESHOLD, MAX_STROKE_BATCH
+from claims import format_points, parse_points, stamp_mask, pack_centers
+from board import BoardModel, GRID_SIZE, NO_COLOR, color_code, color_name
+from stats import get_store
+from tracing import TRACE_MARK, split_trace, traced
+from raster import StrokeRasterizer
 import time
 
 pygame.init()
 pygame.font.init()
 ASSETS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'images'))
-GRID_SIZE = 8
-SQUARE_SIZE = 80
 SIDE_WIDTH = 180
 WIDTH = SIDE_WIDTH + GRID_SIZE * SQUARE_SIZE
 HEIGHT = GRID_SIZE * SQUARE_SIZE
@@ -20,33 +26,112 @@ ANIMATION_SPEED = 2
 FONT = pygame.font.SysFont("Arial", 18)
 BIG_FONT = pygame.font.SysFont("Arial", 64)
 PLAYER_COLORS = ["red", "blue", "green", "pink"]
+# Ways a match can end, returned by GameBoard.run so the caller picks the next screen
+OUTCOME_MENU = "menu"
+OUTCOME_LOBBY = "lobby"
+OUTCOME_QUIT = "quit"
+WHITE_COLOR = pygame.Color(255, 255, 255)
+BLACK_COLOR = pygame.Color(0, 0, 0)
+# Generation 0 threshold used while a match is running; the frame loop no longer
+# allocates per frame, so collections can be made rare instead of forced
+GAME_GC_THRESHOLD = (50000, 20, 20)
+# Game state advances in fixed steps of 1/SIM_RATE seconds; frames are drawn at up to
+# RENDER_FPS and interpolate between the last two steps
+SIM_RATE = 60
+SIM_STEP = 1.0 / SIM_RATE
+RENDER_FPS = 60
+# Steps run back to back when catching up; past this the backlog is dropped rather than
+# letting a slow frame snowball into ever longer catch-up bursts
+MAX_STEPS_PER_FRAME = 10
+# Fraction of the way a remote cursor moves toward its latest position each step
+CURSOR_SMOOTHING = 0.3
+# The host releases a lock whose holder hasn't drawn for this many seconds
+LOCK_TIMEOUT = 10
+# Stroke batches at least this long are stamped by dilation instead of one sample at a time
+STAMP_DILATE_MIN = 64
+_COLOR_CACHE = {}
+# Pen images are loaded once and shared by every GameBoard
+_PEN_IMAGES = {}
+
+# Return a shared pygame.Color for a colour name, creating it only once
+def get_color(name):
+    color = _COLOR_CACHE.get(name)
+    if color is None:
+        color = pygame.Color(name)
+        _COLOR_CACHE[name] = color
+    return color
 
 # Represents a single grid square that can be drawn on by a player
+# The square's state lives in the board model's arrays; a Square is a view onto its cell
+# plus what is needed to draw it
 class Square:
-    def __init__(self, row, col):
+    def __init__(self, row, col, board=None):
         self.row = row
         self.col = col
+        self.board = board if board is not None else BoardModel()
+        self.cell = (row, col)
         self.rect = pygame.Rect(SIDE_WIDTH + col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-        self.claimed_by = None
-        self.drawing = False
-        self.drawing_color = None
-        self.locked_by = None
-        self.pixel_grid = np.zeros((SQUARE_SIZE, SQUARE_SIZE))
-    
+        self.pixel_grid = self.board.pixels[row, col]
+        # 8-bit palettized surface sharing pixel_grid's memory: index 0 is the
+        # transparent background and index 1 is the current drawing colour
+        self.stroke_surface = pygame.image.frombuffer(self.pixel_grid, (SQUARE_SIZE, SQUARE_SIZE), "P")
+        self.stroke_surface.set_colorkey(0)
+        self.stroke_color = None
+
+    @property
+    def claimed_by(self):
+        return color_name(self.board.claimed_cells[self.cell])
+
+    @claimed_by.setter
+    def claimed_by(self, color):
+        self.board.claimed_cells[self.cell] = color_code(color)
+
+    @property
+    def locked_by(self):
+        return color_name(self.board.locked_cells[self.cell])
+
+    @locked_by.setter
+    def locked_by(self, color):
+        self.board.locked_cells[self.cell] = color_code(color)
+
+    @property
+    def drawing(self):
+        return self.board.drawing_cells[self.cell]
+
+    @drawing.setter
+    def drawing(self, value):
+        self.board.drawing_cells[self.cell] = bool(value)
+
+    @property
+    def drawing_color(self):
+        return color_name(self.board.stroke_cells[self.cell])
+
+    @drawing_color.setter
+    def drawing_color(self, color):
+        self.board.stroke_cells[self.cell] = color_code(color)
+
+    # Simulation tick of the last LOCK or stroke on this square, for lock timeouts
+    @property
+    def lock_tick(self):
+        return self.board.lock_tick_cells[self.cell]
+
+    @lock_tick.setter
+    def lock_tick(self, tick):
+        self.board.lock_tick_cells[self.cell] = tick
+
     # Render the square's current state
     def draw(self, screen):
         if not self.claimed_by:
-            pygame.draw.rect(screen, (255, 255, 255), self.rect)
+            screen.fill(WHITE_COLOR, self.rect)
             if self.drawing and self.drawing_color:
-                color = pygame.Color(self.drawing_color)
-                for y in range(SQUARE_SIZE):
-                    for x in range(SQUARE_SIZE):
-                        if self.pixel_grid[y][x]:
-                            screen.fill(color, (self.rect.x + x, self.rect.y + y, 1, 1))
+                if self.stroke_color != self.drawing_color:
+                    self.stroke_surface.set_palette_at(1, get_color(self.drawing_color))
+                    self.stroke_color = self.drawing_color
+                screen.blit(self.stroke_surface, self.rect)
         else:
-            pygame.draw.rect(screen, pygame.Color(self.claimed_by), self.rect)
-        
-        pygame.draw.rect(screen, (0, 0, 0), self.rect, 2)
+            screen.fill(get_color(self.claimed_by), self.rect)
+
+        pygame.draw.rect(screen, BLACK_COLOR, self.rect, 2)
 
     # Check if a position is inside the square
     def contains(self, pos):
@@ -62,47 +147,80 @@ class Square:
     
     # Mark pixels in the square as filled based on mouse movement
     def update_drawing(self, mouse_pos):
-        if self.drawing and self.contains(mouse_pos):
-            local_x = mouse_pos[0] - self.rect.x
-            local_y = mouse_pos[1] - self.rect.y
-            
-            for dy in range(-4, 6):
-                for dx in range(-4, 6):
-                    px = local_x + dx
-                    py = local_y + dy
-                    if 0 <= px < SQUARE_SIZE and 0 <= py < SQUARE_SIZE:
-                        self.pixel_grid[py][px] = 1
+        if self.board.drawing_cells[self.cell] and self.contains(mouse_pos):
+            self.stamp(mouse_pos[0] - self.rect.x, mouse_pos[1] - self.rect.y)
+
+    # Fill the brush footprint around a local pixel position, clipped to the square
+    def stamp(self, local_x, local_y):
+        x0 = max(local_x + BRUSH_MIN, 0)
+        y0 = max(local_y + BRUSH_MIN, 0)
+        x1 = min(local_x + BRUSH_MAX, SQUARE_SIZE)
+        y1 = min(local_y + BRUSH_MAX, SQUARE_SIZE)
+        if x0 < x1 and y0 < y1:
+            self.pixel_grid[y0:y1, x0:x1] = 1
+
+    # Stamp a batch of local samples, xs and ys are integer arrays
+    # Dilation has a fixed cost of a few dozen numpy calls, so short batches (a frame's
+    # worth of motion) are cheaper stamped one slice at a time
+    def stamp_points(self, xs, ys):
+        if len(xs) < STAMP_DILATE_MIN:
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                if 0 <= x < SQUARE_SIZE and 0 <= y < SQUARE_SIZE:
+                    self.stamp(x, y)
+            return
+        mask, x0, y0 = stamp_mask(xs, ys)
+        if mask is not None:
+            h, w = mask.shape
+            self.pixel_grid[y0:y0 + h, x0:x0 + w] |= mask
     
     # Stop drawing and claim the square if more than 50% is filled
     def stop_drawing(self):
-        if self.drawing:
-            filled_pixels = np.sum(self.pixel_grid)
-            total_pixels = SQUARE_SIZE * SQUARE_SIZE
-            percentage = (filled_pixels / total_pixels) * 100
-            if percentage >= 50:
-                self.claimed_by = self.drawing_color
-            
+        board, cell = self.board, self.cell
+        if board.drawing_cells[cell]:
+            if self.coverage() >= CLAIM_THRESHOLD:
+                board.claimed_cells[cell] = board.stroke_cells[cell]
+
             self.reset_drawing()
+
+    # Percentage of the square covered by the current stroke
+    def coverage(self):
+        filled_pixels = np.count_nonzero(self.pixel_grid)
+        return (filled_pixels / (SQUARE_SIZE * SQUARE_SIZE)) * 100
     
     # Clear the drawing state of the square
     def reset_drawing(self):
-        self.drawing = False
-        self.drawing_color = None
-        self.locked_by = None
+        board, cell = self.board, self.cell
+        board.drawing_cells[cell] = False
+        board.stroke_cells[cell] = NO_COLOR
+        board.locked_cells[cell] = NO_COLOR
         self.pixel_grid.fill(0)
 
 # Main game interface and logic for handling drawing, network updates, and gameplay
 class GameBoard:
-    def __init__(self, network_manager):   
+    def __init__(self, network_manager, max_fps=RENDER_FPS, record_stats=True):
         self.network = network_manager
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        self.squares = [[Square(r, c) for c in range(GRID_SIZE)] for r in range(GRID_SIZE)]
-        self.clock = pygame.time.Clock()
+        self.board = BoardModel()
+        self.squares = [[Square(r, c, self.board) for c in range(GRID_SIZE)] for r in range(GRID_SIZE)]
+        # Other players' strokes, rasterized off the game thread and committed each frame
+        self.rasterizer = StrokeRasterizer(self.board)
+        self.max_fps = max_fps
+        self.tick = 0
+        self.frames = 0
+        # Messages from the network thread, applied on the game thread at the next step
+        self.inbox = deque()
         self.running = True
+        self.outcome = OUTCOME_MENU
         self.mouse_down = False
         self.current_square = None
+        # Brush centres of this player's stroke in progress, sent with its CLAIM
+        self.stroke_centers = np.zeros((SQUARE_SIZE, SQUARE_SIZE), dtype=bool)
+        # Trace id of the stroke in progress when the tracer sampled it, None otherwise
+        self.trace = None
+        # Remote cursors: latest received position, smoothed position now and one step ago
+        self.cursor_targets = {}
         self.other_cursors = {}
-        self.last_draw_time = 0
+        self.prev_cursors = {}
         self.last_cursor_update = 0
         self.last_cursor_pos = (0, 0)
         self.player_colors = {}
@@ -110,33 +228,70 @@ class GameBoard:
         self.cursor_img = None
         self.my_color = None
         self.winner = None
+        self.active_colors = set()
+        # Set when the player list changes, so update_cursors only looks for cursors of
+        # players who left then
+        self.prune_cursors = False
+        self.color_to_player = {}
+        self.ownership = {}
+        self.ownership_dirty = True
+        self.label_cache = {}
+        self.players_title = FONT.render("Players:", True, BLACK_COLOR)
+        self.victory_overlay = pygame.Surface((WIDTH, HEIGHT))
+        self.victory_overlay.set_alpha(180)
+        self.victory_overlay.fill(WHITE_COLOR)
+        self.victory_text = None
+        # Opened before the match so creating the database never happens mid-game; tools
+        # that drive a board without playing a match pass record_stats=False
+        self.stats = get_store() if record_stats and not network_manager.is_spectator else None
+        # A host that recovered its match from a checkpoint starts from its claims and locks;
+        # the recovered pixel grids hold brush centres for the verifier, not strokes to draw
+        if network_manager.is_host and network_manager.recovered:
+            self.board.claimed[:] = network_manager.board.claimed
+            self.board.locked[:] = network_manager.board.locked
         self.assign_colors()
         self.load_pen_images()
         self.update_cursor()
 
         self.network.set_message_handler(self.handle_game_message)
         self.exit_button = Button("EXIT", 20, HEIGHT - 60, 150, 50, self.return_to_main_menu)
-        self.mainmenu_button = Button("Main Menu", WIDTH // 2 - 75, HEIGHT // 2 + 40, 150, 50, self.return_to_main_menu)
+        if self.network.is_spectator:
+            self.victory_buttons = [
+                Button("Main Menu", WIDTH // 2 - 75, HEIGHT // 2 + 40, 150, 50, self.return_to_main_menu)
+            ]
+        else:
+            self.victory_buttons = [
+                Button("Main Menu", WIDTH // 2 - 160, HEIGHT // 2 + 40, 150, 50, self.return_to_main_menu),
+                Button("Rematch", WIDTH // 2 + 10, HEIGHT // 2 + 40, 150, 50, self.return_to_lobby)
+            ]
         self.network.set_player_update_handler(self.handle_player_update)
     
-    # Update internal player list and remove cursors of players who left
+    # Update the set of colours in play; cursors of players who left are pruned by step()
     def handle_player_update(self, players):
-        active_colors = set(self.player_colors.get(p) for p in players if p in self.player_colors)
-        stale_cursors = [color for color in self.other_cursors if color not in active_colors]
-        for color in stale_cursors:
-            del self.other_cursors[color]
+        # Spectators learn the player list from the feed after the board is created
+        if self.network.is_spectator:
+            self.assign_colors()
+        # Runs on the network thread: swap in a new set, cursors are pruned at the next step
+        self.active_colors = {self.player_colors[p] for p in players if p in self.player_colors}
+        self.prune_cursors = True
 
     # Assign a unique color to each player
     def assign_colors(self):
         with self.network.lock:
             for i, name in enumerate(self.network.players):
                 self.player_colors[name] = PLAYER_COLORS[i % len(PLAYER_COLORS)]
-            self.my_color = self.player_colors[self.network.username]
-        self.update_cursor()
+            # Spectators have no colour of their own
+            self.my_color = self.player_colors.get(self.network.username)
+            self.active_colors.update(self.player_colors.values())
+        self.color_to_player = {v: k for k, v in self.player_colors.items()}
+        self.ownership = {name: 0 for name in self.player_colors}
+        self.ownership_dirty = True
 
-    # Load pen cursor images for each color from assets
+    # Load pen cursor images for each color from assets, once per process
     def load_pen_images(self):
         for color in PLAYER_COLORS:
+            if color in _PEN_IMAGES:
+                continue
             try:
                 img = pygame.image.load(os.path.join(ASSETS_DIR, f"{color}_pen.png")).convert_alpha()
                 img = pygame.transform.scale(img, (40, 40))
@@ -145,24 +300,22 @@ class GameBoard:
                 offset_x = int(170 * scale_factor)
                 offset_y = int(840 * scale_factor)
                 
-                self.pen_images[color] = {
+                _PEN_IMAGES[color] = {
                     'image': img,
                     'offset': (offset_x, offset_y)
                 }
             except Exception as e:
                 print(f"Missing or failed to load image: images/{color}_pen.png")
-                self.pen_images[color] = {
+                _PEN_IMAGES[color] = {
                     'image': None,
                     'offset': (0, 0)
                 }
+        self.pen_images = _PEN_IMAGES
+
     # Send cursor position to the server and update local cursor
     def update_cursor(self):
-        current_time = pygame.time.get_ticks()
-        x, y = pygame.mouse.get_pos()
-        self.network.send_game_command(f"CURSOR:{self.my_color}:{x},{y}")
-        self.last_cursor_update = current_time
-        self.last_cursor_pos = (x, y)
-        
+        self.send_cursor_position(force=True)
+
         if self.my_color and self.pen_images.get(self.my_color, {}).get('image'):
             self.cursor_img = self.pen_images[self.my_color]
             pygame.mouse.set_visible(False)
@@ -170,21 +323,37 @@ class GameBoard:
             self.cursor_img = None
             pygame.mouse.set_visible(True)
 
+    # Send the local cursor position, skipping the send when the mouse hasn't moved
+    def send_cursor_position(self, force=False):
+        pos = pygame.mouse.get_pos()
+        if not force and pos == self.last_cursor_pos:
+            return
+        self.network.send_game_command(f"CURSOR:{self.my_color}:{pos[0]},{pos[1]}")
+        self.last_cursor_update = pygame.time.get_ticks()
+        self.last_cursor_pos = pos
+
     # Display player names, colors, and their ownership percentage on the screen
     def draw_players(self):
         y = 20
-        self.screen.blit(FONT.render("Players:", True, (0, 0, 0)), (20, y))
+        self.screen.blit(self.players_title, (20, y))
         y += 30
         percentages = self.calculate_ownership()
         for name in self.network.players:
             color = self.player_colors.get(name, "black")
             percent = percentages.get(name, 0)
-            label = f"{name} ({percent}%)"
 
-            pygame.draw.rect(self.screen, pygame.Color(color), (20, y, 20, 20))
-            self.screen.blit(FONT.render(label, True, (0, 0, 0)), (50, y))
+            self.screen.fill(get_color(color), (20, y, 20, 20))
+            self.screen.blit(self.get_player_label(name, percent), (50, y))
             y += 30
 
+    # Return the rendered "name (percent%)" label, re-rendering only when it changes
+    def get_player_label(self, name, percent):
+        cached = self.label_cache.get(name)
+        if cached is None or cached[0] != percent:
+            cached = (percent, FONT.render(f"{name} ({percent}%)", True, BLACK_COLOR))
+            self.label_cache[name] = cached
+        return cached[1]
+
     # Draw the entire game grid and exit button
     def draw_board(self):
         for row in self.squares:
@@ -192,39 +361,136 @@ class GameBoard:
                 square.draw(self.screen)
         self.exit_button.draw(self.screen)
 
-    # Main game loop, for processing events, updating screen, and checking win condition
+    # Main game loop: fixed-rate simulation steps, with frames drawn in between as time allows
+    # Returns how the match ended (OUTCOME_MENU, OUTCOME_LOBBY or OUTCOME_QUIT); the caller
+    # decides what to do with the connection and calls teardown()
     def run(self):
-        import gc
-        last_gc = 0
-        gc_interval = 60
-        
-        while self.running and self.network.running:
-            current_frame = pygame.time.get_ticks()
-            
-            if current_frame - last_gc > gc_interval * 1000/60:
-                gc.collect()
-                last_gc = current_frame
-            
-            self.update_cursor()
-            self.handle_events()
-            self.screen.fill((255, 255, 255))
-            self.draw_players()
-            self.draw_board()
-            self.draw_cursor()
-            
-            if not self.winner and self.is_board_full():
-                percentages = self.calculate_ownership()
-                max_squares = max(percentages.values())
-                winners = [name for name, count in percentages.items() if count == max_squares]
-                self.winner = winners[0]
-            if self.winner:
-                self.draw_victory_screen(self.winner)
+        # Long-lived setup objects are moved out of the collector's view and
+        # generation 0 is made large, so no full collection lands mid-match
+        old_threshold = gc.get_threshold()
+        gc.collect()
+        gc.freeze()
+        gc.set_threshold(*GAME_GC_THRESHOLD)
+        frame_interval = 1.0 / self.max_fps if self.max_fps else 0.0
+        previous = time.perf_counter()
+        next_frame = previous
+        lag = 0.0
+        try:
+            while self.running and self.network.running:
+                now = time.perf_counter()
+                lag += now - previous
+                previous = now
+                steps = 0
+                while lag >= SIM_STEP and steps < MAX_STEPS_PER_FRAME:
+                    self.step()
+                    lag -= SIM_STEP
+                    steps += 1
+                if lag >= SIM_STEP:
+                    lag = 0.0
+                if not (self.running and self.network.running):
+                    break
+
+                # Frames are skipped, never the simulation, when drawing can't keep up
+                if now >= next_frame:
+                    self.render(lag / SIM_STEP)
+                    next_frame = max(next_frame + frame_interval, now)
+
+                wake = min(now + SIM_STEP - lag, next_frame)
+                delay = wake - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            gc.set_threshold(*old_threshold)
+            gc.unfreeze()
+        return self.outcome
+
+    # Advance the game by one fixed step: input, queued network commands, remote cursors,
+    # lock timeouts and scoring; none of it depends on how often frames are drawn
+    def step(self):
+        self.tick += 1
+        self.handle_events()
+        self.send_cursor_position()
+        while self.inbox:
+            self.apply_game_message(self.inbox.popleft())
+        self.update_cursors()
+        if self.network.is_host and self.tick % SIM_RATE == 0:
+            self.expire_locks()
+
+        if not self.winner and self.is_board_full():
+            percentages = self.calculate_ownership()
+            max_squares = max(percentages.values())
+            self.winner = next(name for name, count in percentages.items() if count == max_squares)
+            self.network.end_match()
+            self.record_result()
+
+    # Draw one frame, `alpha` is how far the clock is between the last step and the next
+    def render(self, alpha):
+        self.rasterizer.commit()
+        self.screen.fill(WHITE_COLOR)
+        self.draw_players()
+        self.draw_board()
+        self.draw_cursor(alpha)
+        if self.winner:
+            self.draw_victory_screen(self.winner)
+        pygame.display.flip()
+        self.frames += 1
 
-            pygame.display.flip()
-            self.clock.tick(60)
+    # Ease each remote cursor toward its latest reported position, keeping the previous
+    # step's position for interpolation, and drop cursors of players who left
+    def update_cursors(self):
+        if self.prune_cursors:
+            self.prune_cursors = False
+            active = self.active_colors
+            for color in list(self.cursor_targets):
+                if color not in active:
+                    del self.cursor_targets[color]
+                    self.other_cursors.pop(color, None)
+                    self.prev_cursors.pop(color, None)
+        for color, (tx, ty) in self.cursor_targets.items():
+            current = self.other_cursors.get(color)
+            if current is None:
+                current = (tx, ty)
+            self.prev_cursors[color] = current
+            x, y = current
+            self.other_cursors[color] = (x + (tx - x) * CURSOR_SMOOTHING, y + (ty - y) * CURSOR_SMOOTHING)
 
-    # Render the player's own cursor and those of other players
-    def draw_cursor(self):
+    # Host only: reset squares whose lock holder hasn't drawn for LOCK_TIMEOUT seconds, e.g.
+    # after a lost UNLOCK or a player that froze mid-stroke
+    def expire_locks(self):
+        for row, col in self.board.stale_locks(self.tick - LOCK_TIMEOUT * SIM_RATE):
+            square = self.squares[row][col]
+            if square is self.current_square:
+                continue
+            square.lock_tick = self.tick
+            print(f"Lock on ({row},{col}) held by {square.locked_by} timed out")
+            self.network.send_game_command(f"RESET:{row},{col}")
+            self.network.send_game_command(f"UNLOCK:{row},{col}")
+
+    # Release everything the match held so the board can be collected while the
+    # connection lives on for a rematch
+    def teardown(self):
+        if self.network.message_handler == self.handle_game_message:
+            self.network.set_message_handler(None)
+        if self.network.player_update_handler == self.handle_player_update:
+            self.network.set_player_update_handler(None)
+        self.squares = []
+        self.board = None
+        self.rasterizer = None
+        self.current_square = None
+        self.inbox.clear()
+        self.cursor_targets.clear()
+        self.other_cursors.clear()
+        self.prev_cursors.clear()
+        self.label_cache.clear()
+        self.victory_overlay = None
+        self.victory_text = None
+        self.exit_button = None
+        self.victory_buttons = []
+        self.network.tracer.dump()
+        pygame.mouse.set_visible(True)
+
+    # Render the player's own cursor and those of other players, interpolated by `alpha`
+    def draw_cursor(self, alpha=1.0):
         if self.cursor_img and self.cursor_img['image']:
             x, y = pygame.mouse.get_pos()
             offset_x, offset_y = self.cursor_img['offset']
@@ -234,6 +500,9 @@ class GameBoard:
             )
 
         for color, (x, y) in self.other_cursors.items():
+            px, py = self.prev_cursors.get(color, (x, y))
+            x = px + (x - px) * alpha
+            y = py + (y - py) * alpha
             img_data = self.pen_images.get(color)
             if img_data and img_data['image']:
                 offset_x, offset_y = img_data['offset']
@@ -242,29 +511,35 @@ class GameBoard:
                     (x - offset_x, y - offset_y)
                 )
     # Process mouse and window events like drawing or quitting
+    # Motion samples are collected for the whole step and applied as one batch
     def handle_events(self):
+        motion = []
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.running = False
-                self.network.quit()
+                self.outcome = OUTCOME_QUIT
             
             if self.winner:
-                self.mainmenu_button.handle_event(event)
+                for button in self.victory_buttons:
+                    button.handle_event(event)
                 continue
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 self.mouse_down = True
-                self.handle_mouse_down(pygame.mouse.get_pos())
+                self.handle_mouse_down(event.pos)
             elif event.type == pygame.MOUSEBUTTONUP:
+                self.handle_mouse_motion(motion)
+                motion = []
                 self.mouse_down = False
                 self.handle_mouse_up()
             elif event.type == pygame.MOUSEMOTION and self.mouse_down:
-                self.handle_mouse_motion(pygame.mouse.get_pos())
+                motion.append(event.pos)
             
             self.exit_button.handle_event(event)
+        self.handle_mouse_motion(motion)
 
     # Start drawing when mouse button is pressed over an available square
     def handle_mouse_down(self, pos):
-        if self.winner:
+        if self.winner or self.network.is_spectator:
             return
         
         for row in self.squares:
@@ -273,74 +548,100 @@ class GameBoard:
                     if (square.locked_by is None or square.locked_by == self.my_color) and \
                     (square.claimed_by is None or square.claimed_by == self.my_color):
                         square.start_drawing(self.my_color)
+                        square.lock_tick = self.tick
                         self.current_square = square
-                        self.network.send_game_command(f"LOCK:{square.row},{square.col}:{self.my_color}")
+                        self.stroke_centers.fill(False)
+                        tracer = self.network.tracer
+                        self.trace = tracer.start()
+                        tracer.span(self.trace, "mouse_down", f"square {square.row},{square.col} {self.my_color}")
+                        self.network.send_game_command(
+                            traced(f"LOCK:{square.row},{square.col}:{self.my_color}", self.trace))
                         return
     
-    # Update the drawing area while dragging the mouse
-    def handle_mouse_motion(self, pos):
-        if self.winner or not self.current_square:
-            return
-            
-        current_time = pygame.time.get_ticks()
-        if current_time - self.last_draw_time < 1:
-            self.current_square.update_drawing(pos)
+    # Apply one step's motion samples to the square being drawn: stamp them all at once and
+    # send them as batched DRAW commands; leaving the square abandons the stroke
+    def handle_mouse_motion(self, positions):
+        if self.winner or not self.current_square or not positions:
             return
-            
-        if not self.current_square.contains(pos):
-            self.network.send_game_command(f"RESET:{self.current_square.row},{self.current_square.col}")
-            self.current_square.reset_drawing()
-            self.current_square = None
+
+        square = self.current_square
+        points = []
+        for pos in positions:
+            if not square.contains(pos):
+                self.network.tracer.span(self.trace, "reset_sent", "left the square")
+                self.network.send_game_command(traced(f"RESET:{square.row},{square.col}", self.trace))
+                square.reset_drawing()
+                self.current_square = None
+                return
+            points.append((pos[0] - square.rect.x, pos[1] - square.rect.y))
+
+        if not square.drawing:
             return
-        
-        self.current_square.update_drawing(pos)
-        local_x = pos[0] - self.current_square.rect.x
-        local_y = pos[1] - self.current_square.rect.y
-        self.network.send_game_command(
-            f"DRAW:{self.current_square.row},{self.current_square.col}:{local_x},{local_y}:{self.my_color}"
-        )
-        self.last_draw_time = current_time
+        xs = np.array([x for x, _ in points], dtype=np.intp)
+        ys = np.array([y for _, y in points], dtype=np.intp)
+        square.stamp_points(xs, ys)
+        self.stroke_centers[ys, xs] = True
+        for i in range(0, len(points), MAX_STROKE_BATCH):
+            self.network.tracer.span(self.trace, "draw_sent")
+            self.network.send_game_command(traced(
+                f"DRAW:{square.row},{square.col}:{format_points(points[i:i + MAX_STROKE_BATCH])}:{self.my_color}",
+                self.trace))
 
     # Stop drawing and decide whether to claim the square
     def handle_mouse_up(self):
         if self.winner or not self.current_square:
             return
             
-        if self.current_square.drawing:
-            filled_pixels = np.sum(self.current_square.pixel_grid)
-            total_pixels = SQUARE_SIZE * SQUARE_SIZE
-            percentage = (filled_pixels / total_pixels) * 100
-
-            if percentage >= 50:
-                self.network.send_game_command(
-                    f"CLAIM:{self.current_square.row},{self.current_square.col}:{self.my_color}"
-                )
-            else:
-                self.network.send_game_command(
-                    f"RESET:{self.current_square.row},{self.current_square.col}"
-                )
-                self.network.send_game_command(f"UNLOCK:{self.current_square.row},{self.current_square.col}")
-
-        self.current_square.stop_drawing()
+        # The host verifies claims against the stroke it received, so a claimed square
+        # keeps showing the stroke until the host answers with CLAIM or RESET
+        square = self.current_square
         self.current_square = None
+        tracer, trace = self.network.tracer, self.trace
+        if square.drawing and square.coverage() >= CLAIM_THRESHOLD:
+            tracer.span(trace, "claim_sent", f"coverage {square.coverage():.0f}%")
+            self.network.send_game_command(traced(
+                f"CLAIM:{square.row},{square.col}:{self.my_color}:{pack_centers(self.stroke_centers)}", trace))
+            return
+
+        if square.drawing:
+            tracer.span(trace, "reset_sent", f"coverage {square.coverage():.0f}%")
+            self.network.send_game_command(traced(f"RESET:{square.row},{square.col}", trace))
+            self.network.send_game_command(traced(f"UNLOCK:{square.row},{square.col}", trace))
+        square.reset_drawing()
 
-    # Process and apply incoming network game commands
+    # Network callback: queue a read of game commands for the next simulation step
     def handle_game_message(self, message):
+        self.inbox.append(message)
+
+    # Apply one read's worth of game commands to the board, on the game thread
+    def apply_game_message(self, message):
         MAX_MESSAGES_PER_FRAME = 20
         processed_count = 0
         messages = message.split("GAME:")[1:]
         messages = ["GAME:" + msg for msg in messages]
         last_messages = {}
+        # Trace ids of the messages kept above, to mark when a traced command takes effect;
+        # only a read with a trace mark in it is looked at for them
+        traces = {}
+        tracer = self.network.tracer
+        tracing = TRACE_MARK in message
         
         for msg in messages:
             if processed_count >= MAX_MESSAGES_PER_FRAME:
                 break
                 
             try:
+                if tracing:
+                    msg, trace = split_trace(msg)
+                    kind = msg.split(":")[1]
+                    if trace:
+                        tracer.span(trace, "recv_" + kind.lower())
+                    traces[kind] = trace
                 if msg.startswith("GAME:CLAIM:"):
                     last_messages["CLAIM"] = msg
                 elif msg.startswith("GAME:DRAW:"):
-                    last_messages["DRAW"] = msg
+                    # Every stroke batch is applied, not just the latest
+                    last_messages.setdefault("DRAW", []).append(msg)
                 elif msg.startswith("GAME:RESET:"):
                     last_messages["RESET"] = msg
                 elif msg.startswith("GAME:CURSOR:"):
@@ -349,6 +650,8 @@ class GameBoard:
                     last_messages["LOCK"] = msg
                 elif msg.startswith("GAME:UNLOCK:"):
                     last_messages["UNLOCK"] = msg
+                elif msg.startswith("GAME:START"):
+                    last_messages["START"] = msg
                     
                 processed_count += 1
             except:
@@ -364,51 +667,24 @@ class GameBoard:
                     if square.claimed_by is None:
                         square.claimed_by = color
                         square.drawing = False
-                        square.pixel_grid.fill(False)                  
+                        square.pixel_grid.fill(0)
+                        self.rasterizer.discard(row, col)
+                        self.ownership_dirty = True
                 elif msg_type == "DRAW":
-                    _, data = msg.split("GAME:DRAW:")
-                    coord_str, pixel_str, color = data.split(":")
-                    row, col = map(int, coord_str.split(","))
-                    px, py = map(int, pixel_str.split(","))
-                    square = self.squares[row][col]
-                    if square.claimed_by is None:
-                        if square.locked_by is None or square.locked_by == color:
-                            square.locked_by = color
-                            square.drawing = True
-                            square.drawing_color = color
-                            
-                            for dy in range(-4, 6):
-                                for dx in range(-4, 6):
-                                    brush_px = px + dx
-                                    brush_py = py + dy
-                                    if 0 <= brush_px < SQUARE_SIZE and 0 <= brush_py < SQUARE_SIZE:
-                                        square.pixel_grid[brush_py][brush_px] = True
+                    self.apply_strokes(msg)
                 elif msg_type == "RESET":
                     _, coord_str = msg.split("GAME:RESET:")
                     row, col = map(int, coord_str.split(","))
                     square = self.squares[row][col]
                     square.reset_drawing()
+                    self.rasterizer.discard(row, col)
                 elif msg_type == "CURSOR":
                     _, data = msg.split("GAME:CURSOR:")
                     color, pos_str = data.split(":")
-                    if color != self.my_color:
+                    # Smoothing happens per step in update_cursors
+                    if color != self.my_color and color in self.active_colors:
                         x, y = map(int, pos_str.split(","))
-                        
-                        if color in self.other_cursors:
-                            last_x, last_y = self.other_cursors[color]
-                            x = last_x + (x - last_x) * 0.3  
-                            y = last_y + (y - last_y) * 0.3
-                            
-                        self.other_cursors[color] = (x, y)
-                        
-                        if len(self.other_cursors) > 4:
-                            oldest = next(iter(self.other_cursors))
-                            del self.other_cursors[oldest]
-
-                        current_colors = set(self.player_colors[p] for p in self.network.players if p in self.player_colors)
-                        stale_cursors = [c for c in self.other_cursors if c not in current_colors]
-                        for c in stale_cursors:
-                            del self.other_cursors[c]            
+                        self.cursor_targets[color] = (x, y)
                 elif msg_type == "LOCK":
                     _, data = msg.split("GAME:LOCK:")
                     coord_str, color = data.split(":")
@@ -416,63 +692,137 @@ class GameBoard:
                     square = self.squares[row][col]
                     if square.claimed_by is None:
                         square.locked_by = color
+                        square.lock_tick = self.tick
+                elif msg_type == "START":
+                    # Players get a fresh board per match, spectators keep theirs and clear it
+                    if self.network.is_spectator:
+                        self.reset_board()
                 elif msg_type == "UNLOCK":
                     _, coord_str = msg.split("GAME:UNLOCK:")
                     row, col = map(int, coord_str.split(","))
                     square = self.squares[row][col]
                     if square.locked_by:
                         square.locked_by = None
+                if traces and msg_type != "DRAW":
+                    tracer.span(traces.get(msg_type), msg_type.lower() + "_applied")
 
             except Exception as e:
                 print(f"Invalid {msg_type} message: {msg} ({e})")
 
+    # Stamp one read's DRAW batches, grouped per square; a read with enough samples is
+    # rasterized on the worker pool and shows up at the next frame
+    def apply_strokes(self, draws):
+        board = self.board
+        strokes = {}
+        samples = 0
+        for draw in draws:
+            _, data = draw.split("GAME:DRAW:")
+            coord_str, pixel_str, color = data.split(":")
+            row, col = map(int, coord_str.split(","))
+            code = color_code(color)
+            # Stroke samples may arrive over the datagram channel before the LOCK
+            # or after the RESET, so only the reliable LOCK decides who is drawing
+            cell = (row, col)
+            if board.claimed_cells[cell] != NO_COLOR or board.locked_cells[cell] != code:
+                continue
+            board.lock_tick_cells[cell] = self.tick
+            board.drawing_cells[cell] = True
+            board.stroke_cells[cell] = code
+            xs, ys = parse_points(pixel_str)
+            samples += len(xs)
+            stroke = strokes.get(cell)
+            if stroke is None or stroke[0] != code:
+                strokes[cell] = (code, xs, ys)
+            else:
+                strokes[cell] = (code, np.concatenate((stroke[1], xs)), np.concatenate((stroke[2], ys)))
+        if self.rasterizer.wants(len(strokes), samples):
+            self.rasterizer.submit(strokes)
+            return
+        for (row, col), (_, xs, ys) in strokes.items():
+            self.squares[row][col].stamp_points(xs, ys)
+
+    # Clear every square and the winner for a new match
+    def reset_board(self):
+        self.rasterizer.discard_all()
+        self.board.clear()
+        self.winner = None
+        self.ownership_dirty = True
+
     # Check whether all squares on the board have been claimed
     def is_board_full(self):
-        for row in self.squares:
-            for square in row:
-                if not square.claimed_by:
-                    return False
-        return True
+        return self.board.is_full()
 
     # Compute how many squares each player owns, as a percentage
+    # The result dict is reused between calls and only recomputed after a claim
     def calculate_ownership(self):
-        color_to_player = {v: k for k, v in self.player_colors.items()}
-        counts = {name: 0 for name in self.player_colors}
-        total = GRID_SIZE * GRID_SIZE
+        if not self.ownership_dirty:
+            return self.ownership
+        percentages = self.ownership
+        for name in percentages:
+            percentages[name] = 0
 
-        for row in self.squares:
-            for square in row:
-                player_name = color_to_player.get(square.claimed_by)
-                if player_name:
-                    counts[player_name] += 1
+        for color, count in self.board.claim_counts().items():
+            player_name = self.color_to_player.get(color)
+            if player_name:
+                percentages[player_name] += count
 
-        percentages = {}
-        for name, count in counts.items():
-            percentages[name] = int((count / total) * 100)
+        total = GRID_SIZE * GRID_SIZE
+        for name in percentages:
+            percentages[name] = int((percentages[name] / total) * 100)
 
+        self.ownership_dirty = False
         return percentages
     
+    # Queue the finished match for the statistics store; the host adds its lock and claim
+    # analytics, which only it has. Spectators don't record matches
+    def record_result(self):
+        if self.stats is None:
+            return
+        counts = self.board.claim_counts()
+        percentages = self.calculate_ownership()
+        contention = self.network.get_contention_stats() if self.network.is_host else {}
+        per_color = contention.get("players", {})
+        players = []
+        for name, color in self.player_colors.items():
+            row = {"player": name, "color": color, "squares": counts.get(color, 0),
+                   "percent": percentages.get(name, 0), "won": name == self.winner}
+            stats = per_color.get(color)
+            if stats:
+                row.update(claims=stats["claims"], rejected=stats["rejected"], resets=stats["resets"],
+                           claim_ms=stats["claim_latency"].get("mean_ms"))
+            players.append(row)
+        self.stats.record_match({
+            "finished_at": time.time(), "recorded_by": self.network.username,
+            "role": "host" if self.network.is_host else "player", "winner": self.winner,
+            "duration_s": self.tick / SIM_RATE, "players": players,
+            "locks": contention.get("locks"), "collisions": contention.get("collisions"),
+            "wasted_strokes": contention.get("wasted_strokes"),
+            "claim_ms": contention.get("claim_latency", {}).get("mean_ms"),
+        })
+
     # Display the winning player's name and return to main menu option
     def draw_victory_screen(self, winner_name):
-        overlay = pygame.Surface((WIDTH, HEIGHT))
-        overlay.set_alpha(180)
-        overlay.fill((255, 255, 255))
-        self.screen.blit(overlay, (0, 0))
-        text = BIG_FONT.render(f"{winner_name} wins!", True, (0, 0, 0))
-        text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-        self.screen.blit(text, text_rect)
-        self.mainmenu_button.draw(self.screen)
+        self.screen.blit(self.victory_overlay, (0, 0))
+        if self.victory_text is None or self.victory_text[0] != winner_name:
+            text = BIG_FONT.render(f"{winner_name} wins!", True, BLACK_COLOR)
+            self.victory_text = (winner_name, text, text.get_rect(center=(WIDTH // 2, HEIGHT // 2)))
+        self.screen.blit(self.victory_text[1], self.victory_text[2])
+        for button in self.victory_buttons:
+            button.draw(self.screen)
 
     # End the game and return to the main menu screen
     def return_to_main_menu(self):
-        from menu import main_menu
         self.running = False
-        self.network.quit()
-        pygame.display.set_mode((600, 400))
-        pygame.mouse.set_visible(True)
-        main_menu()
+        self.outcome = OUTCOME_MENU
+
+    # End the game and go back to the lobby over the same connection for a rematch
+    def return_to_lobby(self):
+        self.running = False
+        self.outcome = OUTCOME_LOBBY
 
 if __name__ == "__main__":
     net = NetworkManager("brandonyang", 25565, is_host=True)
     board = GameBoard(net)
     board.run()
+    board.teardown()
+    net.quit()
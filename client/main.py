@@ -1,4 +1,4 @@
-from menu import main_menu
+from menu import main_menu, run_scenes
 
 if __name__ == "__main__":
-    main_menu()
\ No newline at end of file
+    run_scenes(main_menu)
\ No newline at end of file
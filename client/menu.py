@@ -3,9 +3,12 @@
 
 import pygame
 import sys
-from utils import Button, InputBox, ReadyButton
+from functools import partial
+from utils import Button, InputBox, ReadyButton, request_redraw, wait_for_events
 from network import NetworkManager
-from gameboard import GameBoard
+from gameboard import GameBoard, OUTCOME_LOBBY, OUTCOME_QUIT
+from stats import close_store
+from discovery import get_browser, get_prewarmer
 
 pygame.init()
 pygame.font.init()
@@ -18,12 +21,41 @@ BLUE = (0, 120, 215)
 TITLE_FONT = pygame.font.SysFont("Arial", 48, bold=True)
 MEDIUM_FONT = pygame.font.SysFont("Arial", 24)
 SMALL_FONT = pygame.font.SysFont("Arial", 16)
+CHAT_LINES = 10
+# Discovered lobbies shown on the join screen
+LOBBY_ROWS = 5
+LOBBY_ROW_HEIGHT = 26
 
-# Quit pygame and exit the program
+# Quit pygame and exit the program, saving any match results still queued
 def exit_game():
+    close_store()
     pygame.quit()
     sys.exit()
 
+# Run screens one after another. Each screen (scene) is a callable that returns the next
+# scene instead of calling it, so moving between screens never grows the call stack;
+# returning None ends the program
+def run_scenes(scene):
+    while scene is not None:
+        scene = scene()
+    exit_game()
+
+# Play one match on an open connection, then tear the board down and pick the next scene:
+# back to the same lobby for a rematch, or disconnect and go to the main menu
+def play_match(network):
+    board = GameBoard(network)
+    outcome = board.run()
+    board.teardown()
+    pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.mouse.set_visible(True)
+
+    if outcome == OUTCOME_LOBBY and network.running:
+        return LobbyScreen(network).run
+    network.quit()
+    if outcome == OUTCOME_QUIT:
+        return None
+    return main_menu
+
 # Represents the game lobby where players chat, toggle readiness, and wait for the game to start
 class LobbyScreen:
     def __init__(self, network_manager):
@@ -31,28 +63,40 @@ class LobbyScreen:
         self.input_box = InputBox(50, HEIGHT - 50, WIDTH - 100, 40, "Type your message...")
         self.exit_button = Button("Exit Lobby", WIDTH - 120, HEIGHT - 50, 100, 40, self.quit_lobby)
 
-        self.player_ready = {self.network.username: False}
+        # The network manager keeps the ready set between lobbies: on a rematch it holds
+        # whoever got back to the lobby and pressed Ready while this player was still on
+        # the victory screen
+        self.player_ready = self.network.ready
+        for p in self.network.players:
+            self.player_ready.setdefault(p, False)
+        self.player_ready.setdefault(self.network.username, False)
         self.ready_button = ReadyButton("Ready", 50, HEIGHT - 100, 120, 40, self.on_ready_toggle, self.network.username)
+        self.ready_button.ready = self.player_ready[self.network.username]
 
         if self.network.username not in self.network.players:
             self.network.players.append(self.network.username)
 
+        self.scroll_offset = 0
+        self.chat_surfaces = []
+        self.chat_cache_key = None
+
         self.network.set_message_handler(self.handle_network_message)
         self.network.set_player_update_handler(self.handle_player_update)
+        self.network.set_state_change_handler(request_redraw)
 
     # React to incoming READY or START messages from the server
     def handle_network_message(self, message):
         if message.startswith("GAME:READY:"):
             parts = message.split(":")
             if len(parts) == 4:
+                # The network manager has already recorded it in player_ready
                 is_ready = parts[2] == "1"
                 player = parts[3]
-                self.player_ready[player] = is_ready
 
                 if is_ready:
-                    self.network.messages.append(f"{player} is ready.")
+                    self.network.add_message(f"{player} is ready.")
                 else:
-                    self.network.messages.append(f"{player} is not ready.")
+                    self.network.add_message(f"{player} is not ready.")
 
                 with self.network.lock:
                     for p in self.network.players:
@@ -80,48 +124,72 @@ class LobbyScreen:
             all_ready = len(valid_players) > 0 and all(self.player_ready.get(p, False) for p in valid_players)
         if all_ready:
             print("All players are ready")
+            if self.network.is_host:
+                self.network.reset_match()
             self.network.send_game_command("START")
             self.handle_network_message("GAME:START")
     
-    # Run the main loop of the lobby screen until game starts or user exits
+    # Run the main loop of the lobby screen until game starts or user exits, then return
+    # the next scene
+    # The loop sleeps until input arrives or the network wakes it, and only redraws then
     def run(self):
         clock = pygame.time.Clock()
+        dirty = True
         while True:
             if not self.network.running:
-                print("[DEBUG] Disconnected from server, returning to main menu...")
-                from menu import main_menu
-                pygame.display.set_mode((600, 400))
-                pygame.mouse.set_visible(True)
-                main_menu()
-                return
-
-            for event in pygame.event.get():
+                return main_menu
+
+            if dirty:
+                self.draw()
+                pygame.display.flip()
+                dirty = False
+                clock.tick(60)
+
+            for event in wait_for_events():
+                dirty = True
                 if event.type == pygame.QUIT:
                     self.quit_lobby()
-                    return
+                    return None
                 if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
                     message = self.input_box.text.strip()
                     if message:
                         self.network.send_message(message)
                         self.input_box.text = ""
+                if event.type == pygame.MOUSEWHEEL:
+                    self.scroll_chat(event.y)
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_PAGEUP:
+                    self.scroll_chat(CHAT_LINES)
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_PAGEDOWN:
+                    self.scroll_chat(-CHAT_LINES)
                 if event.type == pygame.USEREVENT and event.dict.get("start_game"):
                     print("Launching GameBoard...")
-                    GameBoard(self.network).run()
-                    pygame.display.set_mode((600, 400))
-                    pygame.mouse.set_visible(True)
-                    main_menu()
-                    return
+                    return partial(play_match, self.network)
 
                 self.input_box.handle_event(event)
                 self.ready_button.handle_event(event)
                 action = self.exit_button.handle_event(event)
                 if action is not None:
                     self.quit_lobby()
-                    return
+                    return main_menu
 
-            self.draw()
-            pygame.display.flip()
-            clock.tick(60)
+    # Scroll back through chat history, positive amounts move towards older lines
+    def scroll_chat(self, amount):
+        with self.network.lock:
+            max_offset = self.network.messages.max_offset(CHAT_LINES)
+        self.scroll_offset = max(0, min(self.scroll_offset + amount, max_offset))
+
+    # Return the rendered chat lines for the current page, re-rendering only when
+    # the history or scroll position has changed since the last frame
+    def get_chat_surfaces(self):
+        with self.network.lock:
+            history = self.network.messages
+            key = (history.version, self.scroll_offset)
+            if key == self.chat_cache_key:
+                return self.chat_surfaces
+            lines = history.page(CHAT_LINES, self.scroll_offset)
+        self.chat_surfaces = [SMALL_FONT.render(line, True, BLACK) for line in lines]
+        self.chat_cache_key = key
+        return self.chat_surfaces
 
     # Handle toggling ready state and notify the server
     def on_ready_toggle(self, player_id, is_ready):
@@ -147,9 +215,8 @@ class LobbyScreen:
                 player_surf = SMALL_FONT.render(player, True, BLACK)
                 SCREEN.blit(player_surf, (WIDTH - 150, 50 + i * 25))
 
-            for i, message in enumerate(self.network.messages[-10:]):
-                msg_surf = SMALL_FONT.render(message, True, BLACK)
-                SCREEN.blit(msg_surf, (20, 80 + i * 20))
+        for i, msg_surf in enumerate(self.get_chat_surfaces()):
+            SCREEN.blit(msg_surf, (20, 80 + i * 20))
 
         self.input_box.draw(SCREEN)
         self.exit_button.draw(SCREEN)
@@ -180,24 +247,44 @@ def create_game_screen():
             return
 
         try:
-            network = NetworkManager(username, port, is_host=True)
+            network = NetworkManager(username, port, is_host=True, checkpoint=True)
             if not network.running:
                 raise Exception("Failed to start server")
-            LobbyScreen(network).run()
+            # A match this host crashed out of carries on where it was, players rejoin it
+            if network.recovered:
+                return partial(play_match, network)
+            return LobbyScreen(network).run
         except Exception:
             error_message = "Failed to create server"
 
     buttons = [
         Button("Create Server", WIDTH // 2 - 100, 300, 200, 50, try_create_server),
-        Button("Back", 20, HEIGHT - 70, 100, 40, lambda: "back")
+        Button("Back", 20, HEIGHT - 70, 100, 40, lambda: main_menu)
     ]
 
     clock = pygame.time.Clock()
+    dirty = True
 
     while True:
-        SCREEN.fill(WHITE)
+        if dirty:
+            SCREEN.fill(WHITE)
+            title_surf = TITLE_FONT.render("Create Game", True, BLUE)
+            SCREEN.blit(title_surf, (WIDTH // 2 - title_surf.get_width() // 2, 50))
+            username_box.draw(SCREEN)
+            port_box.draw(SCREEN)
+            for button in buttons:
+                button.draw(SCREEN)
+
+            if error_message:
+                error_surf = SMALL_FONT.render(error_message, True, (255, 0, 0))
+                SCREEN.blit(error_surf, (WIDTH // 2 - error_surf.get_width() // 2, 10))
+
+            pygame.display.flip()
+            dirty = False
+            clock.tick(60)
 
-        for event in pygame.event.get():
+        for event in wait_for_events():
+            dirty = True
             if event.type == pygame.QUIT:
                 exit_game()
 
@@ -205,30 +292,48 @@ def create_game_screen():
             port_box.handle_event(event)
             for button in buttons:
                 action = button.handle_event(event)
-                if action == "back":
-                    return
-
-        title_surf = TITLE_FONT.render("Create Game", True, BLUE)
-        SCREEN.blit(title_surf, (WIDTH // 2 - title_surf.get_width() // 2, 50))
-        username_box.draw(SCREEN)
-        port_box.draw(SCREEN)
-        for button in buttons:
-            button.draw(SCREEN)
-
-        if error_message:
-            error_surf = SMALL_FONT.render(error_message, True, (255, 0, 0))
-            SCREEN.blit(error_surf, (WIDTH // 2 - error_surf.get_width() // 2, 10))
-
-        pygame.display.flip()
-        clock.tick(60)
-
-
-# Render the UI to input server address and join an existing game
+                if action is not None:
+                    return action
+
+
+# Draw the lobbies found on the LAN, closest first, with the highlighted one filled in
+def draw_lobby_list(lobbies, panel, selected):
+    pygame.draw.rect(SCREEN, (235, 235, 235), panel)
+    title_surf = SMALL_FONT.render("Games on your network", True, BLACK)
+    SCREEN.blit(title_surf, (panel.x + 8, panel.y + 6))
+    if not lobbies:
+        empty_surf = SMALL_FONT.render("Looking for games...", True, (120, 120, 120))
+        SCREEN.blit(empty_surf, (panel.x + 8, panel.y + 6 + LOBBY_ROW_HEIGHT))
+    for i, lobby in enumerate(lobbies[:LOBBY_ROWS]):
+        row = lobby_row(panel, i)
+        if (lobby.ip, lobby.port) == selected:
+            pygame.draw.rect(SCREEN, BLUE, row)
+        text_surf = SMALL_FONT.render(lobby.label(), True, WHITE if (lobby.ip, lobby.port) == selected else BLACK)
+        SCREEN.blit(text_surf, (row.x + 6, row.y + 4))
+
+def lobby_row(panel, i):
+    return pygame.Rect(panel.x + 2, panel.y + 6 + (i + 1) * LOBBY_ROW_HEIGHT, panel.width - 4, LOBBY_ROW_HEIGHT)
+
+# Render the UI to input server address and join an existing game, or pick a game found on
+# the LAN; picking one connects to it in the background so joining doesn't wait
 def join_game_screen():
     error_message = ""
-    username_box = InputBox(WIDTH // 2 - 100, 120, 200, 40, "Username")
-    server_ip_box = InputBox(WIDTH // 2 - 100, 190, 200, 40, "Server IP")
-    port_box = InputBox(WIDTH // 2 - 100, 260, 200, 40, "Port", "25565")
+    username_box = InputBox(40, 110, 220, 40, "Username")
+    server_ip_box = InputBox(40, 170, 220, 40, "Server IP")
+    port_box = InputBox(40, 230, 220, 40, "Port", "25565")
+    browser = get_browser(request_redraw)
+    prewarmer = get_prewarmer()
+    lobby_panel = pygame.Rect(290, 110, 270, 160)
+    lobbies = []
+    selected = None
+
+    # Highlight a lobby: fill in its address and start connecting to it
+    def select_lobby(lobby):
+        nonlocal selected
+        selected = (lobby.ip, lobby.port)
+        server_ip_box.text = lobby.ip
+        port_box.text = str(lobby.port)
+        prewarmer.warm(lobby.ip, lobby.port)
 
     def try_join_server(username, server_ip, port_text):
         nonlocal error_message
@@ -239,83 +344,127 @@ def join_game_screen():
             return
         try:
             port = int(port_text)
-            network = NetworkManager(username, port, server_ip=server_ip)
+            server_ip = server_ip.strip()
+            network = NetworkManager(username, port, server_ip=server_ip,
+                                     connection=prewarmer.take(server_ip, port))
+            if not network.running:
+                raise Exception("Connection failed")
+            return LobbyScreen(network).run
+        except Exception as e:
+            error_message = "Failed to connect to server"
+
+    # Watch the match read-only, through the host or a spectator relay
+    def try_spectate(username, server_ip, port_text):
+        nonlocal error_message
+        error_message = ""
+        username = username.strip() or "spectator"
+        try:
+            port = int(port_text)
+            server_ip = server_ip.strip()
+            network = NetworkManager(username, port, server_ip=server_ip, spectate=True,
+                                     connection=prewarmer.take(server_ip, port))
             if not network.running:
                 raise Exception("Connection failed")
-            LobbyScreen(network).run()
+            return partial(play_match, network)
         except Exception as e:
             error_message = "Failed to connect to server"
 
     buttons = [
         Button(
             "Join Server",
-            WIDTH // 2 - 100,
+            WIDTH // 2 - 210,
             330,
             200,
             50,
             lambda: try_join_server(username_box.text, server_ip_box.text, port_box.text)
         ),
-        Button("Back", 20, HEIGHT - 70, 100, 40, lambda: "back")
+        Button(
+            "Spectate",
+            WIDTH // 2 + 10,
+            330,
+            200,
+            50,
+            lambda: try_spectate(username_box.text, server_ip_box.text, port_box.text)
+        ),
+        Button("Back", 20, HEIGHT - 70, 100, 40, lambda: main_menu)
     ]
 
     clock = pygame.time.Clock()
+    dirty = True
     while True:
-        SCREEN.fill(WHITE)
+        if dirty:
+            lobbies = browser.list()
+            SCREEN.fill(WHITE)
+            title_surf = TITLE_FONT.render("Join Game", True, BLUE)
+            SCREEN.blit(title_surf, (WIDTH // 2 - title_surf.get_width() // 2, 40))
+            username_box.draw(SCREEN)
+            server_ip_box.draw(SCREEN)
+            port_box.draw(SCREEN)
+            draw_lobby_list(lobbies, lobby_panel, selected)
 
-        for event in pygame.event.get():
+            for button in buttons:
+                button.draw(SCREEN)
+
+            if error_message:
+                error_surf = SMALL_FONT.render(error_message, True, (255, 0, 0))
+                SCREEN.blit(error_surf, (WIDTH // 2 - error_surf.get_width() // 2, 10))
+
+            pygame.display.flip()
+            dirty = False
+            clock.tick(60)
+
+        for event in wait_for_events():
+            dirty = True
             if event.type == pygame.QUIT:
                 exit_game()
 
             username_box.handle_event(event)
             server_ip_box.handle_event(event)
             port_box.handle_event(event)
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                for i, lobby in enumerate(lobbies[:LOBBY_ROWS]):
+                    if lobby_row(lobby_panel, i).collidepoint(event.pos):
+                        select_lobby(lobby)
 
             for button in buttons:
                 action = button.handle_event(event)
-                if action == "back":
-                    return
-
-        title_surf = TITLE_FONT.render("Join Game", True, BLUE)
-        SCREEN.blit(title_surf, (WIDTH // 2 - title_surf.get_width() // 2, 50))
-        username_box.draw(SCREEN)
-        server_ip_box.draw(SCREEN)
-        port_box.draw(SCREEN)
-
-        for button in buttons:
-            button.draw(SCREEN)
-
-        if error_message:
-            error_surf = SMALL_FONT.render(error_message, True, (255, 0, 0))
-            SCREEN.blit(error_surf, (WIDTH // 2 - error_surf.get_width() // 2, 10))
-
-        pygame.display.flip()
-        clock.tick(60)
+                if action is not None:
+                    if action is main_menu:
+                        prewarmer.discard()
+                    return action
 
 # Display the game's main menu with options to create, join, or exit the game
 def main_menu():
+    # Start listening for LAN games now, so the join screen opens with the list filled in
+    get_browser(request_redraw)
     buttons = [
-        Button("Create a Game", WIDTH // 2 - 100, 160, 200, 50, create_game_screen),
-        Button("Join a Game", WIDTH // 2 - 100, 230, 200, 50, join_game_screen),
-        Button("Exit", WIDTH // 2 - 100, 300, 200, 50, exit_game)
+        Button("Create a Game", WIDTH // 2 - 100, 160, 200, 50, lambda: create_game_screen),
+        Button("Join a Game", WIDTH // 2 - 100, 230, 200, 50, lambda: join_game_screen),
+        Button("Exit", WIDTH // 2 - 100, 300, 200, 50, lambda: exit_game)
     ]
 
     clock = pygame.time.Clock()
+    dirty = True
 
     while True:
-        SCREEN.fill(WHITE)
+        if dirty:
+            SCREEN.fill(WHITE)
+            title_surf = TITLE_FONT.render("Deny and Conquer", True, BLUE)
+            title_rect = title_surf.get_rect(center=(WIDTH // 2, 60))
+            SCREEN.blit(title_surf, title_rect)
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                exit_game()
             for button in buttons:
-                button.handle_event(event)
-
-        title_surf = TITLE_FONT.render("Deny and Conquer", True, BLUE)
-        title_rect = title_surf.get_rect(center=(WIDTH // 2, 60))
-        SCREEN.blit(title_surf, title_rect)
+                button.draw(SCREEN)
 
-        for button in buttons:
-            button.draw(SCREEN)
+            pygame.display.flip()
+            dirty = False
+            clock.tick(60)
 
-        pygame.display.flip()
-        clock.tick(60)
+        for event in wait_for_events():
+            dirty = True
+            if event.type == pygame.QUIT:
+                exit_game()
+            for button in buttons:
+                action = button.handle_event(event)
+                if action is not None:
+                    return action
@@ -0,0 +1,456 @@
+# Host migration: keeps a standby peer ready to take over the match when the host goes away
+# The host sends a heartbeat datagram to every player and names its successor in it; every
+# player pings the host and each other and reports its average round-trip time, and the
+# player with the lowest average becomes the standby. The standby holds a second TCP link
+# to the host on which it receives snapshots of the authoritative board. When the host's
+# connection closes, fails to answer a probe after the heartbeats stop, or the host hands
+# over on purpose, the standby starts hosting on a socket it has been listening on since it
+# joined and every other player reconnects to it
+
+import base64
+import socket
+import threading
+import time
+import zlib
+import numpy as np
+from board import GRID_SIZE, SQUARE_SIZE, buffer_size
+from spectator import LineReader
+
+HEARTBEAT_INTERVAL = 0.1
+# Players probe the host over TCP after this long without hearing from it, and treat it as
+# gone if the probe isn't answered within PROBE_TIMEOUT; a stall on the datagram path alone
+# never moves the match
+HOST_TIMEOUT = 1.5
+PROBE_TIMEOUT = 1.0
+PING_INTERVAL = 0.5
+ROSTER_INTERVAL = 1.0
+SNAPSHOT_INTERVAL = 0.1
+# Weight of the newest sample in each peer's round-trip estimate
+RTT_SMOOTHING = 0.3
+# The standby only changes when a candidate's average is below this fraction of its own
+STANDBY_MARGIN = 0.8
+# Players the new host waits for after taking over, before dropping them from the match
+REJOIN_TIMEOUT = 3.0
+# How long players reconnecting to the successor wait for it to answer: it starts hosting
+# only once it has found the host gone itself
+TAKEOVER_TIMEOUT = HOST_TIMEOUT + PROBE_TIMEOUT + 1.0
+MIGRATION_PREFIXES = ("PING:", "PONG:", "PEERS:", "RTT:")
+# The board buffer holds the small per-square arrays first and every square's pixel grid
+# after them
+CELL_BYTES = SQUARE_SIZE * SQUARE_SIZE
+HEAD_BYTES = buffer_size() - GRID_SIZE * GRID_SIZE * CELL_BYTES
+
+# Newline-framed board snapshot for the standby link; the board buffer is mostly empty
+# pixel grids, so it shrinks to a few KB
+def encode_state(seq, host, players, buffer):
+    data = base64.b64encode(zlib.compress(buffer.tobytes(), 1)).decode()
+    return f"STATE:{seq}:{host}:{','.join(players)}:{data}\n".encode()
+
+# Returns (seq, host, players, buffer as a uint8 array)
+def decode_state(line):
+    _, seq, host, players, data = line.split(":", 4)
+    buffer = np.frombuffer(zlib.decompress(base64.b64decode(data)), dtype=np.uint8)
+    return int(seq), host, [p for p in players.split(",") if p], buffer
+
+# What changed since the `previous` buffer sent: the per-square arrays, and the pixel grids
+# of only the squares whose grid differs. Grids are compared as 8-byte words
+def encode_delta(seq, host, players, buffer, previous):
+    pixels = buffer[HEAD_BYTES:].reshape(-1, CELL_BYTES)
+    before = previous[HEAD_BYTES:].reshape(-1, CELL_BYTES)
+    changed = np.flatnonzero((pixels.view(np.uint64) != before.view(np.uint64)).any(axis=1))
+    data = buffer[:HEAD_BYTES].tobytes() + pixels[changed].tobytes()
+    data = base64.b64encode(zlib.compress(data, 1)).decode()
+    cells = ",".join(map(str, changed.tolist()))
+    return f"DELTA:{seq}:{host}:{','.join(players)}:{cells}:{data}\n".encode()
+
+# Apply a DELTA line to the buffer of the last state; returns the new state like decode_state
+def apply_delta(line, buffer):
+    _, seq, host, players, cells, data = line.split(":", 5)
+    data = np.frombuffer(zlib.decompress(base64.b64decode(data)), dtype=np.uint8)
+    buffer = buffer.copy()
+    buffer[:HEAD_BYTES] = data[:HEAD_BYTES]
+    changed = [int(cell) for cell in cells.split(",") if cell]
+    buffer[HEAD_BYTES:].reshape(-1, CELL_BYTES)[changed] = data[HEAD_BYTES:].reshape(-1, CELL_BYTES)
+    return int(seq), host, [p for p in players.split(",") if p], buffer
+
+# Smoothed round-trip times to a set of peers, in seconds
+class RttTable:
+    def __init__(self):
+        self.rtt = {}
+
+    def record(self, key, sample):
+        old = self.rtt.get(key)
+        self.rtt[key] = sample if old is None else old + (sample - old) * RTT_SMOOTHING
+
+    def forget(self, key):
+        self.rtt.pop(key, None)
+
+    def average(self):
+        return sum(self.rtt.values()) / len(self.rtt) if self.rtt else None
+
+# Host side of the standby link: sends the whole board once, then whatever changed each
+# time the board has changed
+class StandbyLink:
+    def __init__(self, network, sock, name):
+        self.network = network
+        self.sock = sock
+        self.name = name
+        self.open = True
+        self.seq = 0
+        self.last = None
+        self.sent_bytes = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while self.open and self.network.running:
+            self.send_state()
+            time.sleep(SNAPSHOT_INTERVAL)
+        self.close()
+
+    def send_state(self, force=False):
+        network = self.network
+        with network.lock:
+            snapshot = network.board.snapshot()
+            players = list(network.players)
+        if not force and self.last is not None and np.array_equal(snapshot, self.last[0]) \
+                and players == self.last[1]:
+            return True
+        self.seq += 1
+        if self.last is None:
+            line = encode_state(self.seq, network.username, players, snapshot)
+        else:
+            line = encode_delta(self.seq, network.username, players, snapshot, self.last[0])
+        try:
+            self.sock.sendall(line)
+        except OSError:
+            self.open = False
+            return False
+        self.sent_bytes += len(line)
+        self.last = (snapshot, players)
+        return True
+
+    # Final snapshot, then tell the standby to take over now
+    def promote(self):
+        ok = self.send_state(force=True)
+        try:
+            self.sock.sendall(b"PROMOTE\n")
+        except OSError:
+            ok = False
+        self.close()
+        return ok
+
+    def close(self):
+        self.open = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+# Liveness, round-trip times and succession for one NetworkManager, in either role
+class Migration:
+    def __init__(self, network):
+        self.network = network
+        self.rtt = RttTable()
+        # Player side: who the host is, who takes over from it and where to reach them
+        self.host_name = None
+        self.successor = None
+        self.last_heard = None
+        self.probed_at = None
+        self.peers = {}
+        self.state = None
+        self.link = None
+        self.link_closed = threading.Event()
+        # Last word from the host before it was lost, and when that loss was noticed; the
+        # last host change split into the time to notice it and the time to get back in
+        self.lost_at = None
+        self.detected_at = None
+        self.last_handoff = None
+        self.last_detection = None
+        self.last_takeover = None
+        # Host side: each player's reported average, and the standby picked from them
+        self.reports = {}
+        self.standby = None
+        self.standby_link = None
+        self.last_ping = 0.0
+        self.last_roster = 0.0
+        self.last_pick = 0.0
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while self.running and self.network.running:
+            now = time.monotonic()
+            try:
+                if self.network.is_host:
+                    self.host_tick(now)
+                elif not self.network.is_spectator:
+                    self.player_tick(now)
+            except Exception as e:
+                print(f"Migration error: {e}")
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def stop(self):
+        self.running = False
+        if self.standby_link:
+            self.standby_link.close()
+        if self.link:
+            try:
+                self.link.close()
+            except OSError:
+                pass
+
+    # Host: heartbeat with the successor's address, roster for peer pings, standby choice
+    def host_tick(self, now):
+        network = self.network
+        if not network.udp:
+            return
+        if now - self.last_pick >= ROSTER_INTERVAL:
+            self.last_pick = now
+            self.pick_standby()
+        successor = ""
+        if self.standby:
+            name, ip, port = self.standby
+            successor = f"{name}@{ip}:{port}"
+        with network.lock:
+            peers = [(network.streams[c].name, addr) for c, addr in network.udp_peers.items()
+                     if c in network.udp_active and c in network.streams]
+        for _, addr in peers:
+            network.udp.send(f"PING:{time.perf_counter()}:{network.username}:{successor}", addr)
+        if now - self.last_roster >= ROSTER_INTERVAL:
+            self.last_roster = now
+            roster = ",".join(f"{name}@{ip}:{port}" for name, (ip, port) in peers if name)
+            for _, addr in peers:
+                network.udp.send(f"PEERS:{roster}", addr)
+
+    # Host: the player with the lowest reported average round-trip time stands by, with
+    # some hysteresis so the choice doesn't flap between players with similar links
+    def pick_standby(self):
+        network = self.network
+        candidates = network.get_successor_candidates()
+        if not candidates:
+            self.standby = None
+            return
+        current = self.standby[0] if self.standby else None
+        best = min(candidates, key=lambda name: self.reports.get(name, float("inf")))
+        if current in candidates:
+            best_rtt = self.reports.get(best)
+            current_rtt = self.reports.get(current)
+            if best_rtt is None or current_rtt is None or best_rtt >= current_rtt * STANDBY_MARGIN:
+                best = current
+        if best != current:
+            rtt = self.reports.get(best)
+            print(f"Standby host is now {best}" + (f" (average RTT {rtt * 1000:.1f} ms)" if rtt is not None else ""))
+            if self.standby_link:
+                self.standby_link.close()
+                self.standby_link = None
+        self.standby = (best,) + candidates[best]
+
+    # Host: the standby has opened its state link
+    def attach_standby(self, sock, name):
+        if not self.standby or self.standby[0] != name:
+            sock.close()
+            return
+        if self.standby_link:
+            self.standby_link.close()
+        self.standby_link = StandbyLink(self.network, sock, name)
+
+    # Host: promote the standby and return its (name, ip, port), or None if there isn't one
+    # ready; clients that lose the host afterwards reconnect to it on their own
+    def hand_off(self):
+        link = self.standby_link
+        if not link or not link.open:
+            return None
+        if not link.promote():
+            return None
+        self.standby_link = None
+        return self.standby
+
+    # Player: ping the host and the other players, report the average, watch for host loss
+    def player_tick(self, now):
+        network = self.network
+        if not network.udp or not network.udp_server_addr:
+            return
+        if now - self.last_ping >= PING_INTERVAL:
+            self.last_ping = now
+            stamp = time.perf_counter()
+            network.udp.send(f"PING:{stamp}", network.udp_server_addr)
+            for addr in self.peers.values():
+                network.udp.send(f"PING:{stamp}", addr)
+            average = self.rtt.average()
+            if average is not None:
+                network.udp.send(f"RTT:{average}", network.udp_server_addr)
+        if self.last_heard is None or now - self.last_heard <= HOST_TIMEOUT or self.lost_at is not None:
+            return
+        if self.probed_at is None:
+            print(f"No word from the host for {now - self.last_heard:.2f} s, probing its connection")
+            self.probed_at = now
+            if not network.probe_host():
+                network.drop_host_connection()
+        elif now - self.probed_at > PROBE_TIMEOUT:
+            print(f"The host did not answer the probe in {PROBE_TIMEOUT:.1f} s")
+            network.drop_host_connection()
+
+    # Player: note that the host is alive
+    def heard_from_host(self):
+        self.last_heard = time.monotonic()
+        self.probed_at = None
+
+    # Any migration datagram, in either role
+    def on_datagram(self, message, addr):
+        network = self.network
+        kind, _, rest = message.partition(":")
+        if kind == "PING":
+            stamp, _, extra = rest.partition(":")
+            # The reply carries this end's wall clock too, for the trace clock offsets
+            network.udp.send(f"PONG:{stamp}:{time.time()}", addr)
+            if not network.is_host and addr == network.udp_server_addr:
+                self.heard_from_host()
+                self.on_heartbeat(extra)
+        elif kind == "PONG":
+            stamp, _, wall = rest.partition(":")
+            try:
+                sample = time.perf_counter() - float(stamp)
+            except ValueError:
+                return
+            if network.is_host:
+                name = network.name_for_address(addr)
+                if name:
+                    self.rtt.record(name, sample)
+            else:
+                self.rtt.record(addr, sample)
+                if wall and addr == network.udp_server_addr:
+                    try:
+                        network.tracer.note_host_clock(float(wall), sample)
+                    except ValueError:
+                        pass
+        elif kind == "PEERS" and not network.is_host and addr == network.udp_server_addr:
+            peers = {}
+            for entry in rest.split(","):
+                name, _, where = entry.partition("@")
+                ip, _, port = where.rpartition(":")
+                if name and name != network.username and port.isdigit():
+                    peers[name] = (ip, int(port))
+            for addr_gone in set(self.peers.values()) - set(peers.values()):
+                self.rtt.forget(addr_gone)
+            self.peers = peers
+        elif kind == "RTT" and network.is_host:
+            name = network.name_for_address(addr)
+            if name:
+                try:
+                    self.reports[name] = float(rest)
+                except ValueError:
+                    pass
+
+    # Player: the heartbeat names the host and its successor as "name@ip:port"
+    def on_heartbeat(self, extra):
+        host, _, successor = extra.partition(":")
+        self.host_name = host or self.host_name
+        if not successor:
+            self.successor = None
+            return
+        name, _, where = successor.partition("@")
+        ip, _, port = where.rpartition(":")
+        if not port.isdigit():
+            return
+        # The host reports the address it sees, which is loopback for a player on its own
+        # machine; everyone else reaches that player at the host's address
+        if ip.startswith("127.") and name != self.network.username:
+            ip = self.network.server_ip
+        self.successor = (name, ip, int(port))
+        if name == self.network.username and self.link is None:
+            self.open_standby_link()
+
+    # Standby: open the state link to the host and keep the latest snapshot it sends
+    def open_standby_link(self):
+        network = self.network
+        try:
+            sock = socket.create_connection((network.server_ip, network.port), timeout=2.0)
+            sock.settimeout(None)
+            sock.sendall(f"STANDBY:{network.username}\n".encode())
+        except OSError as e:
+            print(f"Could not open standby link: {e}")
+            return
+        self.link = sock
+        self.link_closed.clear()
+        threading.Thread(target=self.follow_state, args=(sock,), daemon=True).start()
+
+    def follow_state(self, sock):
+        reader = LineReader(sock)
+        promote = False
+        while self.running:
+            try:
+                lines = reader.read_lines(65536)
+            except (OSError, ValueError):
+                break
+            if not lines:
+                break
+            for line in lines:
+                if line == "PROMOTE":
+                    promote = True
+                    continue
+                try:
+                    if line.startswith("STATE:"):
+                        self.state = decode_state(line)
+                    elif line.startswith("DELTA:") and self.state is not None:
+                        self.state = apply_delta(line, self.state[3])
+                except Exception as e:
+                    print(f"Bad state snapshot: {e}")
+        try:
+            sock.close()
+        except OSError:
+            pass
+        if self.link is sock:
+            self.link = None
+            self.link_closed.set()
+        if promote:
+            self.network.drop_host_connection()
+
+    # Player: the host connection ended without SERVER_SHUTDOWN, either closed by the host's
+    # end or dropped here after an unanswered probe; take over if we are the successor,
+    # reconnect to the successor otherwise. Returns False if there is none
+    def take_over(self):
+        successor = self.successor
+        if not successor:
+            return False
+        now = time.monotonic()
+        self.lost_at = self.last_heard if self.last_heard is not None else now
+        self.detected_at = now
+        timed_out = now - self.lost_at > HOST_TIMEOUT
+        self.last_heard = None
+        self.probed_at = None
+        self.rtt = RttTable()
+        self.peers = {}
+        name, ip, port = successor
+        self.successor = None
+        if name == self.network.username:
+            # A host that is handing over sends a final snapshot and closes the link; one
+            # that crashed may leave it open, so don't wait long, and one that went silent
+            # won't send anything more
+            if self.link and not timed_out:
+                self.link_closed.wait(HOST_TIMEOUT / 2)
+            self.reports = {}
+            self.standby = None
+            self.standby_link = None
+            self.network.promote(self.state, self.host_name)
+            self.finish_handoff("Now hosting the match")
+            return True
+        old_host = (self.network.server_ip, self.network.port)
+        if self.network.reconnect(ip, port):
+            return True
+        # The successor never started hosting, so the host is still up and only this
+        # player's connection to it failed: join it again
+        return self.network.reconnect(*old_host)
+
+    # Record how long the last host change took, from the last word from the host to being
+    # back in, and how much of that went on noticing the host was gone
+    def finish_handoff(self, message):
+        if self.lost_at is None:
+            return
+        now = time.monotonic()
+        self.last_detection = self.detected_at - self.lost_at
+        self.last_takeover = now - self.detected_at
+        self.last_handoff = now - self.lost_at
+        self.lost_at = None
+        self.network.add_message(f"{message} ({self.last_handoff * 1000:.0f} ms: "
+                                 f"{self.last_detection * 1000:.0f} ms to notice, "
+                                 f"{self.last_takeover * 1000:.0f} ms to take over)")
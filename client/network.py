@@ -1,19 +1,52 @@
 # Supports hosting, joining, sending and receiving messages, and broadcasting game state updates over TCP sockets
+# Cursor and in-progress stroke traffic uses a separate, droppable UDP channel when both ends support it
 
+import select
 import socket
 import threading
 import time
+import zlib
+from chat import ChatHistory, ChatBatcher
+from claims import ClaimVerifier, parse_points, unpack_centers
+from board import BoardModel, NO_COLOR, color_code
+from datagram import DatagramChannel, HELLO, is_unreliable
+from spectator import SpectatorFeed, LineReader
+from ratelimit import FloodGuard, ADMIT, DISCONNECT, MAX_MESSAGE
+from quality import ClientStream
+from compression import StreamDecompressor, COMPRESS_ON, is_local_peer
+from migration import Migration, MIGRATION_PREFIXES, REJOIN_TIMEOUT, TAKEOVER_TIMEOUT
+from analytics import MatchAnalytics
+from tracing import Tracer, split_trace, strip_trace, traced
+from discovery import Announcer
+from checkpoint import open_checkpoint
+from sharedmem import SharedClient, SharedHost, SPIN_POLLS, poll_pause
+
+# Attempts, a short pause apart, to reach a new host after the old one went away
+RECONNECT_ATTEMPTS = 20
+# How long players keep trying the old host's address when there is no standby, in case it
+# restarts from its checkpoint
+RESTART_ATTEMPTS = 60
+RESTART_PAUSE = 0.25
+# Where the host writes each finished match's contention heatmaps, relative to the working directory
+STATS_DIR = "match_stats"
+# This machine's LAN address, worked out once; see get_local_ip
+_local_ip = None
 
 # Handles networking logic for multiplayer game clients and servers
 class NetworkManager:
-    def __init__(self, username, port, is_host=False, server_ip=None):
+    def __init__(self, username, port, is_host=False, server_ip=None, use_udp=True, spectate=False,
+                 rate_limits=None, compress=None, connection=None, checkpoint=False, local=None,
+                 announce=True):
         self.username = username
         self.port = port
         self.is_host = is_host
         self.server_ip = server_ip
         self.host_ip = None
-        self.players = [username]
-        self.messages = []
+        self.players = [] if spectate else [username]
+        # Who is ready for the next match, kept here rather than on the lobby screen so a
+        # READY sent while this player is still on the victory screen isn't lost
+        self.ready = {}
+        self.messages = ChatHistory()
         self.running = True
         self.client_socket = None
         self.server_socket = None
@@ -21,14 +54,67 @@ class NetworkManager:
         self.lock = threading.Lock()
         self.message_handler = None
         self.player_update_handler = None
+        self.state_change_handler = None
         self.duplicate_username = False
-        # If host, start server and initialize board state
+        self.chat = ChatBatcher(self) if is_host else None
+        # Spectators receive a decimated, read-only feed instead of the player stream
+        self.is_spectator = spectate
+        self.spectator_feed = SpectatorFeed(self) if is_host else None
+        # Per-client token buckets by message class, rate_limits overrides DEFAULT_LIMITS
+        self.rate_limits = rate_limits
+        self.flood_guard = FloodGuard(rate_limits) if is_host else None
+        # Host side: one outbound queue per client socket, with its own quality level
+        self.streams = {}
+        # Datagram channel for cursor and stroke traffic, negotiated at JOIN
+        self.use_udp = use_udp
+        self.udp = None
+        self.udp_server_addr = None
+        self.udp_peers = {}
+        self.udp_clients = {}
+        self.udp_active = set()
+        # Host-to-client stream compression: None turns it on except between processes on
+        # the same machine, True and False force it on or off
+        self.compress = compress
+        self.compression_offered = False
+        # Host migration: players listen for reconnects from the moment they join, in case
+        # they take over; the host tracks where each player listens and who must rejoin
+        self.standby_listener = None
+        self.listen_ports = {}
+        self.rejoining = set()
+        self.host_shut_down = False
+        # Spans for sampled strokes; its clock offset to the host comes from migration pings
+        self.tracer = Tracer(username)
+        self.migration = Migration(self) if not spectate else None
+        # Hosts announce their lobby on the LAN for join screens to list, unless `announce`
+        # is False, e.g. for a benchmark host no one should find and join
+        self.announce = announce
+        self.announcer = None
+        # With `checkpoint`, the host's board lives in a memory-mapped checkpoint file, so a
+        # host that crashes and is started again with the same name and port carries on with
+        # the same match; the menu turns it on, tools and benchmarks leave it off
+        self.use_checkpoint = checkpoint
+        self.checkpoint = None
+        self.recovered = False
+        # Game traffic with clients on this machine goes through a shared-memory segment:
+        # None uses it whenever the other end is local, True and False force it on or off
+        self.local = local
+        # Host side: the segment, local players by socket with their inbound ring, and
+        # local spectators; client side: the host's segment once attached
+        self.shared = None
+        self.local_clients = {}
+        self.local_spectators = []
+        self.local_link = None
+        # If host, initialize board state and start the server
         if is_host:
             self.host_ip = self.get_local_ip()
+            self.checkpoint = open_checkpoint(username, port) if checkpoint else None
+            self.board = self.checkpoint.board if self.checkpoint else BoardModel()
+            self.verifier = ClaimVerifier(self.board)
+            self.analytics = MatchAnalytics()
+            self.recover_match()
             self.start_server()
-            self.board_state = [[None for _ in range(8)] for _ in range(8)]
         else:
-            self.connect_to_server()
+            self.connect_to_server(connection)
     
     # Set the callback to handle incoming GAME or MSG messages
     def set_message_handler(self, handler):
@@ -38,6 +124,15 @@ class NetworkManager:
     def set_player_update_handler(self, handler):
         self.player_update_handler = handler
     
+    # Set the callback run whenever chat, players or connection state change, e.g. to wake
+    # an idle screen so it redraws
+    def set_state_change_handler(self, handler):
+        self.state_change_handler = handler
+
+    def notify_state_change(self):
+        if self.state_change_handler:
+            self.state_change_handler()
+
     # Start the TCP server and begin accepting connections
     def start_server(self):
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -46,19 +141,28 @@ class NetworkManager:
             self.server_socket.bind(('0.0.0.0', self.port))
             self.server_socket.listen(5)
             threading.Thread(target=self.accept_connections, daemon=True).start()
+            self.chat.start()
+            self.spectator_feed.start()
+            self.start_datagram_channel(('0.0.0.0', self.port))
+            if self.announce:
+                self.announcer = Announcer(self).start()
             self.add_message(f"Server started on port {self.port}")
         except Exception as e:
             self.add_message(f"Failed to start server: {str(e)}")
             self.running = False
 
-    # Return the local IP address of the host machine
+    # Return the local IP address of the host machine; the route lookup only runs until it
+    # first succeeds
     def get_local_ip(self):
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                s.connect(("8.8.8.8", 80))
-                return s.getsockname()[0]
-        except Exception:
-            return "127.0.0.1"
+        global _local_ip
+        if _local_ip is None:
+            try:
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                    s.connect(("8.8.8.8", 80))
+                    _local_ip = s.getsockname()[0]
+            except Exception:
+                return "127.0.0.1"
+        return _local_ip
 
     # Accept and handle new client connections in server mode
     def accept_connections(self):
@@ -67,96 +171,305 @@ class NetworkManager:
                 client_socket, addr = self.server_socket.accept()
                 with self.lock:
                     self.clients.append(client_socket)
+                    self.streams[client_socket] = ClientStream(client_socket)
                 threading.Thread(target=self.handle_client, args=(client_socket,), daemon=True).start()
             except Exception as e:
-                if self.running:
+                if self.running and self.is_host:
                     print(f"Error accepting connection: {e}")
                 break
     
-    # Connect this client to the server and start receiving messages
-    def connect_to_server(self):
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Open the datagram socket, falling back to TCP-only traffic if it can't be bound
+    def start_datagram_channel(self, bind_addr):
+        if not self.use_udp:
+            return
+        try:
+            self.udp = DatagramChannel(bind_addr)
+        except OSError as e:
+            print(f"Datagram channel unavailable, using TCP only: {e}")
+            self.udp = None
+            return
+        threading.Thread(target=self.receive_datagrams, args=(self.udp,), daemon=True).start()
+
+    # Send HELLO datagrams to a newly joined client until it answers, server side only
+    def offer_datagram_channel(self, client_socket, udp_port):
+        addr = (client_socket.getpeername()[0], udp_port)
+        with self.lock:
+            self.udp_peers[client_socket] = addr
+            self.udp_clients[addr] = client_socket
+
+        def send_hello():
+            for _ in range(5):
+                if client_socket in self.udp_active or not self.running:
+                    return
+                self.udp.send(HELLO, addr)
+                time.sleep(0.2)
+        threading.Thread(target=send_hello, daemon=True).start()
+
+    # Forget the datagram address of a disconnected client
+    def drop_datagram_peer(self, client_socket):
+        with self.lock:
+            addr = self.udp_peers.pop(client_socket, None)
+            self.udp_active.discard(client_socket)
+            if addr:
+                self.udp_clients.pop(addr, None)
+        if addr and self.udp:
+            self.udp.forget(addr)
+
+    # Receive cursor and stroke datagrams, the HELLO exchange confirms the path works both ways
+    def receive_datagrams(self, udp):
+        while self.running and self.udp is udp:
+            try:
+                message, addr = udp.receive()
+            except OSError:
+                break
+            if message is None:
+                continue
+
+            if self.is_host:
+                with self.lock:
+                    client = self.udp_clients.get(addr)
+                    if client is not None and message == HELLO:
+                        self.udp_active.add(client)
+                        continue
+                    if client not in self.udp_active:
+                        continue
+                if message.startswith(MIGRATION_PREFIXES):
+                    if self.flood_guard.admit(client, message) == ADMIT:
+                        self.migration.on_datagram(message, addr)
+                elif message.startswith("GAME:"):
+                    verdict = self.flood_guard.admit(client, message)
+                    if verdict == ADMIT:
+                        self.handle_game_command(message, client)
+                    elif verdict == DISCONNECT:
+                        self.drop_flooder(client, None)
+            elif message.startswith(MIGRATION_PREFIXES):
+                if self.migration:
+                    self.migration.on_datagram(message, addr)
+            elif message == HELLO:
+                # Only the host this player joined over TCP opens the channel; anyone else
+                # on the LAN could otherwise pose as the host and inject game traffic
+                if addr != self.host_address():
+                    continue
+                if self.udp_server_addr is None:
+                    self.udp_server_addr = addr
+                self.udp.send(HELLO, addr)
+            elif addr == self.udp_server_addr and message.startswith("GAME:"):
+                self.migration.heard_from_host()
+                if self.message_handler:
+                    self.message_handler(message)
+
+    # Player side: the host's (ip, port) as seen on the TCP connection, which its datagrams
+    # come from too; None while there is no connection
+    def host_address(self):
         try:
-            self.client_socket.connect((self.server_ip, self.port))
-            self.client_socket.send(f"JOIN:{self.username}".encode())
+            return self.client_socket.getpeername()[:2]
+        except (OSError, AttributeError):
+            return None
+
+    # Connect this client to the server and start receiving messages; `connection` is a
+    # socket already connected to it, e.g. pre-warmed by the join screen
+    def connect_to_server(self, connection=None):
+        self.client_socket = connection or socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.is_spectator:
+            self.connect_as_spectator(connection is not None)
+            return
+        try:
+            if connection is None:
+                self.client_socket.connect((self.server_ip, self.port))
+            self.start_datagram_channel(('0.0.0.0', 0))
+            self.open_standby_listener()
+            self.send_join()
             threading.Thread(target=self.receive_messages, daemon=True).start()
             self.add_message(f"Connected to server at {self.server_ip}:{self.port}")
         except Exception as e:
             self.add_message(f"Failed to connect: {str(e)}")
             self.running = False
 
+    # Introduce this player to the host: name, datagram port, whether it takes compression
+    # and the port it would host on if it had to take over
+    def send_join(self):
+        join = f"JOIN:{self.username}:{self.udp.get_port() if self.udp else ''}"
+        self.compression_offered = self.wants_compression(self.client_socket)
+        if self.compression_offered:
+            join += ":zlib"
+        if not self.compression_offered and self.wants_local(self.client_socket):
+            join += ":local"
+        if self.standby_listener:
+            join += f":listen={self.standby_listener.getsockname()[1]}"
+        self.client_socket.sendall(f"{join}\n".encode())
+
+    # Listen on the game port if it's free on this machine, any port otherwise; connections
+    # wait in the backlog until this player starts hosting, so peers can reconnect at once
+    def open_standby_listener(self):
+        for port in (self.port, 0):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.bind(('0.0.0.0', port))
+                sock.listen(5)
+                self.standby_listener = sock
+                return
+            except OSError:
+                sock.close()
+        print("No port to listen on, this player can't take over as host")
+
+    # Connect to a host or relay as a read-only spectator
+    def connect_as_spectator(self, connected=False):
+        try:
+            if not connected:
+                self.client_socket.connect((self.server_ip, self.port))
+            local = ":local" if self.wants_local(self.client_socket) else ""
+            self.client_socket.send(f"SPECTATE:{self.username}{local}\n".encode())
+            threading.Thread(target=self.receive_spectator_feed, daemon=True).start()
+            self.add_message(f"Spectating {self.server_ip}:{self.port}")
+        except Exception as e:
+            self.add_message(f"Failed to connect: {str(e)}")
+            self.running = False
+
+    # Receive the newline-framed spectator feed, spectator side only
+    def receive_spectator_feed(self):
+        reader = LineReader(self.client_socket)
+        while self.running:
+            try:
+                lines = reader.read_lines()
+            except Exception as e:
+                if self.running:
+                    print(f"Error receiving spectator feed: {e}")
+                break
+            if not lines:
+                break
+            for line in lines:
+                if line.startswith("GAME:"):
+                    if self.message_handler:
+                        self.message_handler(line)
+                elif line.startswith("LOCAL:"):
+                    self.attach_local(line[len("LOCAL:"):])
+                elif line.startswith("PLAYERS:"):
+                    with self.lock:
+                        self.players = line.split(":")[1].split(",")
+                    if self.player_update_handler:
+                        self.player_update_handler(self.players)
+                elif line.startswith("ERROR:"):
+                    self.add_message("Error from server: " + line[6:])
+        self.running = False
+
     # Handle incoming messages from a connected client for server side only
+    # Players end every message with a newline, so each line is one whole message however
+    # the stream splits or merges them, and the flood guard charges each one on its own
     def handle_client(self, client_socket):
         username = ""
+        keep_open = False
+        reader = LineReader(client_socket, MAX_MESSAGE)
         try:
             while self.running:
-                data = client_socket.recv(1024).decode()
-                if not data:
+                lines = reader.read_lines()
+                if not lines:
+                    if reader.overrun:
+                        self.flood_guard.note_oversized()
+                        self.drop_flooder(client_socket, username)
                     break
-                # Handle player joining
-                if data.startswith("JOIN:"):
-                    username = data.split(":")[1]
-                    with self.lock:
-                        if username in self.players:
-                            self.duplicate_username = True
-                            self.messages.append(f"Duplicate username attempted: {username}")
-                            self.messages.append("Closing socket due to duplicate username...")
-                            client_socket.send("ERROR:Username already taken".encode())
-                            break
-                        else:
-                            self.players.append(username)
-                    self.broadcast(f"PLAYERS:{','.join(self.players)}")
-                    self.add_message(f"{username} joined the lobby")
-                # Handle chat messages
-                elif data.startswith("MSG:"):
-                    message = data.split(":", 1)[1]
-                    self.broadcast(f"MSG:{message}", exclude_socket=client_socket)
-                # Handle game-related messages
-                elif data.startswith("GAME:"):
-                    # Handle block locking
-                    if data.startswith("GAME:LOCK:"):
-                        if self.is_host:
-                            self.broadcast(data)
-                        if self.message_handler:
-                            self.message_handler(data)
-                    # Handle block unlocking
-                    elif data.startswith("GAME:UNLOCK:"):
-                        if self.is_host:
-                            self.broadcast(data)
-                        if self.message_handler:
-                            self.message_handler(data)
-                     # Handle block claiming (filling)
-                    if data.startswith("GAME:CLAIM:") and self.is_host:
-                        try:
-                            _, claim_data = data.split("GAME:CLAIM:")
-                            coord_str, color = claim_data.split(":")
-                            row, col = map(int, coord_str.split(","))
-
-                            if self.board_state[row][col] is None:
-                                self.board_state[row][col] = color
-                                if self.message_handler:
-                                    self.message_handler(f"GAME:CLAIM:{row},{col}:{color}")
-                                self.broadcast(f"GAME:CLAIM:{row},{col}:{color}")
-                                print(f"CLAIM accepted from {color} at ({row},{col})")
+                # A branch that ends the connection breaks out of both loops
+                for data in lines:
+                    # Handle player joining
+                    if data.startswith("JOIN:"):
+                        join_parts = data.split(":")
+                        username = join_parts[1]
+                        with self.lock:
+                            # Players of a match this host took over come back under their own names
+                            rejoined = username in self.rejoining
+                            self.rejoining.discard(username)
+                            if username in self.players and not rejoined:
+                                self.duplicate_username = True
+                                self.messages.append(f"Duplicate username attempted: {username}")
+                                self.messages.append("Closing socket due to duplicate username...")
+                                client_socket.send(b"ERROR:Username already taken\n")
+                                break
                             else:
-                                print(f"Rejected CLAIM for ({row},{col}) — already claimed.")
-                        except Exception as e:
-                            print(f"Malformed CLAIM: {data} ({e})")
-                    else:
-                        # General game message handling
-                        if self.message_handler:
-                            self.message_handler(data)
-                        self.broadcast(data)
-                # Handle player leaving
-                elif data.startswith("LEAVE:"):
-                    username = data.split(":")[1]
-                    with self.lock:
-                        if username in self.players:
-                            self.players.remove(username)
+                                if not rejoined:
+                                    self.players.append(username)
+                                if client_socket in self.streams:
+                                    self.streams[client_socket].name = username
+                            for part in join_parts[3:]:
+                                if part.startswith("listen=") and part[7:].isdigit():
+                                    self.listen_ports[client_socket] = int(part[7:])
+                        if len(join_parts) > 2 and join_parts[2] and self.udp:
+                            self.offer_datagram_channel(client_socket, int(join_parts[2]))
+                        if "zlib" in join_parts[3:] and self.wants_compression(client_socket):
+                            self.streams[client_socket].start_compression()
+                        if "local" in join_parts[3:]:
+                            self.offer_local(client_socket)
+                        self.broadcast(f"PLAYERS:{','.join(self.players)}")
+                        self.add_message(f"{username} joined the lobby")
+                    # Hand spectators over to the spectator feed, they never send again
+                    elif data.startswith("SPECTATE:"):
+                        with self.lock:
+                            if client_socket in self.clients:
+                                self.clients.remove(client_socket)
+                            stream = self.streams.pop(client_socket, None)
+                        if stream:
+                            stream.close()
+                        # Spectators on this machine follow the shared segment at full fidelity
+                        if "local" in data.strip().split(":")[2:] and self.attach_local_spectator(client_socket):
+                            keep_open = True
+                            break
+                        keep_open = self.spectator_feed.add_spectator(client_socket)
+                        if not keep_open:
+                            self.send_to(client_socket, "ERROR:Spectator slots full, connect through a relay")
+                        break
+                    # The standby player's state link, which receives board snapshots from here on
+                    elif data.startswith("STANDBY:"):
+                        with self.lock:
+                            if client_socket in self.clients:
+                                self.clients.remove(client_socket)
+                            stream = self.streams.pop(client_socket, None)
+                        if stream:
+                            stream.close()
+                        self.migration.attach_standby(client_socket, data.strip().split(":", 1)[1])
+                        keep_open = True
+                        break
+                    # A player that stopped hearing from this host checks the connection before
+                    # failing over; any answer will do, and the player list is a harmless one
+                    elif data.startswith("PROBE"):
+                        verdict = self.flood_guard.admit(client_socket, data)
+                        if verdict == DISCONNECT:
+                            self.drop_flooder(client_socket, username)
+                            break
+                        if verdict == ADMIT:
+                            with self.lock:
+                                players = ",".join(self.players)
+                            self.send_to(client_socket, f"PLAYERS:{players}")
+                    # A local player that couldn't open the shared segment goes back to TCP
+                    elif data.startswith("LOCAL:off"):
+                        self.detach_local(client_socket)
+                    # Handle chat messages
+                    elif data.startswith("MSG:"):
+                        verdict = self.flood_guard.admit(client_socket, data)
+                        if verdict == DISCONNECT:
+                            self.drop_flooder(client_socket, username)
+                            break
+                        message = data.split(":", 1)[1].replace("\n", " ")
+                        if verdict == ADMIT and self.chat.submit(message, client_socket):
+                            self.add_message(message)
+                    # Handle game-related messages
+                    elif data.startswith("GAME:"):
+                        verdict = self.flood_guard.admit(client_socket, data)
+                        if verdict == DISCONNECT:
+                            self.drop_flooder(client_socket, username)
+                            break
+                        if verdict == ADMIT:
+                            self.handle_game_command(data, client_socket)
+                    # Handle player leaving
+                    elif data.startswith("LEAVE:"):
+                        username = data.split(":")[1]
+                        with self.lock:
+                            if username in self.players:
+                                self.players.remove(username)
 
-                    self.broadcast(f"PLAYERS:{','.join(self.players)}")
-                    self.add_message(f"{username} left the lobby")
-                    break
+                        self.broadcast(f"PLAYERS:{','.join(self.players)}")
+                        self.add_message(f"{username} left the lobby")
+                        break
+                else:
+                    continue
+                break
         except OSError as sock_err:
             print(f"[Socket Error] {sock_err!r}")
             try:
@@ -170,60 +483,311 @@ class NetworkManager:
         except Exception as e:
             print(f"Error handling client: {e}")
         finally:
-            # Cleanup on disconnect
-            if username and not self.duplicate_username:
+            # Cleanup on disconnect, unless this machine has handed the match to another host
+            if username and not self.duplicate_username and self.is_host:
                 with self.lock:
-                    if username in self.players:
+                    left = username in self.players
+                    if left:
                         self.players.remove(username)
-                        self.broadcast(f"PLAYERS:{','.join(self.players)}")
-                        self.add_message(f"{username} left the lobby")
+                # broadcast and add_message take self.lock themselves
+                if left:
+                    self.broadcast(f"PLAYERS:{','.join(self.players)}")
+                    self.add_message(f"{username} left the lobby")
             self.duplicate_username = False
+            self.detach_local(client_socket)
+            self.chat.forget(client_socket)
+            self.flood_guard.forget(client_socket)
+            self.drop_datagram_peer(client_socket)
+            with self.lock:
+                self.listen_ports.pop(client_socket, None)
+                stream = self.streams.pop(client_socket, None)
+            if stream:
+                stream.close()
             try:
-                client_socket.close()
+                if not keep_open:
+                    client_socket.close()
             except:
                 pass
             with self.lock:
                 if client_socket in self.clients:
                     self.clients.remove(client_socket)
 
+    # Disconnect a client that kept exceeding its rate limits; closing the socket also ends
+    # its handle_client thread, which does the usual cleanup
+    def drop_flooder(self, client_socket, username):
+        print(f"Disconnecting {username or client_socket.getpeername()} for flooding: "
+              f"{self.flood_guard.get_stats()}")
+        self.add_message(f"{username or 'A player'} was disconnected for flooding")
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # Apply one GAME command received from a client, or issued by the host itself when
+    # client_socket is None, and relay it, server side only
+    def handle_game_command(self, data, client_socket):
+        # A sampled stroke's commands carry its trace id, which is relayed as received but kept
+        # out of the host's own parsing
+        relayed = data
+        data, trace = split_trace(data)
+        # Handle block locking and unlocking
+        if data.startswith("GAME:LOCK:") or data.startswith("GAME:UNLOCK:") or data.startswith("GAME:RESET:"):
+            self.tracer.span(trace, "host_" + data.split(":")[1].lower())
+            self.track_stroke(data)
+            self.broadcast(relayed)
+            if self.message_handler:
+                self.message_handler(relayed)
+        # Handle block claiming (filling)
+        elif data.startswith("GAME:CLAIM:"):
+            try:
+                _, claim_data = data.split("GAME:CLAIM:")
+                coord_str, color, *stroke = claim_data.split(":")
+                row, col = map(int, coord_str.split(","))
+                # The claimant's whole stroke, for samples lost on the way or still in flight
+                if stroke:
+                    try:
+                        self.verifier.record_centers(row, col, unpack_centers(stroke[0]), color)
+                    except (ValueError, zlib.error):
+                        print(f"Ignoring a malformed stroke bitmap in CLAIM for ({row},{col})")
+
+                if self.board.claimed[row, col] != NO_COLOR:
+                    print(f"Rejected CLAIM for ({row},{col}) — already claimed.")
+                    self.tracer.span(trace, "host_claim", "rejected: already claimed")
+                    self.analytics.on_end(row, col, "rejected", color)
+                    self.reject_claim(row, col, trace)
+                elif not self.verifier.verify(row, col, color):
+                    coverage = self.verifier.coverage(row, col)
+                    print(f"Rejected CLAIM for ({row},{col}) — host coverage {coverage:.0f}% for {color}")
+                    self.tracer.span(trace, "host_claim", f"rejected: coverage {coverage:.0f}%")
+                    self.analytics.on_end(row, col, "rejected", color)
+                    self.reject_claim(row, col, trace)
+                else:
+                    self.tracer.span(trace, "host_claim", f"accepted: coverage {self.verifier.coverage(row, col):.0f}%")
+                    self.journal(f"GAME:CLAIM:{row},{col}:{color}")
+                    self.verifier.reset(row, col)
+                    self.board.claimed[row, col] = color_code(color)
+                    self.analytics.on_end(row, col, "claims", color)
+                    claim = traced(f"GAME:CLAIM:{row},{col}:{color}", trace)
+                    if self.message_handler:
+                        self.message_handler(claim)
+                    self.broadcast(claim)
+                    print(f"CLAIM accepted from {color} at ({row},{col})")
+                    if self.board.is_full():
+                        self.export_analytics()
+            except Exception as e:
+                print(f"Malformed CLAIM: {data} ({e})")
+        # Cursor and stroke samples, from the datagram channel or clients without one
+        elif is_unreliable(data[5:]):
+            if data.startswith("GAME:DRAW:"):
+                self.tracer.span(trace, "host_draw")
+                self.track_stroke(data)
+            if self.message_handler:
+                self.message_handler(relayed)
+            self.broadcast_unreliable(relayed, exclude_socket=client_socket)
+        else:
+            # General game message handling
+            self.track_ready(data)
+            if self.message_handler:
+                self.message_handler(relayed)
+            self.broadcast(relayed)
+
+    # Clear the host's authoritative board before a new match on the same connection
+    def reset_match(self):
+        with self.lock:
+            self.board.clear()
+            if self.checkpoint:
+                self.checkpoint.new_match()
+        self.analytics.clear()
+
+    # Pick up the match a crashed host with this name and port left in its checkpoint: the
+    # board as it was, and the other players get REJOIN_TIMEOUT to reconnect
+    def recover_match(self):
+        if not self.checkpoint:
+            return
+        players = self.checkpoint.recover()
+        if not players or self.username not in players:
+            self.board.clear()
+            self.checkpoint.new_match()
+            self.checkpoint.set_players(self.players)
+            return
+        self.players = players
+        self.rejoining = set(players) - {self.username}
+        self.recovered = True
+        threading.Timer(REJOIN_TIMEOUT, self.drop_missing_players).start()
+        claimed = sum(self.board.claim_counts().values())
+        print(f"Recovered the match from {self.checkpoint.path}: {claimed} squares claimed, "
+              f"waiting for {', '.join(sorted(self.rejoining)) or 'nobody'}")
+
+    # Note an accepted claim in the checkpoint journal, before applying it to the board
+    def journal(self, data):
+        if self.checkpoint:
+            self.checkpoint.journal(data[5:])
+
+    # Keep the host's claim verifier in step with LOCK, DRAW, RESET and UNLOCK commands
+    def track_stroke(self, data):
+        try:
+            parts = data.split(":")
+            row, col = map(int, parts[2].split(","))
+            if parts[1] == "LOCK":
+                # A LOCK for a square that is claimed or held by someone else collides
+                taken = self.board.claimed[row, col] == NO_COLOR and self.verifier.lock(row, col, parts[3])
+                self.analytics.on_lock(row, col, parts[3], taken)
+            elif parts[1] == "DRAW":
+                xs, ys = parse_points(parts[3])
+                self.verifier.record_points(row, col, xs, ys, parts[4])
+            elif parts[1] in ("RESET", "UNLOCK"):
+                self.analytics.on_end(row, col, "resets")
+                self.verifier.reset(row, col)
+        except (IndexError, ValueError):
+            print(f"Malformed stroke command: {data}")
+
+    # Keep the ready set in step with READY commands whatever screen is showing; START
+    # and the end of a match clear it, so every rematch begins with nobody ready
+    def track_ready(self, message):
+        if message.startswith("GAME:READY:"):
+            parts = message.split(":")
+            if len(parts) == 4:
+                self.ready[parts[3]] = parts[2] == "1"
+        elif message.strip() == "GAME:START":
+            self.ready.clear()
+
+    # Forget who was ready for the match that just ended, on every peer, so a READY left
+    # over from that lobby can't start the rematch before its player presses Ready again
+    def end_match(self):
+        self.ready.clear()
+
+    # Tell everyone, including the claimant, to clear a square whose claim was refused
+    def reject_claim(self, row, col, trace=None):
+        self.verifier.reset(row, col)
+        for message in (traced(f"GAME:RESET:{row},{col}", trace), traced(f"GAME:UNLOCK:{row},{col}", trace)):
+            if self.message_handler:
+                self.message_handler(message)
+            self.broadcast(message)
+
+    # Move a player on this machine onto the shared segment: from the LOCAL line on, its
+    # game traffic skips its TCP stream, which carries on with chat and player lists
+    def offer_local(self, client_socket):
+        with self.lock:
+            index = None
+            if self.local is not False and is_local_peer(client_socket) and self.open_shared():
+                index = self.shared.attach_player()
+            if index is None:
+                self.send_to(client_socket, "LOCAL:off")
+                return
+            self.local_clients[client_socket] = index
+            # Read under the same lock broadcasts publish under, so nothing falls between
+            # the last message sent over TCP and the first one read from the ring
+            self.send_to(client_socket, f"LOCAL:{self.shared.name}:{index}:{self.shared.outbox.seq}")
+
+    # Point a spectator on this machine at the shared segment; False if it can't be used
+    def attach_local_spectator(self, client_socket):
+        with self.lock:
+            if self.local is False or not is_local_peer(client_socket) or not self.open_shared():
+                return False
+            line = f"LOCAL:{self.shared.name}:-1:{self.shared.outbox.seq}\n"
+            self.local_spectators.append(client_socket)
+        try:
+            client_socket.sendall(line.encode())
+            return True
+        except OSError:
+            with self.lock:
+                self.local_spectators.remove(client_socket)
+            return False
+
+    # Create the shared segment when the first local client asks for it, and bring its
+    # player list and board up to date; the caller holds self.lock
+    def open_shared(self):
+        if self.shared is None:
+            try:
+                self.shared = SharedHost(self.port)
+            except (OSError, ValueError) as e:
+                print(f"Shared memory unavailable, local clients stay on TCP: {e}")
+                self.local = False
+                return False
+            threading.Thread(target=self.receive_local_commands, args=(self.shared,), daemon=True).start()
+        self.shared.set_players(self.players)
+        self.shared.sync_board(self.board)
+        return True
+
+    def detach_local(self, client_socket):
+        with self.lock:
+            index = self.local_clients.pop(client_socket, None)
+            if index is not None and self.shared:
+                self.shared.detach_player(index)
+
+    # Put one broadcast in the ring for local clients, keeping the shared board and player
+    # list in step with it; the caller holds self.lock
+    def publish_local(self, message, skip=-1):
+        if message.startswith("PLAYERS:"):
+            self.shared.set_players(self.players)
+        elif not is_unreliable(message[5:]):
+            self.shared.sync_board(self.board)
+        self.shared.publish(message, skip)
+
+    # Host side: apply the commands local players leave in their inbound rings, as
+    # handle_client does for commands that arrive over TCP
+    def receive_local_commands(self, shared):
+        idle = 0
+        while self.running and self.shared is shared:
+            with self.lock:
+                players = list(self.local_clients.items())
+            busy = False
+            for client_socket, index in players:
+                for command in shared.receive(index):
+                    busy = True
+                    verdict = self.flood_guard.admit(client_socket, command)
+                    if verdict == ADMIT:
+                        self.handle_game_command(command, client_socket)
+                    elif verdict == DISCONNECT:
+                        self.drop_flooder(client_socket, None)
+                        break
+            idle = 0 if busy else idle + 1
+            poll_pause(idle)
+        shared.close()
+
+    # Take the shared segment's name away so no new client finds it; the command thread
+    # unmaps it once it notices
+    def close_shared(self):
+        with self.lock:
+            shared, self.shared = self.shared, None
+            self.local_clients.clear()
+            spectators, self.local_spectators = self.local_spectators, []
+        if shared:
+            shared.unlink()
+        for sock in spectators:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
     # Receive messages from the server for client side only
+    # The host ends every plain message with a newline; once it switches to the compressed
+    # stream, the decompressor hands back whole messages until the stream ends
     def receive_messages(self):
+        reader = LineReader(self.client_socket, until=COMPRESS_ON.rstrip(b"\n"))
+        decoder = None
         while self.running:
             try:
-                data = self.client_socket.recv(1024).decode()
-                if not data:
-                    break
-                # Handle multiple GAME messages in one TCP packet
-                if data.startswith("ERROR:"):
-                    self.add_message("Error from server: " + data[6:])
-                    self.add_message("Disconnecting in 3 seconds...")
-                    time.sleep(1)
-                    self.add_message("Disconnecting in 2 seconds...")
-                    time.sleep(1)
-                    self.add_message("Disconnecting in 1 seconds...")
-                    time.sleep(1)
-                    self.running = False
-                    break
-                elif data.startswith("GAME:"):
-                    messages = data.split("GAME:")
-                    for msg in messages:
-                        if not msg.strip():
-                            continue
-                        msg = "GAME:" + msg
-                        if self.message_handler:
-                            self.message_handler(msg)
-                # Handle chat messages
-                elif data.startswith("MSG:"):
-                    self.add_message(data.split(":", 1)[1])
-                # Handle player list updates
-                elif data.startswith("PLAYERS:"):
-                    with self.lock:
-                        self.players = data.split(":")[1].split(",")
-                    if self.player_update_handler:
-                        self.player_update_handler(self.players)
-                # Handle server shutdown
-                elif data == "SERVER_SHUTDOWN":
-                    self.add_message("Server has been shut down")
+                if decoder:
+                    data = reader.take_rest() or self.client_socket.recv(4096)
+                    if not data:
+                        break
+                    messages = decoder.feed(data)
+                    if decoder.finished():
+                        reader.unread(decoder.unused_data())
+                        decoder = None
+                        self.compression_offered = False
+                else:
+                    messages = reader.read_lines()
+                    if not messages:
+                        break
+                    if self.compression_offered and messages[-1] == "COMPRESS:zlib":
+                        messages.pop()
+                        decoder = StreamDecompressor()
+                if self.migration:
+                    self.migration.heard_from_host()
+                if not all(self.handle_server_data(line) for message in messages
+                           for line in message.split("\n") if line):
                     break
 
             except Exception as e:
@@ -231,64 +795,458 @@ class NetworkManager:
                     print(f"Error receiving messages: {e}")
                 break
 
+        # A host that went away without shutting the match down is replaced by its standby,
+        # and without one it may come back from its checkpoint
+        if self.running and not self.host_shut_down and self.migration and self.migration.take_over():
+            return
+        if self.running and not self.host_shut_down and not self.is_spectator and self.await_restart():
+            return
+
         # Cleanup on disconnect
+        self.close_local()
         if self.client_socket:
             try:
                 if self.running:
-                    self.client_socket.send(f"LEAVE:{self.username}".encode())
+                    self.client_socket.sendall(f"LEAVE:{self.username}\n".encode())
                 self.client_socket.close()
             except:
                 pass
         self.running = False
+        self.notify_state_change()
+
+    # Whether to offer the shared-memory transport on this connection, see self.local
+    def wants_local(self, sock):
+        if self.local is None:
+            return is_local_peer(sock)
+        return self.local
+
+    # Follow the host's game traffic in its shared segment; `answer` is
+    # "<segment>:<inbound ring, -1 for spectators>:<sequence to read from>", or "off"
+    def attach_local(self, answer):
+        if answer == "off":
+            return
+        try:
+            name, index, start = answer.rsplit(":", 2)
+            link = SharedClient(name, int(index), int(start))
+        except (OSError, ValueError) as e:
+            print(f"Could not open the host's shared memory, staying on TCP: {e}")
+            if not self.is_spectator:
+                self.client_socket.sendall(b"LOCAL:off\n")
+            return
+        self.local_link = link
+        threading.Thread(target=self.receive_local, args=(link,), daemon=True).start()
+
+    # Deliver the host's game traffic from the shared segment, as receive_messages does for
+    # the TCP stream; the link is closed here once this client lets go of it
+    def receive_local(self, link):
+        idle = 0
+        # A spectator starts from the board as it stands, once there is a board to show it on
+        if link.index < 0:
+            while self.running and self.local_link is link and self.message_handler is None:
+                poll_pause(SPIN_POLLS)
+            with self.lock:
+                self.players = link.read_players()
+            if self.player_update_handler:
+                self.player_update_handler(self.players)
+            for line in link.snapshot(unlocked=False):
+                if self.message_handler:
+                    self.message_handler(line)
+        while self.running and self.local_link is link:
+            messages = link.receive()
+            for message in messages:
+                if message.startswith("GAME:"):
+                    self.track_ready(message)
+                    if self.message_handler:
+                        self.message_handler(message)
+                # Players get the player list over TCP, in order with the rest of the lobby
+                elif message.startswith("PLAYERS:") and self.is_spectator:
+                    with self.lock:
+                        self.players = message.split(":")[1].split(",")
+                    if self.player_update_handler:
+                        self.player_update_handler(self.players)
+            if messages and self.migration:
+                self.migration.heard_from_host()
+            idle = 0 if messages else idle + 1
+            poll_pause(idle)
+        link.close()
+
+    def close_local(self):
+        self.local_link = None
+
+    # Handle one message from the host; returns False when the connection should end
+    def handle_server_data(self, data):
+        if data.startswith("ERROR:"):
+            self.add_message("Error from server: " + data[6:])
+            self.add_message("Disconnecting in 3 seconds...")
+            time.sleep(1)
+            self.add_message("Disconnecting in 2 seconds...")
+            time.sleep(1)
+            self.add_message("Disconnecting in 1 seconds...")
+            time.sleep(1)
+            self.running = False
+            return False
+        elif data.startswith("GAME:"):
+            self.track_ready(data)
+            if self.message_handler:
+                self.message_handler(data)
+        # The host's answer to a shared-memory offer; game traffic moves to the segment after it
+        elif data.startswith("LOCAL:"):
+            self.attach_local(data[len("LOCAL:"):])
+        elif data.startswith("MSG:"):
+            self.add_message(data[len("MSG:"):])
+        # Handle player list updates
+        elif data.startswith("PLAYERS:"):
+            with self.lock:
+                self.players = data.split(":")[1].split(",")
+            if self.player_update_handler:
+                self.player_update_handler(self.players)
+            self.notify_state_change()
+            if self.migration and self.migration.lost_at is not None:
+                self.migration.finish_handoff(f"Rejoined the match at {self.server_ip}:{self.port}")
+        # Handle server shutdown
+        elif data == "SERVER_SHUTDOWN":
+            self.host_shut_down = True
+            self.add_message("Server has been shut down")
+            return False
+        return True
+
+    # Player side: end the connection to the host so receive_messages fails over
+    def drop_host_connection(self):
+        if self.is_host or not self.client_socket:
+            return
+        try:
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # Player side: ask the host for an answer over TCP; False if the connection has failed
+    def probe_host(self):
+        try:
+            self.client_socket.sendall(b"PROBE\n")
+            return True
+        except (OSError, AttributeError):
+            return False
+
+    # Player side: join the host that took over the match, keeping this player's name
+    # A player that hasn't started hosting holds connections in its listen backlog without
+    # answering, so the JOIN must be answered within `answer_timeout`; returns False if not
+    def reconnect(self, ip, port, attempts=RECONNECT_ATTEMPTS, pause=0.05, answer_timeout=TAKEOVER_TIMEOUT):
+        self.close_local()
+        try:
+            self.client_socket.close()
+        except OSError:
+            pass
+        self.server_ip = ip
+        self.port = port
+        self.udp_server_addr = None
+        for _ in range(attempts):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.connect((ip, port))
+                break
+            except OSError:
+                sock.close()
+                sock = None
+                if not self.running:
+                    return False
+                time.sleep(pause)
+        if sock is None:
+            self.add_message(f"Could not reach the new host at {ip}:{port}")
+            return False
+        self.client_socket = sock
+        try:
+            self.send_join()
+        except OSError:
+            return False
+        readable, _, _ = select.select([sock], [], [], answer_timeout)
+        if not readable:
+            sock.close()
+            self.add_message(f"No answer from {ip}:{port}")
+            return False
+        self.add_message(f"Host left, reconnecting to {ip}:{port}")
+        threading.Thread(target=self.receive_messages, daemon=True).start()
+        return True
+
+    # Player side, with no standby to fail over to: keep trying the host's own address for a
+    # while, since a crashed host restarted with the same name and port resumes the match
+    def await_restart(self):
+        self.add_message(f"Lost the host, waiting for it to come back at {self.server_ip}:{self.port}")
+        if self.migration:
+            self.migration.last_heard = None
+        return self.reconnect(self.server_ip, self.port, RESTART_ATTEMPTS, RESTART_PAUSE)
+
+    # Standby side: start hosting the match from the last snapshot of the old host's board,
+    # on the socket this player has been listening on since it joined
+    def promote(self, state, old_host):
+        self.close_local()
+        try:
+            self.client_socket.close()
+        except OSError:
+            pass
+        self.client_socket = None
+        self.server_socket = self.standby_listener
+        self.standby_listener = None
+        self.port = self.server_socket.getsockname()[1]
+        self.host_ip = self.get_local_ip()
+        # Players only take datagrams from the port they connect to, so the channel moves
+        # to the game port along with the match
+        if self.udp:
+            old, self.udp = self.udp, None
+            old.close()
+            self.start_datagram_channel(('0.0.0.0', self.port))
+        self.checkpoint = open_checkpoint(self.username, self.port) if self.use_checkpoint else None
+        self.board = self.checkpoint.board if self.checkpoint else BoardModel()
+        if self.checkpoint:
+            self.board.clear()
+            self.checkpoint.new_match()
+        self.verifier = ClaimVerifier(self.board)
+        self.analytics = MatchAnalytics()
+        # Spans so far are timed against the old host's clock; from here this clock is the host's
+        self.tracer.dump()
+        self.tracer.host_offset = 0.0
+        with self.lock:
+            players = list(self.players)
+            if state:
+                _, _, players, buffer = state
+                self.board.restore(buffer)
+            self.players = [p for p in players if p != old_host]
+            self.rejoining = set(self.players) - {self.username}
+            if self.checkpoint:
+                self.checkpoint.set_players(self.players)
+            self.udp_server_addr = None
+            self.is_host = True
+        if self.flood_guard is None:
+            self.flood_guard = FloodGuard(self.rate_limits)
+        if self.chat is None:
+            self.chat = ChatBatcher(self)
+            self.chat.start()
+        if self.spectator_feed is None:
+            self.spectator_feed = SpectatorFeed(self)
+            self.spectator_feed.start()
+        if self.announce:
+            self.announcer = Announcer(self).start()
+        threading.Thread(target=self.accept_connections, daemon=True).start()
+        threading.Timer(REJOIN_TIMEOUT, self.drop_missing_players).start()
+        print(f"Took over from {old_host} on port {self.port}")
+        if self.player_update_handler:
+            self.player_update_handler(self.players)
+        self.notify_state_change()
+
+    # New host: players who haven't come back by now have left the match
+    def drop_missing_players(self):
+        with self.lock:
+            gone = self.rejoining
+            self.rejoining = set()
+            self.players = [p for p in self.players if p not in gone]
+        if gone and self.running:
+            self.broadcast(f"PLAYERS:{','.join(self.players)}")
+            self.add_message(f"{', '.join(sorted(gone))} did not rejoin")
+
+    # Host side: hand the match to the standby and carry on as a player on the new host
+    # Returns False if no standby is ready
+    def hand_off(self):
+        successor = self.migration.hand_off() if self.is_host else None
+        if not successor:
+            return False
+        name, ip, port = successor
+        self.stop_hosting()
+        self.open_standby_listener()
+        return self.reconnect(ip, port)
+
+    # Close the server side without telling clients the match is over, so they fail over
+    def stop_hosting(self):
+        with self.lock:
+            self.is_host = False
+            streams = list(self.streams.values())
+            clients = list(self.clients)
+            self.streams.clear()
+            self.clients.clear()
+            self.udp_peers.clear()
+            self.udp_clients.clear()
+            self.udp_active.clear()
+            self.listen_ports.clear()
+        if self.announcer:
+            self.announcer.stop()
+            self.announcer = None
+        if self.checkpoint:
+            self.checkpoint.close()
+        self.close_shared()
+        for stream in streams:
+            stream.close()
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+                client.close()
+            except OSError:
+                pass
+        try:
+            self.server_socket.close()
+        except OSError:
+            pass
+        self.server_socket = None
+
+    # Host side: players who could take over, as {name: (ip, port they listen on)}
+    def get_successor_candidates(self):
+        candidates = {}
+        with self.lock:
+            for client, port in self.listen_ports.items():
+                stream = self.streams.get(client)
+                if stream and stream.name and client in self.udp_active:
+                    try:
+                        candidates[stream.name] = (client.getpeername()[0], port)
+                    except OSError:
+                        pass
+        return candidates
+
+    # Host side: the player name behind a datagram address
+    def name_for_address(self, addr):
+        with self.lock:
+            stream = self.streams.get(self.udp_clients.get(addr))
+            return stream.name if stream else None
 
-    # Send a message to all connected clients except the excluded one
+    # Whether to compress the stream on this connection, see self.compress
+    def wants_compression(self, sock):
+        if self.compress is None:
+            return not is_local_peer(sock)
+        return self.compress
+
+    # Whether a connection has sent JOIN, which names its stream; only joined connections get
+    # the lobby and game stream, an unjoined one may be a join screen's pre-warmed socket
+    # that nobody has picked yet. Call with self.lock held
+    def has_joined(self, client):
+        stream = self.streams.get(client)
+        return stream is not None and bool(stream.name)
+
+    # Send a message to all joined clients except the excluded one
     def broadcast(self, message, exclude_socket=None):
         if message.startswith("PLAYERS:"):
             with self.lock:
                 self.players = message.split(":")[1].split(",")
+                if self.checkpoint:
+                    self.checkpoint.set_players(self.players)
             if self.player_update_handler:
                 self.player_update_handler(self.players)
+            self.notify_state_change()
         
         if message.startswith("MSG:"):
             self.add_message(message.split(":", 1)[1])
         
         if self.is_host:
+            self.spectator_feed.observe(strip_trace(message))
+            overflowing = []
+            game = message.startswith("GAME:")
             with self.lock:
+                local = self.local_clients
                 for client in self.clients:
-                    if client != exclude_socket:
-                        try:
-                            client.send(message.encode())
-                        except:
-                            continue
+                    # Local players read game traffic from the shared segment
+                    if game and local and client in local:
+                        continue
+                    if client == exclude_socket or not self.has_joined(client):
+                        continue
+                    if not self.streams[client].offer(message):
+                        overflowing.append(client)
+                if self.shared and (local or self.local_spectators) and (game or message.startswith("PLAYERS:")):
+                    self.publish_local(message, local.get(exclude_socket, -1))
+            self.drop_lagging(overflowing)
     
+    # Send droppable game traffic over the datagram channel where a client has one,
+    # and over its TCP socket otherwise, shaped to each client's quality level
+    def broadcast_unreliable(self, message, exclude_socket=None):
+        self.spectator_feed.observe(strip_trace(message))
+        overflowing = []
+        with self.lock:
+            local = self.local_clients
+            if self.shared and (local or self.local_spectators):
+                self.publish_local(message, local.get(exclude_socket, -1))
+            for client in self.clients:
+                if client == exclude_socket or not self.has_joined(client) or client in local:
+                    continue
+                stream = self.streams[client]
+                if client in self.udp_active:
+                    shaped = stream.shape(message)
+                    if shaped is None:
+                        stream.skipped += 1
+                    else:
+                        self.udp.send(shaped, self.udp_peers[client])
+                elif not stream.offer(message, reliable=False):
+                    overflowing.append(client)
+        self.drop_lagging(overflowing)
+
+    # Send a message to a single client, through its stream when it has one; the message
+    # is newline-terminated on the way out either way
+    def send_to(self, client, message):
+        stream = self.streams.get(client)
+        if stream:
+            if not stream.offer(message):
+                self.drop_lagging([client])
+            return
+        try:
+            client.send(f"{message}\n".encode())
+        except Exception:
+            pass
+
+    # Disconnect clients whose queues have grown past MAX_BACKLOG; handle_client cleans up
+    def drop_lagging(self, clients):
+        for client in clients:
+            print(f"Disconnecting {self.streams[client].label() if client in self.streams else 'client'}: "
+                  f"link too slow to keep up")
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    # Per-client link telemetry on the host: quality level, throughput (B/s), queued bytes
+    # and cursor/stroke messages skipped
+    def get_link_stats(self):
+        with self.lock:
+            streams = list(self.streams.values())
+        return {stream.label(): stream.get_stats() for stream in streams}
+
+    # Host side: the match's lock and claim analytics so far, see MatchAnalytics.summary
+    def get_contention_stats(self):
+        return self.analytics.summary()
+
+    # Host side: write the finished match's contention heatmaps to STATS_DIR, off the
+    # thread that accepted the final claim
+    def export_analytics(self):
+        name = time.strftime("match-%Y%m%d-%H%M%S")
+
+        def export():
+            path = self.analytics.export(STATS_DIR, name)
+            print(f"Match contention stats written to {path}.json and {path}.png")
+        threading.Thread(target=export, daemon=True).start()
+
     # Send a chat message to other players
     def send_message(self, message):
-        if not self.running:
+        if not self.running or self.is_spectator:
             return
             
-        full_message = f"{self.username}: {message}"
+        full_message = f"{self.username}: {message}".replace("\n", " ")
         if self.is_host:
-            self.broadcast(f"MSG:{full_message}")
+            self.add_message(full_message)
+            self.chat.submit(full_message)
         else:
             self.add_message(full_message)
             try:
-                self.client_socket.send(f"MSG:{full_message}".encode())
+                self.client_socket.sendall(f"MSG:{full_message}\n".encode())
             except Exception as e:
                 self.add_message(f"Failed to send message: {e}")
                 self.running = False
 
     # Send a game command to the server or clients
     def send_game_command(self, command):
-        if not self.running:
+        if not self.running or self.is_spectator:
             return
             
         try:
             if self.is_host:
-                if self.message_handler:
-                    self.message_handler(f"GAME:{command}")
-                self.broadcast(f"GAME:{command}")
+                self.handle_game_command(f"GAME:{command}", None)
+            elif self.local_link and self.local_link.send(f"GAME:{command}"):
+                return
+            elif self.udp_server_addr and is_unreliable(command):
+                self.udp.send(f"GAME:{command}", self.udp_server_addr)
             else:
-                self.client_socket.send(f"GAME:{command}".encode())
+                self.client_socket.sendall(f"GAME:{command}\n".encode())
         except Exception as e:
             print(f"Failed to send game command: {e}")
 
@@ -299,20 +1257,42 @@ class NetworkManager:
                 self.messages.append(message)
             if self.message_handler and message.startswith("MSG:"):
                 self.message_handler(message)
+            self.notify_state_change()
 
     # Return a string describing the current network connection
     def get_server_info(self):
+        if self.is_spectator:
+            return f"Spectating: {self.server_ip}:{self.port}"
         if self.is_host:
             return f"Host IP: {self.host_ip}:{self.port}"
         else:
             return f"Connected to: {self.server_ip}:{self.port}"
 
-    # Disconnect the client or shut down the server
+    # Disconnect the client or shut down the server; a host with a standby ready hands the
+    # match over instead of ending it for everyone
     def quit(self):
+        handed_off = self.is_host and self.migration is not None and self.migration.hand_off() is not None
         self.running = False
-        if not self.is_host and self.client_socket:
+        if self.migration:
+            self.migration.stop()
+        if self.announcer:
+            self.announcer.stop()
+        if self.checkpoint and self.is_host:
+            self.checkpoint.close()
+        self.close_shared()
+        self.close_local()
+        if self.standby_listener:
+            self.standby_listener.close()
+        if self.udp:
+            self.udp.close()
+        if self.is_spectator and self.client_socket:
+            try:
+                self.client_socket.close()
+            except:
+                pass
+        elif not self.is_host and self.client_socket:
             try:
-                self.client_socket.send(f"LEAVE:{self.username}".encode())
+                self.client_socket.sendall(f"LEAVE:{self.username}\n".encode())
                 self.client_socket.shutdown(socket.SHUT_WR)
                 time.sleep(0.5) 
                 self.client_socket.close()
@@ -321,13 +1301,18 @@ class NetworkManager:
 
         if self.is_host and self.server_socket:
             with self.lock:
+                for stream in self.streams.values():
+                    stream.close()
+                self.streams.clear()
                 for client in self.clients:
                     try:
-                        client.send("SERVER_SHUTDOWN".encode())
+                        if not handed_off:
+                            client.send(b"SERVER_SHUTDOWN\n")
                         client.close()
                     except:
                         pass
                 self.clients.clear()
+            self.spectator_feed.hub.close()
             try:
                 self.server_socket.close()
             except:
@@ -0,0 +1,212 @@
+# Per-client outbound streams for the host
+# Each client gets its own send queue drained by its own thread, so a slow link only
+# backs up that client's queue instead of blocking broadcast for everyone. How fast the
+# queue drains picks a quality level for the client: at lower levels cursor updates are
+# rate-limited and stroke previews thinned, while authoritative messages are always sent
+
+import socket
+import threading
+import time
+from collections import deque
+from compression import StreamCompressor, COMPRESS_ON, CPU_BUDGET, BUDGET_WINDOW
+
+# (name, minimum seconds between cursor updates per player, keep every n-th stroke sample)
+QUALITY_LEVELS = (
+    ("full", 0.0, 1),
+    ("reduced", 1 / 30, 2),
+    ("minimal", 1 / 10, 4),
+)
+ADAPT_INTERVAL = 0.5
+# Queued bytes above which a client drops a level, and below which it may recover one
+DEGRADE_BACKLOG = 16 * 1024
+RECOVER_BACKLOG = 1024
+# Intervals a client must stay under RECOVER_BACKLOG before it moves up a level
+RECOVER_INTERVALS = 4
+# A client this far behind is disconnected rather than buffered without bound
+MAX_BACKLOG = 1024 * 1024
+# Kernel send buffer per client; kept small so a slow link shows up in our own queue
+# within a second or two instead of hiding in megabytes of socket buffer
+SEND_BUFFER = 32 * 1024
+# Queue entry telling the writer to switch this client to the compressed stream
+_START_COMPRESSION = object()
+
+# Outbound queue, writer thread and link estimate for one connected client
+class ClientStream:
+    def __init__(self, sock, name=None):
+        self.sock = sock
+        self.name = name
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        except OSError:
+            pass
+        self.queue = deque()
+        self.backlog = 0
+        self.cond = threading.Condition()
+        self.open = True
+        self.level = 0
+        self.sent_bytes = 0
+        self.throughput = 0.0
+        self.skipped = 0
+        self.last_cursor = {}
+        self.last_adapt = time.monotonic()
+        self.last_backlog = 0
+        self.interval_bytes = 0
+        self.calm_intervals = 0
+        # Set by the writer thread once the client has been told the stream is compressed
+        self.compressor = None
+        self.compress_time = 0.0
+        self.compress_batches = 0
+        self.budget_time = 0.0
+        self.budget_start = time.monotonic()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def label(self):
+        if self.name:
+            return self.name
+        try:
+            return "%s:%d" % self.sock.getpeername()
+        except OSError:
+            return "client"
+
+    # Queue a message; unreliable ones may be thinned or skipped at lower quality levels
+    # Returns False if the client is so far behind that it should be disconnected
+    def offer(self, message, reliable=True):
+        if not reliable:
+            message = self.shape(message)
+            if message is None:
+                self.skipped += 1
+                return True
+        data = message.encode()
+        with self.cond:
+            if not self.open:
+                return True
+            self.queue.append(data)
+            self.backlog += len(data)
+            self.cond.notify()
+            overflowing = self.backlog > MAX_BACKLOG
+        self.adapt()
+        return not overflowing
+
+    # Apply this client's quality level to a cursor or stroke message, None to skip it
+    def shape(self, message):
+        _, cursor_interval, stroke_step = QUALITY_LEVELS[self.level]
+        if message.startswith("GAME:CURSOR:") and cursor_interval:
+            color = message.split(":", 3)[2]
+            now = time.monotonic()
+            if now - self.last_cursor.get(color, 0) < cursor_interval:
+                return None
+            self.last_cursor[color] = now
+        elif message.startswith("GAME:DRAW:") and stroke_step > 1:
+            parts = message.split(":")
+            if len(parts) == 5:
+                parts[3] = ";".join(parts[3].split(";")[::stroke_step])
+                return ":".join(parts)
+        return message
+
+    # Every ADAPT_INTERVAL, move the level down if the backlog is large or still growing,
+    # and back up after it has stayed small for a while
+    def adapt(self):
+        now = time.monotonic()
+        elapsed = now - self.last_adapt
+        if elapsed < ADAPT_INTERVAL:
+            return
+        with self.cond:
+            backlog = self.backlog
+            sent = self.interval_bytes
+            self.interval_bytes = 0
+        self.throughput = 0.5 * self.throughput + 0.5 * sent / elapsed
+        growing = backlog > self.last_backlog + RECOVER_BACKLOG
+        level = self.level
+        if backlog > DEGRADE_BACKLOG or (growing and backlog > RECOVER_BACKLOG * 4):
+            self.calm_intervals = 0
+            level = min(level + 1, len(QUALITY_LEVELS) - 1)
+        elif backlog < RECOVER_BACKLOG:
+            self.calm_intervals += 1
+            if self.calm_intervals >= RECOVER_INTERVALS:
+                self.calm_intervals = 0
+                level = max(level - 1, 0)
+        else:
+            self.calm_intervals = 0
+        self.last_adapt = now
+        self.last_backlog = backlog
+        if level != self.level:
+            print(f"Link to {self.label()}: quality {QUALITY_LEVELS[level][0]} "
+                  f"(backlog {backlog} B, {self.throughput / 1024:.1f} KB/s)")
+            self.level = level
+
+    # Switch to the compressed stream once everything already queued has gone out plain
+    def start_compression(self):
+        with self.cond:
+            self.queue.append(_START_COMPRESSION)
+            self.cond.notify()
+
+    # Writer thread: send queued messages in order, one newline-terminated send per message,
+    # or everything queued as one compressed batch once compression is on
+    def run(self):
+        while True:
+            with self.cond:
+                while self.open and not self.queue:
+                    self.cond.wait()
+                if not self.open:
+                    return
+                if self.compressor:
+                    batch = list(self.queue)
+                    self.queue.clear()
+                else:
+                    batch = [self.queue.popleft()]
+            size = 0
+            try:
+                if batch[0] is _START_COMPRESSION:
+                    self.sock.sendall(COMPRESS_ON)
+                    self.compressor = StreamCompressor()
+                elif self.compressor:
+                    size = sum(len(data) for data in batch)
+                    self.sock.sendall(self.compress(batch))
+                else:
+                    size = len(batch[0])
+                    self.sock.sendall(batch[0] + b"\n")
+            except OSError:
+                self.close()
+                return
+            with self.cond:
+                if not self.open:
+                    return
+                self.backlog -= size
+                self.sent_bytes += size
+                self.interval_bytes += size
+
+    # Compress one batch, and end compression for good if it has gone over its CPU budget
+    def compress(self, batch):
+        start = time.perf_counter()
+        out = self.compressor.compress(batch)
+        spent = time.perf_counter() - start
+        self.compress_time += spent
+        self.compress_batches += 1
+        self.budget_time += spent
+        now = time.monotonic()
+        if now - self.budget_start >= BUDGET_WINDOW:
+            if self.budget_time > CPU_BUDGET * (now - self.budget_start):
+                print(f"Link to {self.label()}: compression over its CPU budget, turning it off")
+                out += self.compressor.finish()
+                self.compressor = None
+            self.budget_time = 0.0
+            self.budget_start = now
+        return out
+
+    # Stop the writer; the socket itself is left to its owner
+    def close(self):
+        with self.cond:
+            self.open = False
+            self.queue.clear()
+            self.backlog = 0
+            self.cond.notify()
+
+    def get_stats(self):
+        return {
+            "quality": QUALITY_LEVELS[self.level][0],
+            "throughput": round(self.throughput),
+            "backlog": self.backlog,
+            "skipped": self.skipped,
+            "compression": round(self.compressor.ratio() or 0, 2) if self.compressor else None,
+            "compress_us": round(self.compress_time / self.compress_batches * 1e6) if self.compress_batches else None,
+        }
@@ -0,0 +1,99 @@
+# Remote stroke rasterization on a small worker pool
+# Stroke samples from other players are grouped per square as a read is applied, and a
+# read's squares are rasterized together: their brush centres go into one
+# (squares, SQUARE_SIZE, SQUARE_SIZE) block that is dilated in a few whole-block numpy
+# calls, which release the GIL, so the squares are split across the workers. Finished
+# masks are committed to the board's pixel grids by the game thread at the next frame
+# Reads with only a few samples per square are cheaper stamped on the spot, as before
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from claims import SQUARE_SIZE, brush_coverage
+
+RASTER_WORKERS = max(1, min(4, os.cpu_count() or 1))
+# A read goes to the pool once it carries this many samples per square on average, below
+# that stamping each sample costs less than dilating whole squares, and this many in total,
+# since handing a read to the pool has a fixed cost of its own
+RASTER_MIN_SAMPLES = 32
+RASTER_MIN_TOTAL = 256
+
+# Covered pixels for each square's samples: groups is [(xs, ys), ...], one per square
+def rasterize(groups):
+    centers = np.zeros((len(groups), SQUARE_SIZE, SQUARE_SIZE), dtype=bool)
+    index = np.repeat(np.arange(len(groups)), [len(xs) for xs, _ in groups])
+    xs = np.concatenate([xs for xs, _ in groups])
+    ys = np.concatenate([ys for _, ys in groups])
+    inside = (xs >= 0) & (xs < SQUARE_SIZE) & (ys >= 0) & (ys < SQUARE_SIZE)
+    centers[index[inside], ys[inside], xs[inside]] = True
+    return brush_coverage(centers)
+
+# Pending rasterizations for one board; used only from the game thread
+class StrokeRasterizer:
+    def __init__(self, board, workers=RASTER_WORKERS):
+        self.board = board
+        self.workers = workers
+        self.min_samples = RASTER_MIN_SAMPLES
+        # (future, cells, colour codes, generations) per job, oldest first
+        self.pending = []
+        # Bumped whenever a square's stroke is thrown away, so masks computed for the old
+        # stroke are dropped instead of committed over the new one
+        self.generation = np.zeros((board.rows, board.cols), dtype=np.int64)
+        self.generation_cells = memoryview(self.generation)
+
+    # Whether a read with `samples` samples over `squares` squares should go to the pool
+    def wants(self, squares, samples):
+        return samples >= max(self.min_samples * squares, RASTER_MIN_TOTAL)
+
+    # Rasterize strokes for several squares in the background
+    # strokes is {(row, col): (colour code, xs, ys)}
+    def submit(self, strokes):
+        cells = list(strokes)
+        jobs = min(self.workers, len(cells))
+        pool = get_pool()
+        for n in range(jobs):
+            chunk = cells[n::jobs]
+            groups = [strokes[cell][1:] for cell in chunk]
+            codes = [strokes[cell][0] for cell in chunk]
+            generations = [self.generation_cells[cell] for cell in chunk]
+            self.pending.append((pool.submit(rasterize, groups), chunk, codes, generations))
+
+    # Forget strokes still being rasterized for a square that was reset or claimed
+    def discard(self, row, col):
+        self.generation_cells[row, col] += 1
+
+    def discard_all(self):
+        self.generation += 1
+
+    # Commit every finished job to the board; unfinished ones wait for the next frame
+    # unless `wait` is set
+    def commit(self, wait=False):
+        if not self.pending:
+            return
+        board = self.board
+        waiting = []
+        for job in self.pending:
+            future, cells, codes, generations = job
+            if not wait and not future.done():
+                waiting.append(job)
+                continue
+            masks = future.result()
+            for mask, cell, code, generation in zip(masks, cells, codes, generations):
+                # The square may have been claimed, reset or locked by someone else since
+                if (self.generation_cells[cell] == generation and board.claimed_cells[cell] == 0
+                        and board.stroke_cells[cell] == code and board.drawing_cells[cell]):
+                    board.pixels[cell] |= mask
+        self.pending = waiting
+
+# One pool for the process, started on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=RASTER_WORKERS, thread_name_prefix="raster")
+    return _pool
@@ -0,0 +1,114 @@
+# Per-client flood protection for the host
+# Every message a client sends is charged to a token bucket for its message class; cheap,
+# superseded traffic (cursors, stroke samples) is dropped when over budget, and clients that
+# keep flooding are disconnected
+
+import threading
+import time
+
+ADMIT = "admit"
+DROP = "drop"
+DISCONNECT = "disconnect"
+
+# (messages per second, burst) per message class
+DEFAULT_LIMITS = {
+    "chat": (10, 20),
+    "cursor": (120, 60),
+    "stroke": (1000, 500),
+    "control": (50, 50),
+    "other": (50, 50),
+}
+# Over-limit events within FLOOD_WINDOW seconds before a client is disconnected
+FLOOD_STRIKES = 1000
+FLOOD_WINDOW = 5.0
+# Longest line a client may send; stroke batches and chat lines stay well under it, so a
+# client that goes past it without a newline is disconnected
+MAX_MESSAGE = 8192
+
+# Classic token bucket: refills at `rate` tokens per second up to `burst`
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    # Take `n` tokens if available; returns False without taking any otherwise
+    def take(self, n=1, now=None):
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < n:
+            return False
+        self.tokens -= n
+        return True
+
+# Map a raw protocol message to its rate-limit class
+def classify(message):
+    if message.startswith("GAME:CURSOR:"):
+        return "cursor"
+    if message.startswith("GAME:DRAW"):
+        return "stroke"
+    if message.startswith("MSG:"):
+        return "chat"
+    if message.startswith("GAME:") or message.startswith("JOIN:"):
+        return "control"
+    return "other"
+
+# Token buckets and strike counts for every connected client
+class FloodGuard:
+    def __init__(self, limits=None, strikes=FLOOD_STRIKES, window=FLOOD_WINDOW):
+        self.limits = dict(DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.strikes = strikes
+        self.window = window
+        self.buckets = {}
+        self.violations = {}
+        self.over_limit = {name: 0 for name in self.limits}
+        self.disconnects = 0
+        self.oversized = 0
+        self.lock = threading.Lock()
+
+    # Decide what to do with one message from `client`: ADMIT, DROP or DISCONNECT
+    def admit(self, client, message):
+        cls = classify(message)
+        now = time.monotonic()
+        with self.lock:
+            buckets = self.buckets.get(client)
+            if buckets is None:
+                buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in self.limits.items()}
+                self.buckets[client] = buckets
+            if buckets[cls].take(now=now):
+                return ADMIT
+
+            self.over_limit[cls] += 1
+            window_start, count = self.violations.get(client, (now, 0))
+            if now - window_start > self.window:
+                window_start, count = now, 0
+            count += 1
+            self.violations[client] = (window_start, count)
+            if count > self.strikes:
+                self.disconnects += 1
+                return DISCONNECT
+            return DROP
+
+    # Count a client disconnected for a line longer than MAX_MESSAGE
+    def note_oversized(self):
+        with self.lock:
+            self.oversized += 1
+            self.disconnects += 1
+
+    # Forget a disconnected client
+    def forget(self, client):
+        with self.lock:
+            self.buckets.pop(client, None)
+            self.violations.pop(client, None)
+
+    # Snapshot of over-limit counters per message class
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.over_limit)
+            stats["disconnects"] = self.disconnects
+            stats["oversized"] = self.oversized
+        return stats
@@ -0,0 +1,104 @@
+# Spectator relay: subscribes to a host's spectator feed once and fans it out to any number
+# of spectators, so the host only ever serves one connection per relay
+# Usage: python client/relay.py --host <host ip> --port 25565 --listen 25566
+
+import argparse
+import socket
+import threading
+from spectator import SpectatorHub, LineReader
+
+HANDSHAKE_TIMEOUT = 5.0
+# Spectators one relay serves; chain another relay off this one for more
+MAX_RELAY_SPECTATORS = 256
+
+# Forwards one upstream spectator feed to many downstream spectators
+class SpectatorRelay:
+    def __init__(self, upstream_ip, upstream_port, listen_port, name="relay", capacity=MAX_RELAY_SPECTATORS):
+        self.upstream_addr = (upstream_ip, upstream_port)
+        self.listen_port = listen_port
+        self.name = name
+        self.hub = SpectatorHub(capacity)
+        self.running = True
+        self.upstream = None
+        self.server_socket = None
+
+    # Connect upstream and start accepting spectators
+    def start(self):
+        self.upstream = socket.create_connection(self.upstream_addr)
+        self.upstream.send(f"SPECTATE:{self.name}\n".encode())
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(('0.0.0.0', self.listen_port))
+        self.server_socket.listen(16)
+        threading.Thread(target=self.read_upstream, daemon=True).start()
+        threading.Thread(target=self.accept_spectators, daemon=True).start()
+
+    # Publish every upstream frame to all downstream spectators
+    def read_upstream(self):
+        reader = LineReader(self.upstream)
+        while self.running:
+            try:
+                lines = reader.read_lines()
+            except OSError as e:
+                print(f"Upstream error: {e}")
+                break
+            if not lines:
+                print("Upstream feed closed")
+                break
+            for line in lines:
+                if line.startswith("ERROR:"):
+                    print(f"Upstream refused relay: {line[6:]}")
+            self.hub.publish(lines)
+        self.stop()
+
+    def accept_spectators(self):
+        while self.running:
+            try:
+                sock, addr = self.server_socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.handshake, args=(sock,), daemon=True).start()
+
+    # Wait for the spectator's SPECTATE line, then subscribe it to the hub
+    def handshake(self, sock):
+        try:
+            sock.settimeout(HANDSHAKE_TIMEOUT)
+            lines = LineReader(sock).read_lines()
+            if lines and lines[0].startswith("SPECTATE:"):
+                if self.hub.subscribe(sock):
+                    return
+                sock.sendall(b"ERROR:Relay full, connect through another relay\n")
+        except OSError:
+            pass
+        sock.close()
+
+    def stop(self):
+        self.running = False
+        self.hub.close()
+        for sock in (self.upstream, self.server_socket):
+            try:
+                if sock:
+                    sock.close()
+            except OSError:
+                pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan a host's spectator feed out to many spectators")
+    parser.add_argument("--host", required=True, help="IP of the game host or of another relay")
+    parser.add_argument("--port", type=int, default=25565, help="port of the game host")
+    parser.add_argument("--listen", type=int, default=25566, help="port spectators connect to")
+    parser.add_argument("--max-spectators", type=int, default=MAX_RELAY_SPECTATORS,
+                        help="spectators this relay serves before turning new ones away")
+    args = parser.parse_args()
+
+    relay = SpectatorRelay(args.host, args.port, args.listen, capacity=args.max_spectators)
+    relay.start()
+    print(f"Relaying {args.host}:{args.port} to spectators on port {args.listen}")
+    try:
+        while relay.running:
+            threading.Event().wait(1)
+    except KeyboardInterrupt:
+        relay.stop()
+
+if __name__ == "__main__":
+    main()
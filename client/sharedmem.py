@@ -0,0 +1,300 @@
+# Shared-memory transport for clients on the host's own machine
+# Bots, test harnesses and spectators running beside the host skip the loopback TCP stream
+# for game traffic. The host keeps one shared segment holding the board's claim and lock
+# matrices, which local clients read in place, an outbound ring every local client reads
+# the host's game traffic from, and one small inbound ring per local player for the
+# commands it sends. The TCP connection stays up for the join, chat and player lists, and
+# to notice the host going away
+# Every ring has a single writer and is read by polling memory: a slot carries its sequence
+# number, written after the payload, so a reader that finds the number it expects has the
+# message and one that finds a larger number was lapped. Nothing is locked across
+# processes and a reader makes no system calls while there are messages to read; when
+# there are none it yields, then sleeps for short spells
+
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+try:
+    from multiprocessing import resource_tracker
+except ImportError:
+    resource_tracker = None
+import numpy as np
+from board import GRID_SIZE, color_name
+
+SEGMENT_PREFIX = "deny"
+MAGIC = b"DNSHM001"
+HEADER_SIZE = 4096
+PLAYERS_SIZE = 2048
+# The outbound ring holds a few seconds of a busy match; a client that falls further
+# behind than that catches up from the shared board instead
+RING_SLOTS = 4096
+INBOX_SLOTS = 512
+# Slots are fixed size; longer messages carry on in the slots that follow
+SLOT_SIZE = 256
+SLOT_HEADER = 16
+SLOT_PAYLOAD = SLOT_SIZE - SLOT_HEADER
+# Local players one host takes at once, each with its own inbound ring
+LOCAL_PLAYERS = 8
+# Idle polls that only yield before a reader starts sleeping between polls
+SPIN_POLLS = 200
+POLL_SLEEP = 0.0005
+
+# Slot flags: the message goes on in the next slot, and this slot isn't its first
+MORE = 1
+CONTINUED = 2
+
+# Header fields at fixed offsets: magic, published sequence of the outbound ring, grid
+# size, whether the host has closed the segment, the player list, and how far the host has
+# read each inbound ring
+_PUBLISHED = 8
+_DIMS = 16
+_CLOSED = 24
+_PLAYERS_LEN = 28
+_PLAYERS = 32
+_CONSUMED = 32 + PLAYERS_SIZE
+
+def segment_layout(rows=GRID_SIZE, cols=GRID_SIZE):
+    board_at = HEADER_SIZE
+    ring_at = board_at + -(-2 * rows * cols // 64) * 64
+    inbox_at = ring_at + RING_SLOTS * SLOT_SIZE
+    return board_at, ring_at, inbox_at, inbox_at + LOCAL_PLAYERS * INBOX_SLOTS * SLOT_SIZE
+
+# Raised by a reader whose next message was overwritten before it got to it
+class RingLapped(Exception):
+    pass
+
+# One single-writer ring of slots at `offset` in a shared buffer; `seq` is the last
+# sequence number written or read
+class Ring:
+    def __init__(self, buf, offset, slots, seq=0):
+        self.buf = buf
+        self.offset = offset
+        self.slots = slots
+        self.seq = seq
+
+    def slot(self, seq):
+        return self.offset + (seq % self.slots) * SLOT_SIZE
+
+    # Writer side: `skip` is a local player index that should not receive the message
+    def write(self, data, skip=-1):
+        buf = self.buf
+        start = 0
+        while True:
+            chunk = data[start:start + SLOT_PAYLOAD]
+            flags = CONTINUED if start else 0
+            start += SLOT_PAYLOAD
+            if start < len(data):
+                flags |= MORE
+            self.seq += 1
+            at = self.slot(self.seq)
+            struct.pack_into("<q", buf, at, 0)
+            buf[at + SLOT_HEADER:at + SLOT_HEADER + len(chunk)] = chunk
+            struct.pack_into("<iHh", buf, at + 8, len(chunk), flags, skip)
+            struct.pack_into("<q", buf, at, self.seq)
+            if not flags & MORE:
+                return self.seq
+
+    # Reader side: the next whole message as (bytes, skip), or None if there isn't one yet
+    def read(self):
+        buf = self.buf
+        seq = self.seq
+        parts = []
+        while True:
+            seq += 1
+            at = self.slot(seq)
+            (found,) = struct.unpack_from("<q", buf, at)
+            if found != seq:
+                if found > seq:
+                    raise RingLapped()
+                return None
+            length, flags, skip = struct.unpack_from("<iHh", buf, at + 8)
+            part = bytes(buf[at + SLOT_HEADER:at + SLOT_HEADER + length])
+            if struct.unpack_from("<q", buf, at)[0] != seq:
+                raise RingLapped()
+            # The tail of a message whose start was lost when the reader caught up
+            if flags & CONTINUED and not parts:
+                self.seq = seq
+                continue
+            parts.append(part)
+            if not flags & MORE:
+                self.seq = seq
+                return (parts[0] if len(parts) == 1 else b"".join(parts)), skip
+
+# Sleep between polls of a ring that had nothing new; `idle` counts such polls in a row
+def poll_pause(idle):
+    time.sleep(0 if idle < SPIN_POLLS else POLL_SLEEP)
+
+# Views onto a segment's header and board, common to the host and its local clients
+class Segment:
+    def __init__(self, shm, rows=GRID_SIZE, cols=GRID_SIZE):
+        self.shm = shm
+        self.name = shm.name
+        self.buf = shm.buf
+        board_at, self.ring_at, self.inbox_at, _ = segment_layout(rows, cols)
+        cells = rows * cols
+        self.claimed = np.ndarray((rows, cols), dtype=np.uint8, buffer=shm.buf, offset=board_at)
+        self.locked = np.ndarray((rows, cols), dtype=np.uint8, buffer=shm.buf, offset=board_at + cells)
+        self.consumed = np.ndarray((LOCAL_PLAYERS,), dtype=np.int64, buffer=shm.buf, offset=_CONSUMED)
+
+    def inbox_ring(self, index, seq=0):
+        return Ring(self.buf, self.inbox_at + index * INBOX_SLOTS * SLOT_SIZE, INBOX_SLOTS, seq)
+
+    def published(self):
+        return struct.unpack_from("<q", self.buf, _PUBLISHED)[0]
+
+    def closed(self):
+        return bool(self.buf[_CLOSED])
+
+    def read_players(self):
+        (n,) = struct.unpack_from("<i", self.buf, _PLAYERS_LEN)
+        text = bytes(self.buf[_PLAYERS:_PLAYERS + n]).decode(errors="replace")
+        return [p for p in text.split(",") if p]
+
+    # Commands that bring a client up to date with the board; one that missed messages also
+    # needs every unlocked square unlocked
+    def snapshot(self, unlocked=True):
+        lines = []
+        claimed, locked = self.claimed.copy(), self.locked.copy()
+        for row, col in np.ndindex(claimed.shape):
+            if claimed[row, col]:
+                lines.append(f"GAME:CLAIM:{row},{col}:{color_name(claimed[row, col])}")
+            elif locked[row, col]:
+                lines.append(f"GAME:LOCK:{row},{col}:{color_name(locked[row, col])}")
+            elif unlocked:
+                lines.append(f"GAME:UNLOCK:{row},{col}")
+        return lines
+
+# Host side: creates the segment and writes the outbound ring
+class SharedHost(Segment):
+    def __init__(self, port, rows=GRID_SIZE, cols=GRID_SIZE):
+        size = segment_layout(rows, cols)[3]
+        shm = shared_memory.SharedMemory(name=f"{SEGMENT_PREFIX}-{port}-{os.getpid()}", create=True, size=size)
+        super().__init__(shm, rows, cols)
+        self.buf[:8] = MAGIC
+        struct.pack_into("<ii", self.buf, _DIMS, rows, cols)
+        self.outbox = Ring(self.buf, self.ring_at, RING_SLOTS)
+        self.inboxes = {}
+        self.free = list(range(LOCAL_PLAYERS))
+
+    # Append a message for every local client; callers serialise this, it has one writer
+    def publish(self, message, skip=-1):
+        struct.pack_into("<q", self.buf, _PUBLISHED, self.outbox.write(message.encode(), skip))
+
+    def sync_board(self, board):
+        self.claimed[:] = board.claimed
+        self.locked[:] = board.locked
+
+    def set_players(self, players):
+        data = ",".join(players).encode()[:PLAYERS_SIZE]
+        self.buf[_PLAYERS:_PLAYERS + len(data)] = data
+        struct.pack_into("<i", self.buf, _PLAYERS_LEN, len(data))
+
+    # Give a new local player an empty inbound ring; returns its index, None if all are taken
+    def attach_player(self):
+        if not self.free:
+            return None
+        index = self.free.pop(0)
+        inbox = self.inbox_ring(index)
+        self.buf[inbox.offset:inbox.offset + INBOX_SLOTS * SLOT_SIZE] = bytes(INBOX_SLOTS * SLOT_SIZE)
+        self.consumed[index] = 0
+        self.inboxes[index] = inbox
+        return index
+
+    def detach_player(self, index):
+        if self.inboxes.pop(index, None) is not None:
+            self.free.append(index)
+
+    # Every command waiting in one player's inbound ring
+    def receive(self, index):
+        inbox = self.inboxes.get(index)
+        messages = []
+        while inbox is not None:
+            entry = inbox.read()
+            if entry is None:
+                break
+            messages.append(entry[0].decode(errors="replace"))
+        if messages:
+            self.consumed[index] = inbox.seq
+        return messages
+
+    # Mark the segment closed and remove its name; clients already attached keep their
+    # mapping until they let go
+    def unlink(self):
+        if self.buf is not None:
+            self.buf[_CLOSED] = 1
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        self.claimed = self.locked = self.consumed = None
+        self.buf = self.outbox = None
+        self.inboxes = {}
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+# Client side: reads the host's outbound ring from sequence `start` and, for a player,
+# writes commands into inbound ring `index`
+class SharedClient(Segment):
+    def __init__(self, name, index, start):
+        shm = shared_memory.SharedMemory(name=name)
+        # Before Python 3.13 opening a segment registers it for removal when this process
+        # exits, which would pull it out from under the host; a host in this same process
+        # shares the registration and removes it itself
+        if resource_tracker and not name.endswith(f"-{os.getpid()}"):
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        if bytes(shm.buf[:8]) != MAGIC:
+            shm.close()
+            raise ValueError(f"{name} is not a game segment")
+        rows, cols = struct.unpack_from("<ii", shm.buf, _DIMS)
+        super().__init__(shm, rows, cols)
+        self.index = index
+        self.outbox = Ring(self.buf, self.ring_at, RING_SLOTS, start)
+        self.inbox = self.inbox_ring(index) if index >= 0 else None
+        self.send_lock = threading.Lock()
+        self.lapped = 0
+
+    # Queue a command for the host; False when the inbound ring is full, so the caller
+    # sends it some other way
+    def send(self, message):
+        data = message.encode()
+        slots = max(1, -(-len(data) // SLOT_PAYLOAD))
+        with self.send_lock:
+            if self.inbox.seq + slots - self.consumed[self.index] > INBOX_SLOTS:
+                return False
+            self.inbox.write(data)
+        return True
+
+    # Messages published since the last call, up to `limit`; a reader that was lapped
+    # skips to the newest message and gets the board as it stands instead
+    def receive(self, limit=256):
+        messages = []
+        try:
+            while len(messages) < limit:
+                entry = self.outbox.read()
+                if entry is None:
+                    break
+                data, skip = entry
+                if skip < 0 or skip != self.index:
+                    messages.append(data.decode(errors="replace"))
+        except RingLapped:
+            self.lapped += 1
+            self.outbox.seq = self.published()
+            messages.extend(self.snapshot())
+        return messages
+
+    def close(self):
+        self.claimed = self.locked = self.consumed = None
+        self.buf = self.outbox = self.inbox = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
@@ -0,0 +1,199 @@
+# Headless match engine: plays the game's square rules with no display, no sockets and no
+# frame pacing, so rule changes and bots can be tried over thousands of matches
+# One tick stands for one simulation step of the real game. Players lock, stroke and
+# release squares through the same Square and ClaimVerifier code the game uses: the
+# player's own coverage decides whether a CLAIM is sent and the host's verifier decides
+# whether it is accepted, with no packet loss or latency in between
+
+import os
+import random
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import claims
+import gameboard
+from board import BoardModel, GRID_SIZE, SQUARE_SIZE, NO_COLOR
+from claims import ClaimVerifier, CLAIM_THRESHOLD, MAX_STROKE_BATCH
+from gameboard import Square, PLAYER_COLORS, SIM_RATE
+
+# A match that hasn't filled the board after this many simulated minutes ends unfinished
+MAX_MINUTES = 10
+# Mouse motion samples per step for a player dragging at a normal pace
+SAMPLES_PER_STEP = 6
+
+# Change the brush footprint for every square in this process, for tuning runs only
+def set_brush(brush_min, brush_max):
+    claims.BRUSH_MIN = gameboard.BRUSH_MIN = brush_min
+    claims.BRUSH_MAX = gameboard.BRUSH_MAX = brush_max
+
+# Seeded random player: picks a free square, scribbles rows across it and lets go once its
+# own coverage reaches a target near the threshold, which it sometimes undershoots
+class RandomPlayer:
+    def __init__(self, color, seed=None, speed=SAMPLES_PER_STEP, care=1.1, pause=(6, 30)):
+        self.color = color
+        self.rng = random.Random(seed)
+        # Hand jitter is drawn in bulk from its own generator, seeded from the player's
+        self.jitter = np.random.default_rng(self.rng.getrandbits(32))
+        self.speed = speed
+        self.care = care
+        self.pause = pause
+        self.cell = None
+        self.xs = self.ys = None
+        self.target = 0
+        self.wait = 0
+
+    # Zig-zag path over the whole square with this player's row spacing, pace and jitter
+    def plan(self):
+        rng = self.rng
+        spacing = rng.randint(6, 10)
+        step = rng.randint(2, 4)
+        across = np.arange(0, SQUARE_SIZE, step)
+        rows = np.arange(rng.randint(0, 4), SQUARE_SIZE, spacing)
+        flip = rng.randint(0, 1)
+        xs = np.concatenate([across[::-1] if (i + flip) % 2 else across for i in range(len(rows))])
+        ys = np.repeat(rows, len(across))
+        xs = np.clip(xs + self.jitter.integers(-2, 3, len(xs)), 0, SQUARE_SIZE - 1)
+        ys = np.clip(ys + self.jitter.integers(-2, 3, len(ys)), 0, SQUARE_SIZE - 1)
+        return xs, ys
+
+    def step(self, match):
+        if self.wait:
+            self.wait -= 1
+            return
+        if self.cell is None:
+            free = match.free_squares()
+            if free:
+                row, col = self.rng.choice(free)
+                if match.lock(self.color, row, col):
+                    self.cell = (row, col)
+                    self.target = match.threshold * self.rng.uniform(self.care - 0.25, self.care + 0.15)
+                    self.xs, self.ys = self.plan()
+            return
+        n = self.speed
+        match.draw(self.color, *self.cell, self.xs[:n], self.ys[:n])
+        self.xs, self.ys = self.xs[n:], self.ys[n:]
+        if not len(self.xs) or match.coverage(*self.cell) >= self.target:
+            match.release(self.color, *self.cell)
+            self.cell = None
+            self.wait = self.rng.randint(*self.pause)
+
+# Player that replays fixed strokes: a list of (row, col, points) tried in order
+class ScriptedPlayer:
+    def __init__(self, color, strokes, speed=SAMPLES_PER_STEP):
+        self.color = color
+        self.strokes = list(strokes)
+        self.speed = speed
+        self.cell = None
+        self.path = []
+
+    def step(self, match):
+        if self.cell is None:
+            if self.strokes:
+                row, col, points = self.strokes.pop(0)
+                if match.lock(self.color, row, col):
+                    self.cell = (row, col)
+                    self.path = list(points)
+            return
+        batch, self.path = self.path[:self.speed], self.path[self.speed:]
+        if batch:
+            match.draw(self.color, *self.cell,
+                       np.array([x for x, _ in batch], dtype=np.intp), np.array([y for _, y in batch], dtype=np.intp))
+        if not self.path:
+            match.release(self.color, *self.cell)
+            self.cell = None
+
+# One match between `players`, anything with a `color` and a `step(match)` method
+class Match:
+    def __init__(self, players, threshold=CLAIM_THRESHOLD, seed=None):
+        self.players = list(players)
+        self.threshold = threshold
+        self.rng = random.Random(seed)
+        self.board = BoardModel()
+        self.squares = [[Square(r, c, self.board) for c in range(GRID_SIZE)] for r in range(GRID_SIZE)]
+        self.verifier = ClaimVerifier(threshold=threshold)
+        self.tick = 0
+        self.stats = {"strokes": 0, "claims": 0, "rejected": 0, "short": 0}
+
+    # (row, col) of every square that is neither claimed nor locked
+    def free_squares(self):
+        board = self.board
+        return np.argwhere((board.claimed == NO_COLOR) & (board.locked == NO_COLOR)).tolist()
+
+    def coverage(self, row, col):
+        return self.squares[row][col].coverage()
+
+    # LOCK: the square must be unclaimed and unlocked, as on the board and on the host
+    def lock(self, color, row, col):
+        square = self.squares[row][col]
+        if square.claimed_by is not None or square.locked_by is not None:
+            return False
+        square.start_drawing(color)
+        square.lock_tick = self.tick
+        self.verifier.lock(row, col, color)
+        self.stats["strokes"] += 1
+        return True
+
+    # DRAW: stamp samples at local (xs, ys) on the square and record them on the host, in
+    # command-sized batches
+    def draw(self, color, row, col, xs, ys):
+        square = self.squares[row][col]
+        if square.locked_by != color or not square.drawing:
+            return
+        for i in range(0, len(xs), MAX_STROKE_BATCH):
+            bx, by = xs[i:i + MAX_STROKE_BATCH], ys[i:i + MAX_STROKE_BATCH]
+            square.stamp_points(bx, by)
+            self.verifier.record_points(row, col, bx, by, color)
+        square.lock_tick = self.tick
+
+    # Mouse up: CLAIM if the player's coverage is enough and the host agrees, else RESET
+    def release(self, color, row, col):
+        square = self.squares[row][col]
+        if square.locked_by != color:
+            return False
+        claimed = False
+        if square.drawing and square.coverage() >= self.threshold:
+            claimed = self.verifier.verify(row, col, color)
+            self.stats["claims" if claimed else "rejected"] += 1
+        else:
+            self.stats["short"] += 1
+        self.verifier.reset(row, col)
+        square.reset_drawing()
+        if claimed:
+            square.claimed_by = color
+        return claimed
+
+    # Play until the board is full or `max_ticks` steps have passed; players move in a
+    # shuffled order every step so no seat always gets first pick
+    def run(self, max_ticks=MAX_MINUTES * 60 * SIM_RATE):
+        order = list(self.players)
+        while self.tick < max_ticks and not self.board.is_full():
+            self.rng.shuffle(order)
+            for player in order:
+                player.step(self)
+            self.tick += 1
+        return self.result()
+
+    # Squares per colour and the winner, picked the way GameBoard does: the first player in
+    # seat order with the most squares
+    def result(self):
+        counts = self.board.claim_counts()
+        squares = {player.color: counts.get(player.color, 0) for player in self.players}
+        full = self.board.is_full()
+        winner = max(squares, key=squares.get) if full else None
+        return dict(self.stats, winner=winner, squares=squares, finished=full,
+                    ticks=self.tick, minutes=self.tick / SIM_RATE / 60)
+
+# Play one seeded match between `players` random players; picklable entry point for pools
+# Returns the match result with the wall-clock and CPU time it took
+def play_match(seed, players=4, threshold=CLAIM_THRESHOLD):
+    rng = random.Random(seed)
+    bots = [RandomPlayer(PLAYER_COLORS[i], seed=rng.getrandbits(32), speed=rng.randint(4, 8), care=rng.uniform(1.0, 1.2))
+            for i in range(players)]
+    start, cpu = time.perf_counter(), time.process_time()
+    result = Match(bots, threshold=threshold, seed=rng.getrandbits(32)).run()
+    result["seed"] = seed
+    result["wall"] = time.perf_counter() - start
+    result["cpu"] = time.process_time() - cpu
+    return result
@@ -0,0 +1,247 @@
+# Read-only spectator feed for watching a match without taking a player slot
+# The host publishes a low-rate, newline-framed feed: claims, locks and player lists at full
+# fidelity, cursors and stroke previews decimated. A relay (relay.py) can subscribe once and
+# fan the same feed out to any number of spectators, so host cost doesn't grow with viewers
+
+import socket
+import threading
+import time
+from collections import deque
+from quality import SEND_BUFFER
+
+SPECTATOR_TICK = 0.1
+STROKE_DECIMATION = 4
+MAX_DIRECT_SPECTATORS = 4
+# Frames a spectator may fall behind, about two seconds of feed, before it is dropped
+MAX_QUEUED_FRAMES = 20
+
+# Mirror of the state a newly connected spectator needs before it can follow the feed
+class SpectatorState:
+    def __init__(self):
+        self.players = []
+        self.claims = {}
+        self.locks = {}
+
+    # Update the mirror from one feed line
+    def apply(self, line):
+        parts = line.split(":")
+        try:
+            if parts[0] == "PLAYERS":
+                self.players = parts[1].split(",")
+            elif parts[0] == "GAME" and parts[1] == "CLAIM":
+                self.claims[parts[2]] = parts[3]
+                self.locks.pop(parts[2], None)
+            elif parts[0] == "GAME" and parts[1] == "LOCK":
+                if parts[2] not in self.claims:
+                    self.locks[parts[2]] = parts[3]
+            elif parts[0] == "GAME" and parts[1] in ("UNLOCK", "RESET"):
+                self.locks.pop(parts[2], None)
+            elif parts[0] == "GAME" and parts[1] == "START":
+                self.claims.clear()
+                self.locks.clear()
+        except IndexError:
+            pass
+
+    # Lines that bring a new spectator up to date, players first so colours resolve
+    def snapshot(self):
+        lines = []
+        if self.players:
+            lines.append(f"PLAYERS:{','.join(self.players)}")
+        lines.extend(f"GAME:CLAIM:{coord}:{color}" for coord, color in self.claims.items())
+        lines.extend(f"GAME:LOCK:{coord}:{color}" for coord, color in self.locks.items())
+        return lines
+
+# Outbound frame queue and writer thread for one spectator, like ClientStream for players:
+# a slow spectator only backs up its own queue
+class Subscriber:
+    def __init__(self, hub, sock):
+        self.hub = hub
+        self.sock = sock
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        except OSError:
+            pass
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.open = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    # Queue a frame; False if the spectator is already MAX_QUEUED_FRAMES behind
+    def offer(self, frame):
+        with self.cond:
+            if len(self.queue) >= MAX_QUEUED_FRAMES:
+                return False
+            self.queue.append(frame)
+            self.cond.notify()
+        return True
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.open and not self.queue:
+                    self.cond.wait()
+                if not self.open:
+                    return
+                frame = self.queue.popleft()
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                self.hub.drop(self)
+                return
+
+    # Stop the writer and close the socket, which also ends a send stuck on a stalled link
+    def close(self):
+        with self.cond:
+            self.open = False
+            self.queue.clear()
+            self.cond.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+# Set of spectators that all receive the same pre-encoded frames, each through its own queue
+class SpectatorHub:
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.subscribers = []
+        self.state = SpectatorState()
+        self.lock = threading.Lock()
+
+    # Add a spectator and queue the current snapshot for it; returns False if the hub is full
+    def subscribe(self, sock):
+        with self.lock:
+            if self.capacity is not None and len(self.subscribers) >= self.capacity:
+                return False
+            sock.settimeout(None)
+            subscriber = Subscriber(self, sock)
+            lines = self.state.snapshot()
+            if lines:
+                subscriber.offer(("\n".join(lines) + "\n").encode())
+            self.subscribers.append(subscriber)
+        return True
+
+    # Apply feed lines to the mirror and queue them for every spectator as one frame;
+    # spectators too far behind to take it are dropped
+    def publish(self, lines):
+        if not lines:
+            return
+        frame = ("\n".join(lines) + "\n").encode()
+        with self.lock:
+            for line in lines:
+                self.state.apply(line)
+            lagging = [subscriber for subscriber in self.subscribers if not subscriber.offer(frame)]
+        for subscriber in lagging:
+            print("Dropping a spectator: link too slow to keep up with the feed")
+            self.drop(subscriber)
+
+    def drop(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+        subscriber.close()
+
+    def close(self):
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for subscriber in subscribers:
+            subscriber.close()
+
+# Host side: collects outgoing game traffic and publishes a decimated frame every tick
+class SpectatorFeed:
+    def __init__(self, network, capacity=MAX_DIRECT_SPECTATORS):
+        self.network = network
+        self.hub = SpectatorHub(capacity)
+        self.pending = []
+        self.cursors = {}
+        self.stroke_counts = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    # Record one message the host sent to players; cheap enough to call on every broadcast
+    def observe(self, message):
+        if not self.hub.subscribers:
+            return
+        with self.lock:
+            if message.startswith("GAME:CURSOR:"):
+                color = message.split(":", 3)[2]
+                self.cursors[color] = message
+            elif message.startswith("GAME:DRAW:"):
+                coord = message.split(":", 3)[2]
+                count = self.stroke_counts.get(coord, 0)
+                self.stroke_counts[coord] = count + 1
+                if count % STROKE_DECIMATION == 0:
+                    self.pending.append(message)
+            elif message.startswith("GAME:") or message.startswith("PLAYERS:"):
+                self.pending.append(message)
+
+    # Build this tick's frame: authoritative messages in order, then latest cursors
+    def flush(self):
+        with self.lock:
+            lines = self.pending
+            lines.extend(self.cursors.values())
+            self.pending = []
+            self.cursors = {}
+        self.hub.publish(lines)
+
+    def run(self):
+        while self.network.running:
+            time.sleep(SPECTATOR_TICK)
+            self.flush()
+
+    # Hand a connected socket over to the feed, seeding the mirror with the host's state
+    def add_spectator(self, sock):
+        with self.network.lock:
+            players = list(self.network.players)
+            claims = self.network.board.named(self.network.board.claimed)
+            locks = self.network.board.named(self.network.board.locked)
+        with self.hub.lock:
+            self.hub.state.players = players
+            self.hub.state.claims = claims
+            self.hub.state.locks = locks
+        return self.hub.subscribe(sock)
+
+# Split a byte stream into complete newline-terminated lines, keeping any partial tail
+# With a limit, a peer that sends more than that many bytes without a newline is treated as
+# gone, with `overrun` set, rather than growing the buffer without bound. A stream that
+# stops being line-framed after some line, such as the host's switch to compression, names
+# that line as `until`: reading stops after it and the bytes past it stay in the buffer
+class LineReader:
+    def __init__(self, sock, limit=None, until=None):
+        self.sock = sock
+        self.buffer = b""
+        self.limit = limit
+        self.until = until
+        self.overrun = False
+
+    # Block until at least one full line is available; returns [] when the peer closes
+    def read_lines(self, size=4096):
+        while b"\n" not in self.buffer:
+            if self.limit and len(self.buffer) > self.limit:
+                self.overrun = True
+                return []
+            data = self.sock.recv(size)
+            if not data:
+                return []
+            self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        if self.until is not None and self.until in lines:
+            end = lines.index(self.until) + 1
+            self.buffer = b"\n".join(lines[end:] + [self.buffer])
+            del lines[end:]
+        return [line.decode() for line in lines if line]
+
+    # Take the bytes read past the last line returned
+    def take_rest(self):
+        rest, self.buffer = self.buffer, b""
+        return rest
+
+    # Put bytes back in front of the buffer, e.g. plain text that follows a compressed stream
+    def unread(self, data):
+        self.buffer = data + self.buffer
@@ -0,0 +1,218 @@
+# Persistent match statistics: results, per-player ownership and timing, in a local SQLite
+# database
+# Games hand results to record_match, which only queues them; one writer thread commits
+# whatever has queued up in a single transaction, so the game and network threads never
+# wait on the disk. Per-player totals are kept up to date in the same transaction, so the
+# leaderboard is an indexed read rather than a scan over every result
+# Usage: python client/stats.py [--db match_stats/matches.db] [--player NAME]
+
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join("match_stats", "matches.db")
+# Most results committed in one transaction
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    finished_at REAL NOT NULL,
+    recorded_by TEXT,
+    role TEXT,
+    winner TEXT,
+    players INTEGER,
+    duration_s REAL,
+    locks INTEGER,
+    collisions INTEGER,
+    wasted_strokes REAL,
+    claim_ms REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    match_id INTEGER NOT NULL REFERENCES matches(id),
+    player TEXT NOT NULL,
+    color TEXT,
+    squares INTEGER,
+    percent INTEGER,
+    won INTEGER,
+    claims INTEGER,
+    rejected INTEGER,
+    resets INTEGER,
+    claim_ms REAL
+);
+CREATE TABLE IF NOT EXISTS players (
+    player TEXT PRIMARY KEY,
+    matches INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    squares INTEGER NOT NULL,
+    last_played REAL
+);
+CREATE INDEX IF NOT EXISTS matches_finished ON matches(finished_at);
+CREATE INDEX IF NOT EXISTS results_player ON results(player, match_id);
+CREATE INDEX IF NOT EXISTS results_squares ON results(squares);
+CREATE INDEX IF NOT EXISTS players_wins ON players(wins DESC, squares DESC);
+"""
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=10)
+    # Readers don't block the writer and the writer doesn't block readers; a crash can lose
+    # the last transaction but never corrupts the file
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+# Write-behind store for one database file
+class StatsStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with connect(path) as conn:
+            conn.executescript(SCHEMA)
+        conn.close()
+        self.queue = queue.Queue()
+        self.written = 0
+        self.batches = 0
+        self.writer = threading.Thread(target=self.write_behind, daemon=True)
+        self.writer.start()
+
+    # Queue one finished match; returns at once. `result` has the match fields
+    # (finished_at, recorded_by, role, winner, duration_s and optionally locks, collisions,
+    # wasted_strokes, claim_ms) and "players": a list of per-player dicts with player,
+    # color, squares, percent, won and optionally claims, rejected, resets, claim_ms
+    def record_match(self, result):
+        self.queue.put(result)
+
+    # Commit everything queued so far, one transaction per batch
+    def write_behind(self):
+        conn = connect(self.path)
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            results = [r for r in batch if r is not None]
+            if results:
+                try:
+                    with conn:
+                        for result in results:
+                            self.insert(conn, result)
+                    self.written += len(results)
+                    self.batches += 1
+                except sqlite3.Error as e:
+                    print(f"Could not save {len(results)} match results: {e}")
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                break
+        conn.close()
+
+    def insert(self, conn, result):
+        cursor = conn.execute(
+            "INSERT INTO matches (finished_at, recorded_by, role, winner, players, duration_s, "
+            "locks, collisions, wasted_strokes, claim_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (result.get("finished_at", time.time()), result.get("recorded_by"), result.get("role"),
+             result.get("winner"), len(result["players"]), result.get("duration_s"), result.get("locks"),
+             result.get("collisions"), result.get("wasted_strokes"), result.get("claim_ms")))
+        match_id = cursor.lastrowid
+        finished = result.get("finished_at", time.time())
+        rows = result["players"]
+        conn.executemany(
+            "INSERT INTO results (match_id, player, color, squares, percent, won, claims, rejected, "
+            "resets, claim_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(match_id, p["player"], p.get("color"), p.get("squares", 0), p.get("percent"), int(bool(p.get("won"))),
+              p.get("claims"), p.get("rejected"), p.get("resets"), p.get("claim_ms")) for p in rows])
+        conn.executemany(
+            "INSERT INTO players (player, matches, wins, squares, last_played) VALUES (?, 1, ?, ?, ?) "
+            "ON CONFLICT(player) DO UPDATE SET matches = matches + 1, wins = wins + excluded.wins, "
+            "squares = squares + excluded.squares, last_played = excluded.last_played",
+            [(p["player"], int(bool(p.get("won"))), p.get("squares", 0), finished) for p in rows])
+
+    # Block until everything queued before this call is committed
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+
+    # Top players by wins, then by squares captured; like every read, this uses its own
+    # short-lived connection and sees committed results only
+    def leaderboard(self, limit=10):
+        return self.query(
+            "SELECT player, matches, wins, squares, ROUND(1.0 * wins / matches, 3) FROM players "
+            "ORDER BY wins DESC, squares DESC LIMIT ?", (limit,))
+
+    # Most squares captured in a single match
+    def best_matches(self, limit=10):
+        return self.query(
+            "SELECT player, squares, match_id FROM results ORDER BY squares DESC LIMIT ?", (limit,))
+
+    # A player's latest matches, newest first
+    def player_history(self, player, limit=20):
+        return self.query(
+            "SELECT m.id, m.finished_at, m.winner, r.squares, r.won, m.duration_s FROM results r "
+            "JOIN matches m ON m.id = r.match_id WHERE r.player = ? ORDER BY r.match_id DESC LIMIT ?",
+            (player, limit))
+
+    def recent_matches(self, limit=20):
+        return self.query(
+            "SELECT id, finished_at, winner, players, duration_s FROM matches "
+            "ORDER BY finished_at DESC LIMIT ?", (limit,))
+
+    def query(self, sql, params=()):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+# One store per process for the game itself, opened on first use
+_store = None
+_store_lock = threading.Lock()
+
+def get_store(path=DEFAULT_PATH):
+    global _store
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = StatsStore(path)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Match statistics unavailable: {e}")
+                return None
+        return _store
+
+# Write out anything still queued before the program exits
+def close_store():
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    parser.add_argument("--player", help="show this player's latest matches")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    store = StatsStore(args.db)
+    if args.player:
+        for match_id, finished, winner, squares, won, duration in store.player_history(args.player, args.limit):
+            print(f"#{match_id} {time.strftime('%Y-%m-%d %H:%M', time.localtime(finished))}  "
+                  f"{squares:2d} squares  {'won' if won else f'winner {winner}'}  {duration or 0:.0f} s")
+    else:
+        for rank, (player, matches, wins, squares, rate) in enumerate(store.leaderboard(args.limit), 1):
+            print(f"{rank:2d}. {player:<16} {wins:4d} wins in {matches:4d} matches ({rate:.0%}), {squares} squares")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# Claim tracing: follows one stroke from the mouse press through the host to every peer
+# A sampled stroke gets a trace id that rides on each of its game commands as a "~<id>"
+# suffix on the last field; every hop that handles a traced command records a timestamped
+# span. Untraced commands carry nothing and record nothing, so a low sample rate costs next
+# to nothing. Each process writes its spans with its clock offset to the host, estimated
+# from the migration pings, and the files merge into one timeline per stroke
+# Usage: python client/tracing.py match_stats/traces/*.jsonl [--trace ID] [--limit 20]
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+TRACE_MARK = "~"
+# Fraction of strokes traced; DENY_TRACE_RATE=1 traces every stroke while debugging
+SAMPLE_RATE = float(os.environ.get("DENY_TRACE_RATE", "0.05"))
+# Spans kept per process; the oldest are dropped first
+MAX_SPANS = 50000
+TRACE_DIR = os.path.join("match_stats", "traces")
+# Weight of the newest sample in the clock offset estimate
+OFFSET_SMOOTHING = 0.2
+
+# Append a trace id to a game command, or return it unchanged when untraced
+def traced(command, trace):
+    return f"{command}{TRACE_MARK}{trace}" if trace else command
+
+# Split "GAME:...~<id>" into the plain message and its trace id, None when untraced
+def split_trace(message):
+    if message.startswith("GAME:"):
+        head, mark, trace = message.rpartition(TRACE_MARK)
+        if mark and trace.isalnum():
+            return head, trace
+    return message, None
+
+def strip_trace(message):
+    return split_trace(message)[0]
+
+# Spans recorded by one node: a player, a host, or both in one process
+class Tracer:
+    def __init__(self, node, rate=None):
+        self.node = node
+        self.rate = SAMPLE_RATE if rate is None else rate
+        self.spans = deque(maxlen=MAX_SPANS)
+        self.rng = random.Random()
+        # Seconds to add to this node's clock to get the host's; 0 on the host itself
+        self.host_offset = 0.0
+        self.offset_samples = 0
+        self.lock = threading.Lock()
+
+    # A new trace id for a stroke, or None if this stroke isn't sampled
+    def start(self):
+        if self.rate <= 0 or self.rng.random() >= self.rate:
+            return None
+        return f"{self.rng.getrandbits(40):010x}"
+
+    def span(self, trace, hop, detail=""):
+        if trace:
+            self.spans.append((trace, hop, time.time(), detail))
+
+    # NTP-style estimate from one ping to the host: the host stamped `host_time` about
+    # halfway through the round trip
+    def note_host_clock(self, host_time, rtt):
+        offset = host_time - (time.time() - rtt / 2)
+        with self.lock:
+            if not self.offset_samples:
+                self.host_offset = offset
+            else:
+                self.host_offset += (offset - self.host_offset) * OFFSET_SMOOTHING
+            self.offset_samples += 1
+
+    # Write this node's spans to <directory>/<node>-<time>.jsonl and forget them
+    def dump(self, directory=TRACE_DIR):
+        spans = list(self.spans)
+        self.spans.clear()
+        if not spans:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.node}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+        with open(path, "w") as f:
+            f.write(json.dumps({"node": self.node, "host_offset": self.host_offset}) + "\n")
+            for span in spans:
+                f.write(json.dumps(span) + "\n")
+        return path
+
+# Read span files from any number of nodes and group them by trace on the host's clock
+# Returns {trace: [(host time, node, hop, detail), ...]} in time order
+def merge(paths):
+    traces = {}
+    for path in paths:
+        with open(path) as f:
+            header = json.loads(f.readline())
+            for line in f:
+                trace, hop, t, detail = json.loads(line)
+                traces.setdefault(trace, []).append((t + header["host_offset"], header["node"], hop, detail))
+    for spans in traces.values():
+        spans.sort()
+    return traces
+
+# One stroke's timeline: every hop with its time since the mouse press, with DRAW spans
+# folded into the first and last per node plus a count, so drops show up as missing counts
+def format_timeline(trace, spans):
+    start = spans[0][0]
+    lines = []
+    counts = {}
+    last_draw = {}
+    for t, node, hop, detail in spans:
+        if "draw" in hop:
+            counts[node, hop] = counts.get((node, hop), 0) + 1
+            last_draw[node, hop] = (t, node, hop, detail)
+            if counts[node, hop] > 1:
+                continue
+        lines.append((t, node, hop, detail))
+    for (node, hop), n in counts.items():
+        if n > 1:
+            t, node, hop, detail = last_draw[node, hop]
+            lines.append((t, node, hop, f"last of {n}"))
+    lines.sort()
+    subject = next((detail for _, _, hop, detail in spans if hop == "mouse_down"), "")
+    out = [f"trace {trace}  {subject}"]
+    previous = start
+    for t, node, hop, detail in lines:
+        out.append(f"  {(t - start) * 1000:8.1f} ms  (+{(t - previous) * 1000:6.1f})  {node:<12} {hop:<14} {detail}")
+        previous = t
+    draws = ", ".join(f"{node} {hop} {n}" for (node, hop), n in sorted(counts.items()))
+    if draws:
+        out.append(f"  strokes: {draws}")
+    return "\n".join(out)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", help="span files written by each node")
+    parser.add_argument("--trace", help="show only this trace id")
+    parser.add_argument("--limit", type=int, default=20, help="most recent traces to show")
+    args = parser.parse_args()
+
+    traces = merge(args.files)
+    chosen = [args.trace] if args.trace else sorted(traces, key=lambda t: traces[t][0][0])[-args.limit:]
+    for trace in chosen:
+        if trace in traces:
+            print(format_timeline(trace, traces[trace]))
+        else:
+            print(f"trace {trace}: no spans")
+
+if __name__ == "__main__":
+    main()
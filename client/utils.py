@@ -8,6 +8,33 @@ WHITE = (255, 255, 255)
 LIGHT_GRAY = (200, 200, 200)
 DARK_GRAY = (50, 50, 50)
 BLUE = (0, 120, 215)
+# Posted to wake an idle screen loop, e.g. by network threads when lobby state changes
+REDRAW_EVENT = pygame.USEREVENT + 1
+# Idle screens still wake this often to poll state that changes without an event
+IDLE_TIMEOUT_MS = 1000
+_redraw_pending = False
+
+# Wake the current screen loop so it redraws; safe to call from any thread, and repeated
+# calls before the loop wakes up only post one event
+def request_redraw():
+    global _redraw_pending
+    if _redraw_pending:
+        return
+    _redraw_pending = True
+    try:
+        pygame.event.post(pygame.event.Event(REDRAW_EVENT))
+    except pygame.error:
+        _redraw_pending = False
+
+# Block until an event arrives or the idle timeout passes, then return every pending event
+def wait_for_events(timeout=IDLE_TIMEOUT_MS):
+    global _redraw_pending
+    first = pygame.event.wait(timeout)
+    if first.type == pygame.NOEVENT:
+        return []
+    events = [first] + pygame.event.get()
+    _redraw_pending = False
+    return events
 
 # A clickable button with hover effect and text label
 class Button: